@@ -0,0 +1,193 @@
+"""A local OpenAI-compatible chat completions server for benchmarks.
+
+It recognises the prompts of the research graph and answers with output of
+the right shape, after a configurable time-to-first-token and token rate.
+Errors (429 with Retry-After, 500) can be injected at a given rate.
+
+Run standalone with ``python -m benchmarks.fake_llm --port 8901``.
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SHORT_URL = re.compile(r"https://search\.com/id/\d+-\d+")
+
+
+@dataclass
+class LLMSettings:
+    ttft: float = 0.3
+    """Seconds before the first token."""
+    token_rate: float = 200.0
+    """Generated tokens per second; one token is ~4 characters."""
+    error_rate: float = 0.0
+    """Share of requests answered with an injected error."""
+    rate_limit_share: float = 0.5
+    """Share of injected errors that are 429s rather than 500s."""
+
+
+def _topic_queries(prompt, count):
+    topic = prompt.rsplit("# Context", 1)[-1].strip().splitlines()[0][:40] if "# Context" in prompt else "topic"
+    return [f"{topic} aspect {i}" for i in range(count)]
+
+
+def fake_answer(prompt):
+    """Return a completion of the shape the graph expects for this prompt."""
+    if '"summaries"' in prompt:
+        sections = re.split(r"^## 搜索主题 (\d+):", prompt, flags=re.M)[1:]
+        return "```json\n" + json.dumps({
+            "summaries": [
+                {
+                    "id": int(query_id),
+                    "summary": " ".join(f"Finding {i} about the query [src]({url})." for i, url in enumerate(SHORT_URL.findall(body)[:5])),
+                }
+                for query_id, body in zip(sections[0::2], sections[1::2])
+            ],
+        }, ensure_ascii=False) + "\n```"
+    if '"knowledge_digest"' in prompt or '"is_sufficient"' in prompt:
+        citations = " ".join(f"[s]({url})" for url in SHORT_URL.findall(prompt)[:3])
+        return "```json\n" + json.dumps({
+            "knowledge_digest": f"digest {citations}",
+            "is_sufficient": random.random() < 0.3,
+            "knowledge_gap": "more detail is needed",
+            "follow_up_queries": [f"follow up {random.randint(0, 10**6)}"],
+        }, ensure_ascii=False) + "\n```"
+    if '"rationale"' in prompt:
+        match = re.search(r"# 搜索主题数量上限\n(\d+)", prompt)
+        count = int(match.group(1)) if match else 3
+        return "```json\n" + json.dumps({
+            "rationale": "cover the topic from different angles",
+            "query": _topic_queries(prompt, count),
+        }, ensure_ascii=False) + "\n```"
+    urls = SHORT_URL.findall(prompt)
+    if "```text" in prompt:
+        body = " ".join(f"Finding {i} about the query [src]({url})." for i, url in enumerate(urls[:5]))
+        return f"```text\n{body}\n```"
+    sections = "\n\n".join(
+        f"## Section {i}\n\nEvidence shows progress on this point [src]({url}). " + "Detail. " * 40
+        for i, url in enumerate(urls[:8])
+    )
+    return f"# Report\n\n{sections}"
+
+
+def _tokens(text):
+    return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+
+def make_handler(settings):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send_json(self, status, payload, headers=None):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            try:
+                self._respond()
+            except (BrokenPipeError, ConnectionResetError):
+                # 客户端取消请求(对冲、截止时间)时提前断开连接，不在服务线程中打印错误堆栈
+                self.close_connection = True
+
+        def _respond(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            prompt = body["messages"][-1]["content"]
+
+            if random.random() < settings.error_rate:
+                time.sleep(settings.ttft / 2)
+                if random.random() < settings.rate_limit_share:
+                    self._send_json(429, {"error": {"message": "rate limited", "type": "rate_limit"}}, {"Retry-After": "0.1"})
+                else:
+                    self._send_json(500, {"error": {"message": "injected failure", "type": "server_error"}})
+                return
+
+            text = fake_answer(prompt)
+            tokens = _tokens(text)
+            usage = {
+                "prompt_tokens": len(prompt) // 4,
+                "completion_tokens": len(tokens),
+                "total_tokens": len(prompt) // 4 + len(tokens),
+            }
+            time.sleep(settings.ttft)
+            if not body.get("stream"):
+                time.sleep(len(tokens) / settings.token_rate)
+                self._send_json(200, {
+                    "id": "fake", "object": "chat.completion", "created": int(time.time()), "model": body["model"],
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                    "usage": usage,
+                })
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            def write(payload):
+                data = f"data: {payload}\n\n".encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            for token in tokens:
+                write(json.dumps({
+                    "id": "fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": body["model"],
+                    "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+                }))
+                time.sleep(1 / settings.token_rate)
+            write(json.dumps({
+                "id": "fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": body["model"],
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                "usage": usage,
+            }))
+            write("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+
+    return Handler
+
+
+def serve(settings, port=0, ready=None):
+    """Serve until the process exits; ``ready`` receives the bound port."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(settings))
+    server.daemon_threads = True
+    if ready is not None:
+        ready.put(server.server_port)
+    server.serve_forever()
+
+
+def start_in_thread(settings, port=0):
+    """Start the server in a daemon thread of this process and return it."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(settings))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible LLM server")
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--ttft", type=float, default=LLMSettings.ttft)
+    parser.add_argument("--token-rate", type=float, default=LLMSettings.token_rate)
+    parser.add_argument("--error-rate", type=float, default=LLMSettings.error_rate)
+    args = parser.parse_args()
+    settings = LLMSettings(ttft=args.ttft, token_rate=args.token_rate, error_rate=args.error_rate)
+    print(f"fake LLM listening on http://127.0.0.1:{args.port}/v1")
+    serve(settings, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""An in-process stand-in for the ``dashscope.Application.call`` search path.
+
+``install`` replaces ``Application.call`` with a function that sleeps for a
+log-normally distributed latency and returns pages in the same envelope the
+MCP search app produces, so WebSearchAgent.post_process runs unchanged.
+"""
+
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from dataclasses import dataclass
+from types import SimpleNamespace
+
+
+# 每条结果的正文从词表中随机抽取，保证不同结果之间不会被SimHash判为近似重复
+_VOCABULARY = (
+    "research model data system results analysis method approach performance study network energy "
+    "quantum market policy growth risk design signal memory protocol sensor battery climate storage "
+    "algorithm benchmark latency throughput hardware software security privacy cost scale report "
+    "survey trial patient dataset training inference accuracy error device material process industry"
+).split()
+
+
+@dataclass
+class SearchSettings:
+    median_latency: float = 0.4
+    """Median search latency in seconds."""
+    latency_sigma: float = 0.6
+    """Sigma of the log-normal latency; larger values give a longer tail."""
+    error_rate: float = 0.0
+    """Share of calls answered with an injected error."""
+    pages: int = 10
+    """Pages returned per search."""
+
+
+class FakeSearch:
+    def __init__(self, settings):
+        self.settings = settings
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _pages(self, query, count):
+        seed = hashlib.md5(query.encode("utf-8")).hexdigest()
+        return [
+            {
+                "snippet": f"{query} — snippet {i}. " + " ".join(random.Random(f"{seed}-{i}").choices(_VOCABULARY, k=40)),
+                "title": f"{query[:30]} result {i}",
+                "url": f"https://example.com/{seed[:8]}/{i}",
+            }
+            for i in range(count)
+        ]
+
+    def __call__(self, app_id=None, prompt=None, biz_params=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+        settings = self.settings
+        time.sleep(settings.median_latency * math.exp(random.gauss(0, settings.latency_sigma)))
+        if random.random() < settings.error_rate:
+            return SimpleNamespace(status_code=429, code="Throttling", message="injected throttling", output=None)
+        count = (biz_params or {}).get("count", settings.pages)
+        text = json.dumps({"result": {"content": [{"text": json.dumps({"pages": self._pages(prompt, count)})}]}})
+        return SimpleNamespace(status_code=200, code=None, message=None, output=SimpleNamespace(text=text))
+
+
+def install(settings):
+    """Patch ``dashscope.Application.call`` and return the FakeSearch instance."""
+    from dashscope import Application
+
+    fake = FakeSearch(settings)
+    Application.call = staticmethod(fake)
+    return fake
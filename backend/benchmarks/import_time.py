@@ -0,0 +1,106 @@
+"""Cold-start benchmark: how long a fresh interpreter takes to import a module.
+
+Runs ``python -X importtime -c "import <module>"`` in a new process per
+sample, so nothing is cached in ``sys.modules``, and writes a JSON report
+with the total import time and the modules that contribute most::
+
+    python -m benchmarks.import_time --module agent.graph agent.app --output import_time.json
+"""
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+
+from benchmarks.run import code_version, percentiles
+
+# 这些模块应当按需导入，出现在冷启动的导入链中说明有回退
+LAZY_MODULES = ("openai", "dashscope")
+
+
+def parse_importtime(stderr):
+    """Return ``(module, parent, cumulative_s)`` for every import in ``-X importtime`` output."""
+    lines = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        lines.append((name.strip(), depth, int(cumulative_us) / 1e6))
+    # 子模块先于导入它的模块输出，倒序遍历时栈顶即为父模块
+    imports, stack = [], []
+    for name, depth, cumulative in reversed(lines):
+        del stack[depth:]
+        imports.append((name, stack[-1] if stack else None, cumulative))
+        stack.append(name)
+    return imports
+
+
+def sample(module):
+    """Import module in a fresh interpreter; return its wall time and the parsed import times."""
+    code = (
+        "import sys, time\n"
+        "started = time.perf_counter()\n"
+        f"import {module}\n"
+        "print(time.perf_counter() - started)\n"
+        "print(' '.join(sorted(sys.modules)))\n"
+    )
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, check=True)
+    seconds, loaded = result.stdout.splitlines()[-2:]
+    return float(seconds), parse_importtime(result.stderr), set(loaded.split())
+
+
+def measure(module, runs, top):
+    walls, samples, loaded = [], [], set()
+    for _ in range(runs):
+        wall, times, modules = sample(module)
+        walls.append(wall)
+        samples.append(times)
+        loaded |= modules
+    # 审计的是本项目代码直接引入的第三方依赖，其子模块的耗时已经计入cumulative
+    dependencies = {}
+    for imports in samples:
+        for name, parent, cumulative in imports:
+            if parent is not None and parent.split(".")[0] == "agent" and name.split(".")[0] != "agent":
+                dependencies.setdefault(f"{parent} -> {name}", []).append(cumulative)
+    slowest = sorted(dependencies.items(), key=lambda item: -sum(item[1]) / len(item[1]))[:top]
+    return {
+        "module": module,
+        "runs": runs,
+        "import_s": percentiles(walls),
+        "slowest_dependencies_s": {name: sum(values) / len(values) for name, values in slowest},
+        "eager_provider_sdks": [name for name in LAZY_MODULES if name in loaded],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cold-start import time")
+    parser.add_argument("--module", nargs="+", default=["agent.graph", "agent.app"])
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per module")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest third-party imports of agent modules to report")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    modules = []
+    for module in args.module:
+        print(f"importing {module} {args.runs} times...", file=sys.stderr)
+        modules.append(measure(module, args.runs, args.top))
+
+    report = {
+        "version": code_version(),
+        "python": platform.python_version(),
+        "timestamp": time.time(),
+        "modules": modules,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""End-to-end benchmark of the research graph against local stand-ins.
+
+Starts the fake LLM server in a child process, patches the MCP search call,
+then drives ``agent.graph.graph`` at each requested concurrency level and
+writes a JSON report::
+
+    python -m benchmarks.run --concurrency 1 10 100 --output bench.json
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from dataclasses import asdict
+from uuid import uuid4
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import HumanMessage
+
+from benchmarks.fake_llm import LLMSettings, serve
+from benchmarks.fake_search import SearchSettings, install
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    return {
+        "count": len(ordered),
+        "mean": sum(ordered) / len(ordered),
+        "p50": pick(0.50),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "max": ordered[-1],
+    }
+
+
+class NodeTimer(BaseCallbackHandler):
+    """Record the wall time of every graph node run."""
+
+    def __init__(self, nodes):
+        self.nodes = nodes
+        self.started = {}
+        self.durations = {node: [] for node in nodes}
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        # 节点内部的RunnableLambda也带有同样的metadata，只统计最外层的节点运行
+        if node in self.nodes and kwargs.get("name") == node and parent_run_id not in self.started:
+            self.started[run_id] = (node, time.perf_counter())
+
+    def _finish(self, run_id):
+        entry = self.started.pop(run_id, None)
+        if entry is not None:
+            node, started = entry
+            self.durations[node].append(time.perf_counter() - started)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id)
+
+
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS reports bytes
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def code_version():
+    try:
+        return subprocess.check_output(
+            ["git", "describe", "--always", "--dirty"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def run_level(graph, concurrency, runs, args):
+    timer = NodeTimer(["generate_query", "web_research", "summarize_research", "reflection", "finalize_answer"])
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], []
+
+    async def one(index):
+        state = {
+            "messages": [HumanMessage(content=f"Benchmark question {index} {uuid4().hex[:8]}")],
+            "initial_search_query_count": args.initial_queries,
+            "max_research_loops": args.max_loops,
+        }
+        config = {
+            "callbacks": [timer],
+            "configurable": {"search_cache": args.search_cache, "batch_summarization": args.batch_summarization},
+        }
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await graph.ainvoke(state, config)
+                latencies.append(time.perf_counter() - started)
+            except Exception as e:
+                errors.append(repr(e))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(runs)))
+    wall = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "runs": runs,
+        "errors": len(errors),
+        "error_samples": errors[:3],
+        "wall_seconds": wall,
+        "throughput_runs_per_s": len(latencies) / wall if wall else 0.0,
+        "latency_s": percentiles(latencies),
+        "node_latency_s": {node: percentiles(values) for node, values in timer.durations.items()},
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the research graph")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--runs", type=int, default=0, help="Runs per level (default: 2x concurrency, at least 5)")
+    parser.add_argument("--initial-queries", type=int, default=3)
+    parser.add_argument("--max-loops", type=int, default=2)
+    parser.add_argument("--llm-ttft", type=float, default=LLMSettings.ttft)
+    parser.add_argument("--llm-token-rate", type=float, default=LLMSettings.token_rate)
+    parser.add_argument("--llm-error-rate", type=float, default=LLMSettings.error_rate)
+    parser.add_argument("--search-latency", type=float, default=SearchSettings.median_latency)
+    parser.add_argument("--search-sigma", type=float, default=SearchSettings.latency_sigma)
+    parser.add_argument("--search-error-rate", type=float, default=SearchSettings.error_rate)
+    parser.add_argument("--search-cache", action="store_true", help="Keep the process-wide search cache enabled")
+    parser.add_argument("--batch-summarization", action="store_true", help="Summarize each loop's searches in one LLM call")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    llm_settings = LLMSettings(ttft=args.llm_ttft, token_rate=args.llm_token_rate, error_rate=args.llm_error_rate)
+    search_settings = SearchSettings(
+        median_latency=args.search_latency, latency_sigma=args.search_sigma, error_rate=args.search_error_rate
+    )
+
+    # 假的LLM服务放在子进程中，避免与被测进程争抢GIL并污染RSS统计
+    ready = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(llm_settings, 0, ready), daemon=True)
+    server.start()
+    port = ready.get(timeout=10)
+    os.environ["LLM_BASE_URL"] = f"http://127.0.0.1:{port}/v1"
+    os.environ.setdefault("APP_TOKEN", "benchmark")
+    os.environ.setdefault("MCP_APP_ID", "benchmark")
+    os.environ.setdefault("LLM_POOL_SIZE", str(max(args.concurrency) * args.initial_queries))
+
+    fake_search = install(search_settings)
+    from agent.graph import graph
+
+    levels = []
+    try:
+        for concurrency in args.concurrency:
+            runs = args.runs or max(5, concurrency * 2)
+            print(f"running {runs} runs at concurrency {concurrency}...", file=sys.stderr)
+            levels.append(asyncio.run(run_level(graph, concurrency, runs, args)))
+    finally:
+        server.terminate()
+
+    report = {
+        "version": code_version(),
+        "python": platform.python_version(),
+        "timestamp": time.time(),
+        "settings": {
+            "llm": asdict(llm_settings),
+            "search": asdict(search_settings),
+            "initial_queries": args.initial_queries,
+            "max_loops": args.max_loops,
+            "search_cache": args.search_cache,
+            "batch_summarization": args.batch_summarization,
+        },
+        "search_calls": fake_search.calls,
+        "levels": levels,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,174 @@
 import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+import uuid
 from langchain_core.messages import HumanMessage
-from agent.graph import graph
+from agent.checkpoint import prune_checkpoints, sqlite_checkpointer
+from agent.graph import build_graph
+
+DEFAULT_CHECKPOINT_DB = "checkpoints.sqlite"
+
+
+def load_questions(path):
+    """Yield the questions of a JSONL file as dicts with an id and a question.
+
+    A line is either a JSON string or an object with a "question" and an
+    optional "id", "initial_queries", "max_loops" and "reasoning_model".
+    Questions without an id get one derived from their text, so it stays
+    the same across restarts.
+    """
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                item = {"question": item}
+            item.setdefault("id", hashlib.sha1(item["question"].encode()).hexdigest()[:16])
+            yield item
+
+
+def completed_ids(path):
+    """Return the ids already answered without error in an output JSONL file."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # 上次运行被中断时可能只写了半行
+                continue
+            if "error" not in record:
+                done.add(record["id"])
+    return done
+
+
+class BatchStats:
+    """Throughput and latency of the questions finished so far."""
+
+    def __init__(self, total, skipped):
+        self.total = total
+        self.skipped = skipped
+        self.started = time.perf_counter()
+        self.latencies = []
+        self.failed = 0
+
+    def add(self, seconds, ok):
+        self.latencies.append(seconds)
+        if not ok:
+            self.failed += 1
+
+    def percentile(self, q):
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+    def line(self):
+        done = len(self.latencies)
+        elapsed = time.perf_counter() - self.started
+        rate = done / elapsed * 60 if elapsed else 0.0
+        eta = (self.total - self.skipped - done) / rate if rate else float("inf")
+        return (
+            f"{self.skipped + done}/{self.total} done ({self.skipped} skipped, {self.failed} failed) | "
+            f"{rate:.1f}/min | p50 {self.percentile(0.5):.1f}s p95 {self.percentile(0.95):.1f}s | "
+            f"eta {eta:.0f}min"
+        )
+
+
+async def research(graph, item, args):
+    """Run one question and return its output record; errors are recorded instead of raised."""
+    state = {
+        "messages": [HumanMessage(content=item["question"])],
+        "initial_search_query_count": item.get("initial_queries", args.initial_queries),
+        "max_research_loops": item.get("max_loops", args.max_loops),
+        "reasoning_model": item.get("reasoning_model", args.reasoning_model),
+    }
+    record = {"id": item["id"], "question": item["question"]}
+    started = time.perf_counter()
+    try:
+        result = await graph.ainvoke(state)
+    except Exception as e:
+        record["error"] = repr(e)
+    else:
+        record["answer"] = result["messages"][-1].content
+        record["sources"] = [
+            {"label": source["label"], "url": source["value"]} for source in result.get("sources_gathered", [])
+        ]
+    record["seconds"] = round(time.perf_counter() - started, 3)
+    return record
+
+
+async def run_batch(args):
+    """Answer every question of args.batch with at most args.concurrency runs in flight.
+
+    Records are appended to args.output as soon as each run finishes, so an
+    interrupted batch resumes by skipping the ids already answered.
+    """
+    done = completed_ids(args.output)
+    questions = list(load_questions(args.batch))
+    todo = [item for item in questions if item["id"] not in done]
+    pending = iter(todo)
+    stats = BatchStats(len(questions), len(questions) - len(todo))
+    graph = build_graph()
+
+    with open(args.output, "a+", encoding="utf-8") as out:
+        # 上次中断时可能留下不完整的最后一行，先补上换行
+        if out.tell() > 0:
+            out.seek(out.tell() - 1)
+            if out.read(1) != "\n":
+                out.write("\n")
+
+        async def worker():
+            # 所有worker共享同一个迭代器，取下一个问题时不会让出事件循环
+            for item in pending:
+                record = await research(graph, item, args)
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                stats.add(record["seconds"], "error" not in record)
+
+        async def report():
+            while True:
+                await asyncio.sleep(args.stats_interval)
+                print(stats.line(), file=sys.stderr)
+
+        reporter = asyncio.create_task(report())
+        try:
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        finally:
+            reporter.cancel()
+    print(stats.line(), file=sys.stderr)
 
 
 def main() -> None:
     """Run the research agent from the command line."""
     parser = argparse.ArgumentParser(description="Run the LangGraph research agent")
-    parser.add_argument("question", help="Research question")
+    parser.add_argument("question", nargs="?", help="Research question")
+    parser.add_argument(
+        "--batch",
+        help="JSONL file of questions to answer concurrently instead of a single question",
+    )
+    parser.add_argument(
+        "--output",
+        default="answers.jsonl",
+        help="JSONL file batch results are appended to; ids already answered in it are skipped",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=8,
+        help="Maximum number of batch questions researched at the same time",
+    )
+    parser.add_argument(
+        "--stats-interval",
+        type=float,
+        default=10.0,
+        help="Seconds between batch progress reports",
+    )
     parser.add_argument(
         "--initial-queries",
         type=int,
@@ -24,16 +186,72 @@ def main() -> None:
         default="gemini-2.5-pro-preview-05-06",
         help="Model for the final answer",
     )
+    parser.add_argument(
+        "--checkpoint-db",
+        help=f"SQLite file the run is checkpointed to ({DEFAULT_CHECKPOINT_DB} if omitted); "
+        "runs are only checkpointed with this, --thread-id, --resume or a prune option",
+    )
+    parser.add_argument(
+        "--thread-id",
+        help="Thread to checkpoint the run under (a new one is generated if omitted)",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue --thread-id from its last checkpoint instead of asking a new question",
+    )
+    parser.add_argument(
+        "--prune",
+        action="store_true",
+        help="Keep only the latest checkpoint of every other thread before running",
+    )
+    parser.add_argument(
+        "--prune-days",
+        type=float,
+        help="Delete threads whose latest checkpoint is older than this many days",
+    )
     args = parser.parse_args()
+    if args.batch:
+        if args.question or args.resume:
+            parser.error("--batch cannot be combined with a question or --resume")
+        asyncio.run(run_batch(args))
+        return
+    if args.resume and not args.thread_id:
+        parser.error("--resume requires --thread-id")
+    if not args.resume and not args.question:
+        parser.error("a question is required unless --resume is given")
 
-    state = {
-        "messages": [HumanMessage(content=args.question)],
-        "initial_search_query_count": args.initial_queries,
-        "max_research_loops": args.max_loops,
-        "reasoning_model": args.reasoning_model,
-    }
+    prune = args.prune or args.prune_days is not None
+    # 只有用到checkpoint的选项时才需要可选依赖langgraph-checkpoint-sqlite，普通运行不落盘
+    checkpointer, config = None, {}
+    if args.checkpoint_db or args.thread_id or args.resume or prune:
+        checkpointer = sqlite_checkpointer(args.checkpoint_db or DEFAULT_CHECKPOINT_DB)
+        thread_id = args.thread_id or uuid.uuid4().hex
+        config = {"configurable": {"thread_id": thread_id}}
+        if prune:
+            pruned = prune_checkpoints(
+                checkpointer, older_than_days=args.prune_days, keep_latest=args.prune, exclude={thread_id}
+            )
+            print(f"Pruned {pruned['deleted_threads']} threads, {pruned['deleted_checkpoints']} checkpoints", file=sys.stderr)
+
+    graph = build_graph(checkpointer)
+    if args.resume:
+        snapshot = graph.get_state(config)
+        if not snapshot.values:
+            sys.exit(f"No checkpoint found for thread {thread_id}")
+        # 没有待执行的节点说明该线程已经跑完，直接输出结果
+        result = graph.invoke(None, config) if snapshot.next else snapshot.values
+    else:
+        if checkpointer is not None:
+            print(f"Thread id: {thread_id}", file=sys.stderr)
+        state = {
+            "messages": [HumanMessage(content=args.question)],
+            "initial_search_query_count": args.initial_queries,
+            "max_research_loops": args.max_loops,
+            "reasoning_model": args.reasoning_model,
+        }
+        result = graph.invoke(state, config)
 
-    result = graph.invoke(state)
     messages = result.get("messages", [])
     if messages:
         print(messages[-1].content)
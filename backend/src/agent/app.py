@@ -1,10 +1,77 @@
 # mypy: disable - error - code = "no-untyped-def,misc"
+import asyncio
+import importlib
+import logging
+import os
 import pathlib
+import time
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Response
 from fastapi.staticfiles import StaticFiles
 
+from agent.llm.client import aclose_clients, awarm_clients
+from agent.metrics import REGISTRY
+
+
+def _env_flag(name, default):
+    value = os.getenv(name)
+    return default if value is None else value.lower() not in ("", "0", "false", "no")
+
+
+async def warm_up(connections=2, canary=False):
+    """Pay the cold-start costs before the server reports ready.
+
+    Imports (and so compiles) the graph and the lazily imported provider
+    SDKs, opens ``connections`` pooled connections to the LLM endpoint and,
+    with ``canary``, sends a one-token request to the query generator model.
+    Failures are logged and never keep the server from starting.
+    """
+    started = time.perf_counter()
+    # 导入在线程中进行，不阻塞事件循环
+    for module in ("agent.graph", "openai", "dashscope"):
+        await asyncio.to_thread(importlib.import_module, module)
+    failed = await awarm_clients(connections) if connections else 0
+    if failed:
+        logging.warning(f"预热: {failed}/{connections}个LLM连接建立失败")
+    if canary:
+        from agent.configuration import Configuration
+        from agent.llm.llm import openaiLLM
+
+        llm = openaiLLM(model_id=Configuration().query_generator_model)
+        llm.generation_params = {**llm.generation_params, "max_tokens": 1}
+        await llm.agenerate_response("ping")
+    logging.info(f"预热完成，耗时{time.perf_counter() - started:.2f}s")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm up before serving and release pooled LLM connections when the server shuts down.
+
+    Warm-up is controlled by the ``WARMUP`` (default on), ``WARMUP_CONNECTIONS``
+    (default 2), ``WARMUP_CANARY`` (default off) and ``WARMUP_TIMEOUT``
+    (seconds, default 30) environment variables.
+    """
+    if _env_flag("WARMUP", True):
+        try:
+            await asyncio.wait_for(
+                warm_up(int(os.getenv("WARMUP_CONNECTIONS", "2")), _env_flag("WARMUP_CANARY", False)),
+                float(os.getenv("WARMUP_TIMEOUT", "30")),
+            )
+        except Exception as e:
+            logging.warning(f"预热失败，服务照常启动: {e!r}")
+    yield
+    await aclose_clients()
+
+
 # Define the FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+
+@app.get("/metrics")
+def metrics():
+    """Expose node, LLM, search and retry metrics in Prometheus text format."""
+    return Response(REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 
 def create_frontend_router(build_dir="../frontend/dist"):
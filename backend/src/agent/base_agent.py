@@ -1,110 +1,425 @@
+import asyncio
+import contextlib
+import logging
+import math
 import os
-import copy
+from agent.budget import current_meter
+from agent.cache import LLMCache
 from agent.llm.llm import openaiLLM
-from dashscope import Application
-from agent.post import Post
+from agent.llm.router import RoutedLLM
+from agent.post import JSONStreamParser, Post
+from agent.retry import AppCallError, Retrier, RetryExhausted
+from agent.templates import PromptTemplate, compile_template
 import json
+import time
+from agent import metrics
 
 class Agent:
     step_prompt = """{prompt}"""
-    def __init__(self, model_id="qwen2.5-72b-instruct"):
-        self.llm = openaiLLM(model_id=model_id)
+    def __init__(self, model_id="qwen2.5-72b-instruct", retry_policy=None, retry_budget=None, cache=None, limiter=None, router=None):
+        # 配置了模型梯队时由router逐次选择模型，model_id为梯队中的首选模型
+        self.llm = openaiLLM(model_id=model_id, limiter=limiter) if router is None else RoutedLLM(router)
+        self.cache = cache
+        self.retrier = Retrier(retry_policy, retry_budget, name=f"{type(self).__name__}({model_id})")
+
+    @property
+    def retry_stats(self):
+        return self.retrier.stats
 
     def __call__(self, prompt):
         response = self.llm.generate_response(prompt)
         return response
 
+    async def acall(self, prompt):
+        response = await self.llm.agenerate_response(prompt)
+        return response
+
     def set_step_prompt(self, prompt):
         self.step_prompt = prompt
 
+    def cache_key(self, step_prompt):
+        return LLMCache.make_key(self.llm.model_id, step_prompt, self.llm.generation_params)
+
+    def remember(self, key, response):
+        # key按首选模型计算，备用模型给出的降级响应不能冒充首选模型的结果被缓存
+        if getattr(self.llm, "served_model", None) in (None, self.llm.model_id):
+            self.cache.set(key, response)
+
+    def cached(self, key):
+        response = self.cache.get(key)
+        if response is None:
+            return None
+        try:
+            return self.post_process(response)
+        except Exception:
+            return None
+
+    def generate(self, step_prompt):
+        if self.cache is None:
+            return self.post_process(self(step_prompt))
+        key = self.cache_key(step_prompt)
+        result = self.cached(key)
+        if result is not None:
+            return result
+        response = self(step_prompt)
+        result = self.post_process(response)
+        # 只在post_process成功后写入缓存，格式错误的响应不会被固定下来
+        self.remember(key, response)
+        return result
+
+    async def agenerate(self, step_prompt):
+        if self.cache is None:
+            return self.post_process(await self.acall(step_prompt))
+        key = self.cache_key(step_prompt)
+        result = self.cached(key)
+        if result is not None:
+            return result
+        response = await self.acall(step_prompt)
+        result = self.post_process(response)
+        self.remember(key, response)
+        return result
+
     def step(self, **kwargs):
         step_prompt = self.prompt_format(self.step_prompt, **kwargs)
-        response = ""
-        for _ in range(10):
-            try:
-                response = self(step_prompt)
-                response = self.post_process(response)
-                break
-            except Exception as e:
-                print(e)
-                continue
-        return response
+        try:
+            return self.retrier.call(self.generate, step_prompt)
+        except RetryExhausted as e:
+            logging.error(f"{self.retrier.name} 调用失败: {e}")
+            return ""
+
+    async def astep(self, **kwargs):
+        step_prompt = self.prompt_format(self.step_prompt, **kwargs)
+        try:
+            return await self.retrier.acall(self.agenerate, step_prompt)
+        except RetryExhausted as e:
+            logging.error(f"{self.retrier.name} 调用失败: {e}")
+            return ""
+
+    def stream_prompt(self, step_prompt):
+        """Stream the raw completion for an already formatted prompt chunk by chunk.
+
+        Only opening the stream (up to the first chunk) is retried; an error
+        in the middle of a stream ends it early instead of replaying output
+        that was already handed to the caller.
+        """
+        key = None
+        if self.cache is not None:
+            key = self.cache_key(step_prompt)
+            response = self.cache.get(key)
+            if response is not None:
+                yield response
+                return
+
+        def open_stream():
+            chunks = self.llm.stream_response(step_prompt)
+            return next(chunks, ""), chunks
+
+        try:
+            first, chunks = self.retrier.call(open_stream)
+        except RetryExhausted as e:
+            logging.error(f"{self.retrier.name} 调用失败: {e}")
+            return
+        response = first
+        yield first
+        try:
+            for chunk in chunks:
+                response += chunk
+                yield chunk
+        except Exception as e:
+            logging.error(f"{self.retrier.name} 流式输出中断: {e!r}")
+            return
+        if key is not None:
+            self.remember(key, response)
+
+    async def astream_prompt(self, step_prompt):
+        key = None
+        if self.cache is not None:
+            key = self.cache_key(step_prompt)
+            response = self.cache.get(key)
+            if response is not None:
+                yield response
+                return
+
+        async def open_stream():
+            chunks = self.llm.astream_response(step_prompt)
+            return await anext(chunks, ""), chunks
+
+        try:
+            first, chunks = await self.retrier.acall(open_stream)
+        except RetryExhausted as e:
+            logging.error(f"{self.retrier.name} 调用失败: {e}")
+            return
+        response = first
+        yield first
+        try:
+            async for chunk in chunks:
+                response += chunk
+                yield chunk
+        except Exception as e:
+            logging.error(f"{self.retrier.name} 流式输出中断: {e!r}")
+            return
+        if key is not None:
+            self.remember(key, response)
+
+    def stream(self, **kwargs):
+        return self.stream_prompt(self.prompt_format(self.step_prompt, **kwargs))
+
+    def astream(self, **kwargs):
+        return self.astream_prompt(self.prompt_format(self.step_prompt, **kwargs))
 
     def post_process(self, response):
         return response
 
-    def prompt_format(self, prompt, **kwargs):
-        prompt_ = copy.deepcopy(prompt)
-        for k in kwargs.keys():
-            rep = "{"+k+"}"
-            prompt_ = prompt_.replace(rep, str(kwargs[k]))
-        return prompt_
+    def prompt_format(self, prompt, /, **kwargs):
+        # 注册的模板严格校验变量；临时的字符串模板编译后缓存，未提供的变量原样保留
+        if isinstance(prompt, PromptTemplate):
+            return prompt.render(kwargs)
+        return compile_template(prompt).render(kwargs, strict=False)
+
+
+# 以400拒绝了JSON模式或function calling的模型，之后的请求直接使用prompt模式
+PROMPT_ONLY_MODELS = set()
+
+
+def rejects_output_params(exc):
+    """Whether exc is a provider rejecting the JSON mode or function calling parameters of a request."""
+    if getattr(exc, "status_code", None) != 400:
+        return False
+    return any(name in str(exc) for name in ("response_format", "tools", "tool_choice"))
 
 
 class JsonAgent(Agent):
-    def __init__(self, model_id="qwen2.5-72b-instruct", keys=None):
-        super().__init__(model_id)
+    """An agent whose responses are JSON, optionally validated against a pydantic model.
+
+    Args:
+        keys: Pydantic model the parsed JSON is validated into.
+        output_mode: "prompt" relies on the prompt alone, "json_object" turns
+            on the provider's JSON mode and "function" forces a function call
+            whose parameters are generated from ``keys``. A model that
+            rejects those parameters is asked again in "prompt" mode, and
+            so are its later calls in this process.
+        stream: Stream the response and stop reading as soon as the JSON
+            value is complete.
+    """
+
+    def __init__(self, model_id="qwen2.5-72b-instruct", keys=None, retry_policy=None, retry_budget=None, cache=None, limiter=None, output_mode="prompt", stream=False, router=None):
+        super().__init__(model_id, retry_policy=retry_policy, retry_budget=retry_budget, cache=cache, limiter=limiter, router=router)
         self.keys = keys
+        self.stream_output = stream
+        self.base_params = self.llm.generation_params
+        self.output_mode = "prompt" if self.llm.model_id in PROMPT_ONLY_MODELS else output_mode
+        # 输出模式属于请求参数，因此也会成为缓存key的一部分
+        self.llm.generation_params = {**self.base_params, **self.output_params(self.output_mode)}
+
+    def output_params(self, output_mode):
+        if output_mode == "function" and self.keys is not None:
+            name = self.keys.__name__
+            function = {
+                "name": name,
+                "description": (self.keys.__doc__ or name).strip(),
+                "parameters": self.keys.model_json_schema(),
+            }
+            return {
+                "tools": [{"type": "function", "function": function}],
+                "tool_choice": {"type": "function", "function": {"name": name}},
+            }
+        if output_mode in ("json_object", "function"):
+            return {"response_format": {"type": "json_object"}}
+        return {}
+
+    def fall_back(self, exc):
+        """Switch to prompt mode if exc rejected the output mode; return whether the call should be repeated."""
+        if self.output_mode == "prompt" or not rejects_output_params(exc):
+            return False
+        logging.warning(f"{self.llm.model_id} 不支持{self.output_mode}输出模式，改用prompt模式: {exc!r}")
+        PROMPT_ONLY_MODELS.add(self.llm.model_id)
+        self.output_mode = "prompt"
+        self.llm.generation_params = self.base_params
+        return True
+
+    def __call__(self, prompt):
+        try:
+            return self.complete(prompt)
+        except Exception as e:
+            if not self.fall_back(e):
+                raise
+        return self.complete(prompt)
+
+    async def acall(self, prompt):
+        try:
+            return await self.acomplete(prompt)
+        except Exception as e:
+            if not self.fall_back(e):
+                raise
+        return await self.acomplete(prompt)
+
+    def complete(self, prompt):
+        if not self.stream_output:
+            return super().__call__(prompt)
+        parser, raw = JSONStreamParser(), []
+        chunks = self.llm.stream_response(prompt)
+        try:
+            for chunk in chunks:
+                raw.append(chunk)
+                if parser.feed(chunk):
+                    break
+        finally:
+            chunks.close()
+        return parser.text if parser.complete else "".join(raw)
+
+    async def acomplete(self, prompt):
+        if not self.stream_output:
+            return await super().acall(prompt)
+        parser, raw = JSONStreamParser(), []
+        chunks = self.llm.astream_response(prompt)
+        try:
+            async for chunk in chunks:
+                raw.append(chunk)
+                if parser.feed(chunk):
+                    break
+        finally:
+            await chunks.aclose()
+        return parser.text if parser.complete else "".join(raw)
 
     def post_process(self, response):
-        result = json.loads(Post.extract_pattern(response, pattern="json"))
+        # 接近合法的JSON先在本地修复，只有修复失败或不符合schema时才重新生成
+        result = Post.load_json(response)
         if not self.keys:
             return result
         return self.keys(**result)
 
 
 class MCPAgent(Agent):
+    def __init__(self, model_id="qwen2.5-72b-instruct", retry_policy=None, retry_budget=None, limiter=None):
+        super().__init__(model_id, retry_policy=retry_policy, retry_budget=retry_budget)
+        # 限流作用于MCP应用调用，而不是agent内部的LLM
+        self.limiter = limiter
 
-    def step(self, **kwargs):
+    def slot(self):
+        return self.limiter.slot() if self.limiter is not None else contextlib.nullcontext()
+
+    def aslot(self):
+        return self.limiter.aslot() if self.limiter is not None else contextlib.nullcontext()
+
+    def format_step_prompt(self, **kwargs):
+        return self.prompt_format(self.step_prompt, **kwargs)
+
+    def call_app(self, step_prompt, biz_params):
+        # dashscope的导入耗时约0.3s，推迟到第一次搜索（或服务启动预热）时
+        from dashscope import Application
+
+        kwargs = {}
+        # 运行设置了时间预算时，剩余时间作为本次调用的超时（dashscope只接受整数秒）
+        meter = current_meter()
+        timeout = meter.timeout() if meter is not None else None
+        if timeout is not None:
+            kwargs["request_timeout"] = math.ceil(timeout)
+        return Application.call(
+            api_key=os.getenv("APP_TOKEN"),
+            app_id=os.getenv("MCP_APP_ID"),
+            prompt = step_prompt,
+            biz_params=biz_params,
+            **kwargs,
+        )
+
+    async def acall_app(self, step_prompt, biz_params):
+        # dashscope没有提供异步的Application接口，放到线程中执行以免阻塞事件循环
+        return await asyncio.to_thread(self.call_app, step_prompt, biz_params)
+
+    def generate(self, step_prompt, biz_params):
+        # post_process在限流槽内执行，这样限流器能看到被限流的AppCallError
+        with self.slot():
+            return self.post_process(self.call_app(step_prompt, biz_params))
+
+    async def agenerate(self, step_prompt, biz_params):
+        async with self.aslot():
+            return self.post_process(await self.acall_app(step_prompt, biz_params))
+
+    def run(self, step_prompt, biz_params):
         try:
-            step_prompt = self.step_prompt.format(**kwargs)
-        except Exception as e:
-            step_prompt = self.step_prompt
-
-        for _ in range(10):
-            try:
-                response = Application.call(
-                    api_key=os.getenv("APP_TOKEN"),
-                    app_id=os.getenv("MCP_APP_ID"),
-                    prompt = step_prompt,
-                    biz_params=kwargs
-                )
-                response = self.post_process(response)
-                return response
-            except Exception as e:
-                print(e)
-                continue
-        return None
+            return self.retrier.call(self.generate, step_prompt, biz_params)
+        except RetryExhausted as e:
+            logging.error(f"{self.retrier.name} 调用失败: {e}")
+            return None
+
+    async def arun(self, step_prompt, biz_params):
+        try:
+            return await self.retrier.acall(self.agenerate, step_prompt, biz_params)
+        except RetryExhausted as e:
+            logging.error(f"{self.retrier.name} 调用失败: {e}")
+            return None
+
+    def step(self, **kwargs):
+        return self.run(self.format_step_prompt(**kwargs), kwargs)
+
+    async def astep(self, **kwargs):
+        return await self.arun(self.format_step_prompt(**kwargs), kwargs)
 
     def post_process(self, response):
         # TODO 执行MCP工具
-        assert response.status_code == 200, "调用失败"
+        if response.status_code != 200:
+            raise AppCallError(
+                response.status_code,
+                code=getattr(response, "code", None),
+                message=getattr(response, "message", None),
+            )
         response = json.loads(response.output.text)
         return response
 
 class WebSearchAgent(MCPAgent):
+    def __init__(self, model_id="qwen2.5-72b-instruct", retry_policy=None, retry_budget=None, search_cache=None, limiter=None, hedger=None):
+        super().__init__(model_id, retry_policy=retry_policy, retry_budget=retry_budget, limiter=limiter)
+        self.search_cache = search_cache
+        self.hedger = hedger
+
     def step(self, prompt, **kwargs):
+        step_prompt = self.format_step_prompt(prompt=prompt)
+        if self.search_cache is None:
+            return self.run(step_prompt, kwargs)
+        return self.search_cache.get_or_fetch(
+            step_prompt, kwargs, lambda: self.run(step_prompt, kwargs)
+        )
+
+    async def astep(self, prompt, **kwargs):
+        step_prompt = self.format_step_prompt(prompt=prompt)
+        if self.search_cache is None:
+            return await self.arun(step_prompt, kwargs)
+        return await self.search_cache.aget_or_fetch(
+            step_prompt, kwargs, lambda: self.arun(step_prompt, kwargs)
+        )
+
+    def generate(self, step_prompt, biz_params):
+        if self.hedger is None:
+            return super().generate(step_prompt, biz_params)
+        # 备份请求各自占用限流槽，并在重试循环内进行
+        return self.hedger.call(super().generate, step_prompt, biz_params)
+
+    async def agenerate(self, step_prompt, biz_params):
+        if self.hedger is None:
+            return await super().agenerate(step_prompt, biz_params)
+        return await self.hedger.acall(super().agenerate, step_prompt, biz_params)
+
+    def call_app(self, step_prompt, biz_params):
+        # 异步路径也在线程中调用call_app，两条路径都在这里记录搜索耗时与次数
+        meter = current_meter()
+        if meter is not None:
+            meter.record_search()
+        started = time.perf_counter()
         try:
-            step_prompt = self.step_prompt.format(prompt=prompt)
-        except Exception as e:
-            step_prompt = self.step_prompt
-
-        for _ in range(10):
-            try:
-                response = Application.call(
-                    api_key=os.getenv("APP_TOKEN"),
-                    app_id=os.getenv("MCP_APP_ID"),
-                    prompt = step_prompt,
-                    biz_params=kwargs
-                )
-                response = self.post_process(response)
-                return response
-            except Exception as e:
-                print(e)
-                continue
-        return None
+            response = super().call_app(step_prompt, biz_params)
+        except Exception:
+            self.record(started, "error")
+            raise
+        self.record(started, "ok" if response.status_code == 200 else "error")
+        return response
+
+    def record(self, started, status):
+        metrics.SEARCH_DURATION.observe(time.perf_counter() - started)
+        metrics.SEARCH_REQUESTS.inc(status=status)
+
     def post_process(self, response):
         response = super().post_process(response)
         pages = json.loads(response["result"]["content"][0]["text"])["pages"]
         pages = [{"snippet": page["snippet"], "title": page["title"], "url": page["url"]} for page in pages]
-        return pages
\ No newline at end of file
+        metrics.SEARCH_RESULTS.observe(len(pages))
+        return pages
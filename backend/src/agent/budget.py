@@ -0,0 +1,138 @@
+import contextlib
+import contextvars
+import threading
+import time
+
+from agent.packing import estimate_tokens
+
+# 截止时间已过或即将到达时，请求至少保留的超时时间
+MIN_REQUEST_TIMEOUT = 1.0
+
+_current_meter = contextvars.ContextVar("usage_meter", default=None)
+
+
+class UsageMeter:
+    """Counts the LLM and search calls made while one graph node runs.
+
+    The meter is installed in a context variable for the duration of the
+    node, so the LLM client and the MCP agent find it without it being
+    threaded through every call; threads and tasks started by the node
+    inherit it. It also carries the run deadline down to those calls as a
+    request timeout, and records which model served each LLM call.
+    """
+
+    def __init__(self, deadline=None, min_timeout=MIN_REQUEST_TIMEOUT, node=None):
+        self.deadline = deadline
+        self.min_timeout = min_timeout
+        self.node = node
+        self.llm_calls = 0
+        self.llm_tokens = 0
+        self.search_calls = 0
+        self.served_models = []
+        self._reported = {"llm_calls": 0, "llm_tokens": 0, "search_calls": 0, "served_models": 0}
+        self._lock = threading.Lock()
+
+    def timeout(self, default=None):
+        """Seconds left until the run deadline (at least min_timeout), or default without a deadline."""
+        if self.deadline is None:
+            return default
+        return max(self.deadline - time.time(), self.min_timeout)
+
+    def record_llm(self, usage=None, prompt="", text="", model=None):
+        """Count one LLM call; model is the model that served it, None for a failed call."""
+        # 提前关闭的流拿不到usage，按文本估算token数
+        tokens = usage.total_tokens if usage is not None else estimate_tokens(prompt) + estimate_tokens(text)
+        with self._lock:
+            self.llm_calls += 1
+            self.llm_tokens += tokens
+            if model is not None:
+                self.served_models.append({"node": self.node, "model": model})
+
+    def record_search(self):
+        with self._lock:
+            self.search_calls += 1
+
+    def _unreported(self):
+        return {
+            "llm_calls": self.llm_calls - self._reported["llm_calls"],
+            "llm_tokens": self.llm_tokens - self._reported["llm_tokens"],
+            "search_calls": self.search_calls - self._reported["search_calls"],
+        }
+
+    def unreported(self):
+        """The call counts not yet returned by :meth:`update`."""
+        with self._lock:
+            return self._unreported()
+
+    def update(self):
+        """The usage since the previous call, as a state update for the run's accumulating channels.
+
+        A branch cut off by the quorum join keeps calling after its node
+        returned; the next call reports exactly those calls.
+        """
+        with self._lock:
+            update = self._unreported()
+            update["served_models"] = self.served_models[self._reported["served_models"]:]
+            self._reported = {
+                "llm_calls": self.llm_calls,
+                "llm_tokens": self.llm_tokens,
+                "search_calls": self.search_calls,
+                "served_models": len(self.served_models),
+            }
+        return update
+
+    @contextlib.contextmanager
+    def active(self):
+        token = _current_meter.set(self)
+        try:
+            yield self
+        finally:
+            _current_meter.reset(token)
+
+
+def current_meter():
+    """Return the UsageMeter of the node being run, or None outside of a metered node."""
+    return _current_meter.get()
+
+
+class RunBudget:
+    """Limits on one run's wall time, LLM tokens, LLM calls and search calls.
+
+    A limit of 0 disables it. ``reserve`` is the share of every limit kept
+    back for finalize_answer: once less than that is left, the research
+    loop stops and the answer is written from the evidence gathered so far.
+    """
+
+    def __init__(self, max_seconds=0.0, max_tokens=0, max_llm_calls=0, max_search_calls=0, reserve=0.2):
+        self.max_seconds = max_seconds
+        self.max_tokens = max_tokens
+        self.max_llm_calls = max_llm_calls
+        self.max_search_calls = max_search_calls
+        self.reserve = reserve
+
+    def deadline(self, started_at):
+        return started_at + self.max_seconds if self.max_seconds else None
+
+    def usage(self, state):
+        """Used amount of every limit, read from the run's state."""
+        started_at = state.get("run_started_at")
+        return {
+            "max_seconds": time.time() - started_at if started_at else 0.0,
+            "max_tokens": state.get("llm_tokens", 0),
+            "max_llm_calls": state.get("llm_calls", 0),
+            "max_search_calls": state.get("search_calls", 0),
+        }
+
+    def exhausted(self, state):
+        """Return the names of the limits that are (nearly) used up, keeping the reserve for the answer."""
+        return [
+            name
+            for name, used in self.usage(state).items()
+            if getattr(self, name) and used >= getattr(self, name) * (1 - self.reserve)
+        ]
+
+    def search_calls_left(self, state):
+        """Search calls the run may still make, or None without a limit."""
+        if not self.max_search_calls:
+            return None
+        return max(self.max_search_calls - state.get("search_calls", 0), 0)
@@ -0,0 +1,285 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+# 领头请求被取消时交给等待者的结果，等待者据此重新竞选领头请求
+_ABANDONED = object()
+
+
+class LLMCache:
+    """Two-tier cache of raw LLM responses.
+
+    The first tier is a bounded in-memory LRU, the second an optional SQLite
+    file shared across processes and restarts. Both tiers honour the same TTL;
+    the SQLite tier is trimmed to ``max_disk_entries`` by last access time.
+    Values are the raw completion text, so callers re-run their own
+    post-processing on a hit.
+    """
+
+    def __init__(self, max_entries=1024, ttl=86400.0, path=None, max_disk_entries=100_000):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.max_disk_entries = max_disk_entries
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._writes = 0
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed)")
+            self._db.commit()
+
+    @staticmethod
+    def make_key(model_id, prompt, params=None):
+        """Hash (model_id, fully formatted prompt, generation params) into a cache key."""
+        payload = json.dumps(
+            {"model": model_id, "prompt": prompt, "params": params or {}},
+            ensure_ascii=False,
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _expired(self, created, now):
+        return self.ttl is not None and now - created > self.ttl
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created, value = entry
+                if not self._expired(created, now):
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, created FROM llm_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    value, created = row
+                    if not self._expired(created, now):
+                        self._db.execute("UPDATE llm_cache SET accessed = ? WHERE key = ?", (now, key))
+                        self._db.commit()
+                        self._remember(key, created, value)
+                        self.hits += 1
+                        self.disk_hits += 1
+                        return value
+                    self._db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                    self._db.commit()
+
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            self._writes += 1
+            # 每写入一定次数才做一次淘汰，避免每次写入都扫描整张表
+            if self._writes % 100 == 0:
+                self._evict_disk(now)
+            self._db.commit()
+
+    def _remember(self, key, created, value):
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self, now):
+        if self.ttl is not None:
+            self._db.execute("DELETE FROM llm_cache WHERE created < ?", (now - self.ttl,))
+        self._db.execute(
+            "DELETE FROM llm_cache WHERE key IN ("
+            "SELECT key FROM llm_cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_entries,),
+        )
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "memory_entries": len(self._memory),
+        }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class SearchCache:
+    """Process-wide search result cache with in-flight de-duplication.
+
+    Results are keyed on the normalized query plus the search parameters and
+    stay fresh for ``ttl`` seconds. Concurrent identical requests, from sync
+    or async callers, wait on the one in-flight call instead of issuing their
+    own (singleflight). If the leading call is cancelled, its waiters are
+    not: one of them takes over and issues the call itself.
+    """
+
+    def __init__(self, ttl=600.0, max_entries=4096):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.coalesced = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(query):
+        return " ".join(str(query).casefold().split())
+
+    def make_key(self, query, params=None):
+        return (self.normalize(query), json.dumps(params or {}, sort_keys=True, ensure_ascii=False))
+
+    @property
+    def saved_calls(self):
+        """Number of search calls answered without hitting the search backend."""
+        return self.hits + self.coalesced
+
+    def _join(self, key):
+        """Return (result, future, is_leader); result is set on a fresh hit."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created, result = entry
+                if time.time() - created <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return result, None, False
+                del self._entries[key]
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return None, future, False
+            future = Future()
+            self._inflight[key] = future
+            self.misses += 1
+            return None, future, True
+
+    def _finish(self, key, future, result=None, error=None):
+        with self._lock:
+            # 搜索失败(None)不缓存，下一次请求会重新搜索
+            if error is None and result is not None and result is not _ABANDONED:
+                self._entries[key] = (time.time(), result)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            self._inflight.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def get_or_fetch(self, query, params, fetch):
+        key = self.make_key(query, params)
+        while True:
+            result, future, leader = self._join(key)
+            if future is None:
+                return result
+            if leader:
+                break
+            result = future.result()
+            if result is not _ABANDONED:
+                return result
+            with self._lock:
+                # 重新加入时会再计一次
+                self.coalesced -= 1
+        try:
+            result = fetch()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result=result)
+        return result
+
+    async def aget_or_fetch(self, query, params, afetch):
+        key = self.make_key(query, params)
+        while True:
+            result, future, leader = self._join(key)
+            if future is None:
+                return result
+            if leader:
+                break
+            result = await asyncio.wrap_future(future)
+            if result is not _ABANDONED:
+                return result
+            with self._lock:
+                # 重新加入时会再计一次
+                self.coalesced -= 1
+        try:
+            result = await afetch()
+        except asyncio.CancelledError:
+            # 取消的只是领头请求本身，等待者的请求仍然有效
+            self._finish(key, future, result=_ABANDONED)
+            raise
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result=result)
+        return result
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "saved_calls": self.saved_calls,
+            "entries": len(self._entries),
+        }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_llm_cache(max_entries=1024, ttl=86400.0, path=None, max_disk_entries=100_000):
+    """Return the process-wide LLMCache for the given settings."""
+    key = (max_entries, ttl, path or None, max_disk_entries)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = LLMCache(max_entries=max_entries, ttl=ttl, path=path or None, max_disk_entries=max_disk_entries)
+            _caches[key] = cache
+    return cache
+
+
+def get_search_cache(ttl=600.0, max_entries=4096):
+    """Return the process-wide SearchCache for the given settings."""
+    key = ("search", ttl, max_entries)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = SearchCache(ttl=ttl, max_entries=max_entries)
+            _caches[key] = cache
+    return cache
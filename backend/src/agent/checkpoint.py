@@ -0,0 +1,79 @@
+import sqlite3
+from datetime import UTC, datetime, timedelta
+
+
+def sqlite_checkpointer(path):
+    """Return a SqliteSaver that stores checkpoints in the SQLite file at path.
+
+    The connection is shared by the worker threads of the sync graph
+    (SqliteSaver serializes access with its own lock). Async runs need
+    ``AsyncSqliteSaver`` instead.
+    """
+    try:
+        from langgraph.checkpoint.sqlite import SqliteSaver
+    except ImportError as e:
+        raise ImportError(
+            "SQLite checkpointing requires langgraph-checkpoint-sqlite: pip install -e '.[checkpoint]'"
+        ) from e
+    saver = SqliteSaver(sqlite3.connect(path, check_same_thread=False))
+    saver.setup()
+    return saver
+
+
+def _thread_ids(saver):
+    with saver.cursor(transaction=False) as cur:
+        cur.execute("SELECT DISTINCT thread_id FROM checkpoints")
+        return [row[0] for row in cur.fetchall()]
+
+
+def prune_checkpoints(saver, older_than_days=None, keep_latest=True, exclude=()):
+    """Delete old checkpoints from a SqliteSaver.
+
+    Args:
+        saver: The SqliteSaver returned by :func:`sqlite_checkpointer`.
+        older_than_days: Delete whole threads whose latest checkpoint is older
+            than this many days; None keeps every thread.
+        keep_latest: In the remaining threads, delete every checkpoint but the
+            latest one per namespace, together with their pending writes. The
+            latest checkpoint and its writes are all a resume needs.
+        exclude: Thread ids to leave untouched, such as the one being run.
+
+    Returns:
+        A dict with the number of deleted threads and checkpoints.
+    """
+    deleted_threads = deleted_checkpoints = 0
+    cutoff = None
+    if older_than_days is not None:
+        cutoff = datetime.now(UTC) - timedelta(days=older_than_days)
+    for thread_id in _thread_ids(saver):
+        if thread_id in exclude:
+            continue
+        if cutoff is not None:
+            latest = saver.get_tuple({"configurable": {"thread_id": thread_id}})
+            if latest is not None and datetime.fromisoformat(latest.checkpoint["ts"]) < cutoff:
+                saver.delete_thread(thread_id)
+                deleted_threads += 1
+                continue
+        if keep_latest:
+            deleted_checkpoints += _keep_latest(saver, thread_id)
+    return {"deleted_threads": deleted_threads, "deleted_checkpoints": deleted_checkpoints}
+
+
+def _keep_latest(saver, thread_id):
+    # checkpoint_id是按时间递增的uuid6，因此每个命名空间中最大的id就是最新的checkpoint
+    latest = """
+        SELECT checkpoint_ns, MAX(checkpoint_id) FROM checkpoints
+        WHERE thread_id = ? GROUP BY checkpoint_ns
+    """
+    stale = """
+        FROM {table} WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?
+    """
+    deleted = 0
+    with saver.cursor() as cur:
+        cur.execute(latest, (thread_id,))
+        for checkpoint_ns, checkpoint_id in cur.fetchall():
+            args = (thread_id, checkpoint_ns, checkpoint_id)
+            cur.execute("DELETE " + stale.format(table="writes"), args)
+            cur.execute("DELETE " + stale.format(table="checkpoints"), args)
+            deleted += cur.rowcount
+    return deleted
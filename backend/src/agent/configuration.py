@@ -1,9 +1,16 @@
 import os
 from pydantic import BaseModel, Field
-from typing import Any, Optional
+from typing import Any, Literal, Optional
 
 from langchain_core.runnables import RunnableConfig
 
+from agent.budget import RunBudget
+from agent.cache import get_llm_cache, get_search_cache
+from agent.hedge import get_hedger
+from agent.llm.router import ModelRouter
+from agent.ratelimit import get_limiter
+from agent.retry import RetryPolicy
+
 
 class Configuration(BaseModel):
     """The configuration for the agent."""
@@ -29,6 +36,26 @@ class Configuration(BaseModel):
         },
     )
 
+    model_fallbacks: dict[str, list[str]] = Field(
+        default={},
+        metadata={"description": "Models to fail over to, in order, when a model errors, times out or is degraded; keyed by the configured model, e.g. {\"qwen-max-latest\": [\"qwen-plus-latest\"]}. Empty disables routing."},
+    )
+
+    model_latency_slos: dict[str, float] = Field(
+        default={"query": 10.0, "summary": 15.0, "reflection": 20.0, "answer": 20.0},
+        metadata={"description": "Time-to-first-token SLO in seconds per role (query, summary, reflection, answer) for models with fallbacks; slower models are tried last and a stream missing it fails over."},
+    )
+
+    model_context_windows: dict[str, int] = Field(
+        default={"qwen-max-latest": 32768, "qwen-plus-latest": 131072},
+        metadata={"description": "Context window in tokens per model; models too small for a prompt are skipped by the router."},
+    )
+
+    router_max_error_rate: float = Field(
+        default=0.5,
+        metadata={"description": "Rolling error rate above which a model is tried only after the healthy models of its ladder."},
+    )
+
     number_of_initial_queries: int = Field(
         default=3,
         metadata={"description": "The number of initial search queries to generate."},
@@ -39,6 +66,351 @@ class Configuration(BaseModel):
         metadata={"description": "The maximum number of research loops to perform."},
     )
 
+    stream_answer: bool = Field(
+        default=True,
+        metadata={"description": "Whether to stream the final answer token by token through the messages stream mode."},
+    )
+
+    incremental_reflection: bool = Field(
+        default=False,
+        metadata={"description": "Whether reflection only sends a running knowledge digest plus the results gathered since the last loop."},
+    )
+
+    evidence_token_budget: int = Field(
+        default=24000,
+        metadata={"description": "Default token budget for the research summaries packed into the reflection and answer prompts."},
+    )
+
+    model_evidence_token_budgets: dict[str, int] = Field(
+        default={"qwen-max-latest": 20000, "qwen-plus-latest": 80000},
+        metadata={"description": "Per-model overrides of evidence_token_budget, sized to each model's context window."},
+    )
+
+    llm_retry_max_attempts: int = Field(
+        default=5,
+        metadata={"description": "Maximum attempts for one LLM call, including the first one."},
+    )
+
+    llm_retry_base_delay: float = Field(
+        default=1.0,
+        metadata={"description": "Base delay in seconds of the exponential backoff between LLM retries."},
+    )
+
+    llm_retry_max_delay: float = Field(
+        default=30.0,
+        metadata={"description": "Upper bound in seconds of a single backoff between LLM retries."},
+    )
+
+    mcp_retry_max_attempts: int = Field(
+        default=5,
+        metadata={"description": "Maximum attempts for one MCP (search) call, including the first one."},
+    )
+
+    mcp_retry_base_delay: float = Field(
+        default=0.5,
+        metadata={"description": "Base delay in seconds of the exponential backoff between MCP retries."},
+    )
+
+    mcp_retry_max_delay: float = Field(
+        default=10.0,
+        metadata={"description": "Upper bound in seconds of a single backoff between MCP retries."},
+    )
+
+    retry_deadline: float = Field(
+        default=120.0,
+        metadata={"description": "Overall deadline in seconds for one call including all of its retries."},
+    )
+
+    retry_budget: int = Field(
+        default=20,
+        metadata={"description": "Maximum number of retries a single research run may spend."},
+    )
+
+    llm_cache: bool = Field(
+        default=False,
+        metadata={"description": "Whether to cache LLM responses keyed on model, prompt and generation params."},
+    )
+
+    llm_cache_path: str = Field(
+        default="",
+        metadata={"description": "SQLite file for the persistent cache tier. Empty keeps the cache in memory only."},
+    )
+
+    llm_cache_ttl: float = Field(
+        default=86400.0,
+        metadata={"description": "Seconds a cached LLM response stays valid."},
+    )
+
+    llm_cache_max_entries: int = Field(
+        default=1024,
+        metadata={"description": "Maximum number of responses kept in the in-memory LRU tier."},
+    )
+
+    llm_cache_max_disk_entries: int = Field(
+        default=100000,
+        metadata={"description": "Maximum number of responses kept in the SQLite tier."},
+    )
+
+    search_cache: bool = Field(
+        default=True,
+        metadata={"description": "Whether to share search results across branches, loops and runs in this process."},
+    )
+
+    search_cache_ttl: float = Field(
+        default=600.0,
+        metadata={"description": "Seconds a cached search result stays fresh."},
+    )
+
+    search_cache_max_entries: int = Field(
+        default=4096,
+        metadata={"description": "Maximum number of search results kept in the cache."},
+    )
+
+    max_run_seconds: float = Field(
+        default=0.0,
+        metadata={"description": "Wall-clock budget of one run in seconds; the remaining time is also used as the timeout of LLM and search calls. 0 disables it."},
+    )
+
+    max_run_tokens: int = Field(
+        default=0,
+        metadata={"description": "LLM token budget of one run; 0 disables it."},
+    )
+
+    max_llm_calls: int = Field(
+        default=0,
+        metadata={"description": "LLM call budget of one run; 0 disables it."},
+    )
+
+    max_search_calls: int = Field(
+        default=0,
+        metadata={"description": "Search call budget of one run; 0 disables it."},
+    )
+
+    budget_reserve: float = Field(
+        default=0.2,
+        metadata={"description": "Share of every run budget kept for the final answer; research stops once less than this is left."},
+    )
+
+    min_request_timeout: float = Field(
+        default=1.0,
+        metadata={"description": "Smallest timeout, in seconds, given to an LLM or search call once the wall-clock budget is nearly spent."},
+    )
+
+    search_rerank: bool = Field(
+        default=True,
+        metadata={"description": "Whether to rerank search results locally with BM25 and trim them before summarization."},
+    )
+
+    search_top_k: int = Field(
+        default=6,
+        metadata={"description": "Number of reranked search results passed to summarization; 0 keeps all of them."},
+    )
+
+    search_result_token_budget: int = Field(
+        default=3000,
+        metadata={"description": "Largest estimated size, in tokens, of the search results passed to summarization for one query; 0 disables the limit."},
+    )
+
+    dedup_results: bool = Field(
+        default=True,
+        metadata={"description": "Whether to drop search results that near-duplicate one already used by the run before they reach a prompt."},
+    )
+
+    dedup_max_distance: int = Field(
+        default=10,
+        metadata={"description": "Largest Hamming distance between the 64-bit SimHash signatures of two results that are treated as duplicates; unrelated snippets differ in about 32 bits."},
+    )
+
+    query_dedup: bool = Field(
+        default=True,
+        metadata={"description": "Whether to drop follow-up queries that near-duplicate a query the run already searched."},
+    )
+
+    query_dedup_threshold: float = Field(
+        default=0.7,
+        metadata={"description": "Character trigram or term Jaccard similarity at which a follow-up query counts as already covered."},
+    )
+
+    query_embedder: Optional[str] = Field(
+        default=None,
+        metadata={"description": "Optional 'module:function' embedding a list of strings, used to also compare follow-up queries by cosine similarity."},
+    )
+
+    query_embedding_threshold: float = Field(
+        default=0.9,
+        metadata={"description": "Cosine similarity at which a follow-up query counts as already covered when query_embedder is set."},
+    )
+
+    batch_summarization: bool = Field(
+        default=False,
+        metadata={"description": "Whether to summarize the search results of all branches of a loop in one LLM call instead of one call per branch."},
+    )
+
+    batch_summary_token_budget: int = Field(
+        default=30000,
+        metadata={"description": "Largest estimated prompt, in tokens, for a batched summary; larger batches fall back to per-branch calls."},
+    )
+
+    structured_output: Literal["prompt", "json_object", "function"] = Field(
+        default="prompt",
+        metadata={"description": "How structured nodes ask for JSON: prompt only, the provider's JSON mode, or a function call generated from the schema. Models that reject JSON mode or function calling fall back to prompt only."},
+    )
+
+    stream_structured_output: bool = Field(
+        default=False,
+        metadata={"description": "Whether structured nodes stream their response and stop reading once the JSON value is complete."},
+    )
+
+    join_quorum: float = Field(
+        default=1.0,
+        metadata={"description": "Share of parallel web_research branches that must finish before reflection starts; 1.0 waits for all."},
+    )
+
+    branch_deadline_seconds: float = Field(
+        default=0.0,
+        metadata={"description": "Seconds a web_research branch may run before reflection proceeds without it; 0 disables the deadline."},
+    )
+
+    late_result_policy: Literal["merge", "discard"] = Field(
+        default="merge",
+        metadata={"description": "Whether results of cut-off branches are merged into the next reflection or discarded."},
+    )
+
+    search_hedging: bool = Field(
+        default=False,
+        metadata={"description": "Whether to send a backup search request when a search outlives the tracked latency percentile."},
+    )
+
+    search_hedge_percentile: float = Field(
+        default=0.9,
+        metadata={"description": "Rolling search latency percentile after which a backup request is sent."},
+    )
+
+    search_hedge_budget: float = Field(
+        default=0.05,
+        metadata={"description": "Maximum share of search requests that may be duplicated by hedging."},
+    )
+
+    rate_limit: bool = Field(
+        default=True,
+        metadata={"description": "Whether to queue LLM and MCP calls in process-wide adaptive rate limiters."},
+    )
+
+    llm_qps: float = Field(
+        default=10.0,
+        metadata={"description": "Requests per second allowed per LLM model across all runs in this process."},
+    )
+
+    llm_burst: int = Field(
+        default=10,
+        metadata={"description": "Token bucket size for each LLM model."},
+    )
+
+    llm_max_in_flight: int = Field(
+        default=16,
+        metadata={"description": "Maximum concurrent requests per LLM model."},
+    )
+
+    model_rate_limits: dict[str, dict[str, float]] = Field(
+        default={},
+        metadata={"description": "Per-model overrides of qps, burst and max_in_flight."},
+    )
+
+    mcp_qps: float = Field(
+        default=5.0,
+        metadata={"description": "Requests per second allowed to the MCP search app across all runs in this process."},
+    )
+
+    mcp_burst: int = Field(
+        default=5,
+        metadata={"description": "Token bucket size for the MCP search app."},
+    )
+
+    mcp_max_in_flight: int = Field(
+        default=8,
+        metadata={"description": "Maximum concurrent requests to the MCP search app."},
+    )
+
+    def evidence_budget(self, model_id: str) -> int:
+        """Return the evidence token budget for prompts sent to model_id."""
+        return self.model_evidence_token_budgets.get(model_id, self.evidence_token_budget)
+
+    def retry_policy(self, agent_type: str) -> RetryPolicy:
+        """Build the retry policy for an agent type ("llm" or "mcp")."""
+        return RetryPolicy(
+            max_attempts=getattr(self, f"{agent_type}_retry_max_attempts"),
+            base_delay=getattr(self, f"{agent_type}_retry_base_delay"),
+            max_delay=getattr(self, f"{agent_type}_retry_max_delay"),
+            deadline=self.retry_deadline,
+        )
+
+    def rate_limiter(self, agent_type: str, model_id: Optional[str] = None):
+        """Return the shared limiter for an LLM model or, for "mcp", the MCP app."""
+        if not self.rate_limit:
+            return None
+        if agent_type == "mcp":
+            key, overrides = os.getenv("MCP_APP_ID", ""), {}
+        else:
+            key, overrides = model_id, self.model_rate_limits.get(model_id, {})
+        return get_limiter(
+            f"{agent_type}:{key}",
+            qps=overrides.get("qps", getattr(self, f"{agent_type}_qps")),
+            burst=overrides.get("burst", getattr(self, f"{agent_type}_burst")),
+            max_in_flight=overrides.get("max_in_flight", getattr(self, f"{agent_type}_max_in_flight")),
+        )
+
+    def model_router(self, role: str, model_id: str):
+        """Return the router for a role's model, or None when the model has no fallbacks."""
+        fallbacks = self.model_fallbacks.get(model_id)
+        if not fallbacks:
+            return None
+        ladder = [model_id, *(m for m in fallbacks if m != model_id)]
+        return ModelRouter(
+            role,
+            ladder,
+            slo=self.model_latency_slos.get(role),
+            limiters={m: self.rate_limiter("llm", m) for m in ladder},
+            context_windows=self.model_context_windows,
+            max_error_rate=self.router_max_error_rate,
+        )
+
+    def run_budget(self):
+        """Return the per-run budget configured for this run."""
+        return RunBudget(
+            max_seconds=self.max_run_seconds,
+            max_tokens=self.max_run_tokens,
+            max_llm_calls=self.max_llm_calls,
+            max_search_calls=self.max_search_calls,
+            reserve=self.budget_reserve,
+        )
+
+    def search_hedger(self):
+        """Return the shared search hedger, or None when hedging is disabled."""
+        if not self.search_hedging:
+            return None
+        return get_hedger(
+            f"mcp:{os.getenv('MCP_APP_ID', '')}",
+            percentile=self.search_hedge_percentile,
+            budget_ratio=self.search_hedge_budget,
+        )
+
+    def shared_search_cache(self):
+        """Return the shared search cache, or None when it is disabled."""
+        if not self.search_cache:
+            return None
+        return get_search_cache(ttl=self.search_cache_ttl, max_entries=self.search_cache_max_entries)
+
+    def response_cache(self):
+        """Return the shared LLM response cache, or None when caching is disabled."""
+        if not self.llm_cache:
+            return None
+        return get_llm_cache(
+            max_entries=self.llm_cache_max_entries,
+            ttl=self.llm_cache_ttl,
+            path=self.llm_cache_path,
+            max_disk_entries=self.llm_cache_max_disk_entries,
+        )
+
     @classmethod
     def from_runnable_config(
         cls, config: Optional[RunnableConfig] = None
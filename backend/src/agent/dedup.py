@@ -0,0 +1,110 @@
+import hashlib
+import threading
+import time
+from collections import Counter
+
+from agent.packing import terms
+
+SIGNATURE_BITS = 64
+# 运行结束后签名在进程内保留的时间，与迟到结果一致
+SIGNATURE_TTL = 3600.0
+
+
+def _hash(shingle):
+    # 内置hash()在进程间加盐，签名需要写入checkpoint，因此使用稳定的哈希
+    return int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "big")
+
+
+def simhash(text, shingle_size=2):
+    """Return the 64-bit SimHash of text over shingles of its terms.
+
+    Texts that differ only in a few words get signatures that differ in a
+    few bits, so near-duplicates can be found by Hamming distance.
+    """
+    tokens = terms(text)
+    if len(tokens) <= shingle_size:
+        shingles = Counter([" ".join(tokens)]) if tokens else Counter()
+    else:
+        shingles = Counter(" ".join(tokens[i:i + shingle_size]) for i in range(len(tokens) - shingle_size + 1))
+    weights = [0] * SIGNATURE_BITS
+    for shingle, count in shingles.items():
+        h = _hash(shingle)
+        for bit in range(SIGNATURE_BITS):
+            weights[bit] += count if h >> bit & 1 else -count
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+def result_signature(item):
+    """Signature of one search result; syndicated copies often only differ in the title, so the snippet is used."""
+    return simhash(item["snippet"] or item["title"])
+
+
+class SignatureIndex:
+    """Process-wide SimHash signatures of the search results each run has used.
+
+    Parallel branches of one fan-out cannot see each other's state
+    updates, so :meth:`check` reserves the signatures it lets through
+    under the index lock: a sibling branch checking the same articles a
+    moment later sees them as duplicates. A branch that fails, or is cut
+    off and discarded, releases its reservations so it never hides
+    results from the others or from its own re-run. Signatures from
+    earlier loops also travel in the graph state, which lets a run
+    resumed from a checkpoint in another process rebuild its index.
+    """
+
+    def __init__(self, ttl=SIGNATURE_TTL):
+        self.ttl = ttl
+        self._runs = {}
+        self._lock = threading.Lock()
+
+    def _seen(self, run_id, known):
+        # 调用方需持有锁；签名映射到预留它的分支，已写入state的签名为None
+        now = time.monotonic()
+        for key in [key for key, (touched, _) in self._runs.items() if now - touched > self.ttl]:
+            del self._runs[key]
+        _, seen = self._runs.get(run_id, (now, {}))
+        seen.update(dict.fromkeys(known))
+        self._runs[run_id] = (now, seen)
+        return seen
+
+    def check(self, run_id, signatures, known=(), max_distance=10, owner=None):
+        """Return which signatures near-duplicate one the run already used, reserving the rest.
+
+        Args:
+            run_id: Id of the research run.
+            signatures: Signatures to check, in order of preference; one that
+                duplicates an earlier entry of the list also counts.
+            known: Signatures the run already merged, e.g. from the graph state.
+            max_distance: Largest Hamming distance counted as a duplicate.
+            owner: Token of the branch the new signatures are reserved for,
+                to :meth:`release` them again; None registers them for good.
+
+        Returns:
+            A list of booleans, True for each duplicate.
+        """
+        with self._lock:
+            seen = self._seen(run_id, known)
+            duplicates = []
+            for signature in signatures:
+                duplicate = any(hamming(signature, other) <= max_distance for other in seen)
+                if not duplicate:
+                    seen[signature] = owner
+                duplicates.append(duplicate)
+        return duplicates
+
+    def release(self, run_id, owner, signatures=None):
+        """Drop the signatures reserved for owner, or only those of them given in signatures."""
+        if owner is None:
+            return
+        with self._lock:
+            _, seen = self._runs.get(run_id, (None, {}))
+            for signature in list(seen if signatures is None else signatures):
+                if seen.get(signature) == owner:
+                    del seen[signature]
+
+
+RUN_SIGNATURES = SignatureIndex()
@@ -1,13 +1,20 @@
-import json
+import asyncio
+import contextlib
+import contextvars
+import functools
 import logging
+import time
+from uuid import uuid4
 
-from agent.tools_and_schemas import SearchQueryList, Reflection
+from concurrent.futures import ThreadPoolExecutor
+
+from agent.tools_and_schemas import BatchSummaries, SearchQueryList, Reflection
 from dotenv import load_dotenv
 from langchain_core.messages import AIMessage
 from langgraph.types import Send
 from langgraph.graph import StateGraph
 from langgraph.graph import START, END
-from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables import RunnableConfig, RunnableLambda
 
 from agent.state import (
     OverallState,
@@ -21,48 +28,109 @@ from agent.prompts import (
     query_writer_instructions,
     web_searcher_instructions,
     reflection_instructions,
+    incremental_reflection_instructions,
     answer_instructions,
+    batch_web_searcher_instructions,
 )
+from agent.packing import compact_json, estimate_tokens, pack_evidence, rank_results
 from agent.post import Post
 from agent.utils import (
+    CitationRewriter,
     get_research_topic,
     resolve_urls,
 )
+from agent import metrics
 from agent.base_agent import Agent, JsonAgent, WebSearchAgent
+from agent.budget import UsageMeter, current_meter
+from agent.dedup import RUN_SIGNATURES, result_signature
+from agent.join import LATE_RESULTS, join_branch
+from agent.query_index import QueryIndex, load_embedder, normalize_query
+from agent.retry import RUN_RETRY_BUDGETS, RetryBudget
+from agent.streaming import AsyncMessageStreamer, MessageStreamer
 
 load_dotenv()
 
 
 # Nodes
-def generate_query(state: OverallState, config: RunnableConfig) -> QueryGenerationState:
+def _retry_budget(state, configurable: Configuration) -> RetryBudget:
+    """节点使用的重试预算，used只统计本节点的重试，计入state的retry_count
+
+    同一次运行的所有节点与并行分支共享进程级的运行预算，generate_query执行时还没有run_id，
+    只能使用state中剩余的次数
     """
-    基于用户问题生成搜索查询的LangGraph节点
+    used = state.get("retry_count", 0)
+    if not state.get("run_id"):
+        return RetryBudget(configurable.retry_budget - used)
+    return RetryBudget(
+        configurable.retry_budget, parent=RUN_RETRY_BUDGETS.get(state["run_id"], configurable.retry_budget, used)
+    )
 
-    使用LLM为用户的问题创建优化的网络搜索查询，用于网络研究。
 
-    Args:
-        state: 包含用户问题的当前图状态
-        config: 可运行配置，包括LLM提供商设置
-
-    Returns:
-        包含状态更新的字典，包括search_query键，包含生成的查询
-    """
+def _query_writer(state: OverallState, config: RunnableConfig):
+    """构造generate_query节点使用的agent以及提示参数"""
     configurable = Configuration.from_runnable_config(config)
     # 检查自定义初始搜索查询数量
     if state.get("initial_search_query_count") is None:
         state["initial_search_query_count"] = configurable.number_of_initial_queries
 
-    agent = JsonAgent(model_id=configurable.query_generator_model, keys=SearchQueryList)
+    agent = JsonAgent(
+        model_id=configurable.query_generator_model,
+        keys=SearchQueryList,
+        retry_policy=configurable.retry_policy("llm"),
+        retry_budget=_retry_budget(state, configurable),
+        cache=configurable.response_cache(),
+        limiter=configurable.rate_limiter("llm", configurable.query_generator_model),
+        router=configurable.model_router("query", configurable.query_generator_model),
+        output_mode=configurable.structured_output,
+        stream=configurable.stream_structured_output,
+    )
     agent.set_step_prompt(query_writer_instructions)
-    result = agent.step(
+    prompt_kwargs = dict(
         current_date=get_current_date(),
         research_topic=get_research_topic(state["messages"]),
         number_queries=state["initial_search_query_count"],
     )
+    return agent, prompt_kwargs
+
+
+def _query_update(state: OverallState, agent, result, started) -> QueryGenerationState:
     logging.info("生成查询")
     logging.info(state)
     logging.info(f"查询生成结果: {result}")
-    return {"search_query": result.query}
+    return {
+        "search_query": result.query,
+        "retry_count": agent.retry_stats.retries,
+        "run_started_at": started,
+        "run_id": uuid4().hex,
+        "research_topic": get_research_topic(state["messages"]),
+    }
+
+
+def generate_query(state: OverallState, config: RunnableConfig) -> QueryGenerationState:
+    """
+    基于用户问题生成搜索查询的LangGraph节点
+
+    使用LLM为用户的问题创建优化的网络搜索查询，用于网络研究。
+
+    Args:
+        state: 包含用户问题的当前图状态
+        config: 可运行配置，包括LLM提供商设置
+
+    Returns:
+        包含状态更新的字典，包括search_query键，包含生成的查询
+    """
+    started = time.time()
+    agent, prompt_kwargs = _query_writer(state, config)
+    result = agent.step(**prompt_kwargs)
+    return _query_update(state, agent, result, started)
+
+
+async def agenerate_query(state: OverallState, config: RunnableConfig) -> QueryGenerationState:
+    """generate_query的异步版本，在事件循环中等待LLM响应"""
+    started = time.time()
+    agent, prompt_kwargs = _query_writer(state, config)
+    result = await agent.astep(**prompt_kwargs)
+    return _query_update(state, agent, result, started)
 
 
 def continue_to_web_research(state: QueryGenerationState):
@@ -77,15 +145,228 @@ def continue_to_web_research(state: QueryGenerationState):
     Returns:
         发送到web_research节点的消息列表
     """
+    metrics.FANOUT_WIDTH.observe(len(state["search_query"]), source="generate_query")
     return [
-        Send("web_research", {"search_query": search_query, "id": int(idx)})
+        Send(
+            "web_research",
+            {
+                "search_query": search_query,
+                "id": int(idx),
+                "retry_count": state.get("retry_count", 0),
+                "run_id": state.get("run_id"),
+                "run_started_at": state.get("run_started_at"),
+                "research_topic": state.get("research_topic", ""),
+                "batch": 0,
+                "batch_size": len(state["search_query"]),
+            },
+        )
         for idx, search_query in enumerate(state["search_query"])
     ]
 
 
+def _web_searcher(state: WebSearchState, config: RunnableConfig):
+    """构造web_research节点使用的搜索agent，搜索与摘要共享同一份重试预算"""
+    configurable = Configuration.from_runnable_config(config)
+    budget = _retry_budget(state, configurable)
+    web_searcher = WebSearchAgent(
+        retry_policy=configurable.retry_policy("mcp"),
+        retry_budget=budget,
+        search_cache=configurable.shared_search_cache(),
+        limiter=configurable.rate_limiter("mcp"),
+        hedger=configurable.search_hedger(),
+    )
+    return web_searcher, configurable, budget
+
+
+def _search_results(response):
+    """将搜索结果中的长URL替换为短URL，返回收集到的来源以及交给LLM的搜索结果"""
+    # 长URL到短URL的映射，短URL由长URL哈希得到，在整个运行中保持稳定
+    long2short_url_mappings = resolve_urls(response)
+    sources_gathered = [{"short_url": long2short_url_mappings[item["url"]], "value": item["url"], "label": item["title"]} for item in response]
+    web_search_result = [{"snippet": item["snippet"], "title": item["title"], "url": long2short_url_mappings[item["url"]]} for item in response]
+    return sources_gathered, web_search_result
+
+
+def _ranked_results(state: WebSearchState, configurable: Configuration, web_search_result):
+    """按与搜索主题及研究课题的BM25相关性重排搜索结果，只保留top-k或token预算内的部分交给LLM"""
+    if not configurable.search_rerank:
+        return web_search_result
+    ranked = rank_results(
+        web_search_result,
+        state["search_query"],
+        state.get("research_topic", ""),
+        top_k=configurable.search_top_k,
+        token_budget=configurable.search_result_token_budget,
+    )
+    logging.info(f"搜索结果重排: 保留{len(ranked)}/{len(web_search_result)}条")
+    return ranked
+
+
+def _prompt_results(state: WebSearchState, configurable: Configuration, web_search_result, owner):
+    """去掉本次运行中已经用过的近似重复结果后重排，返回进入提示的搜索结果及其SimHash签名
+
+    检查的同时为本分支（owner）预留留下的结果，同一批并行的分支不会再把同样的结果交给摘要
+    """
+    run_id = state.get("run_id")
+    if not configurable.dedup_results or not run_id:
+        return _ranked_results(state, configurable, web_search_result), []
+    signatures = {id(item): result_signature(item) for item in web_search_result}
+    duplicates = RUN_SIGNATURES.check(
+        run_id, list(signatures.values()), state.get("result_signatures", []), configurable.dedup_max_distance, owner
+    )
+    unique = [item for item, duplicate in zip(web_search_result, duplicates) if not duplicate]
+    if len(unique) < len(web_search_result):
+        logging.info(f"去除近似重复的搜索结果: {len(web_search_result) - len(unique)}条")
+    ranked = _ranked_results(state, configurable, unique) if unique else []
+    kept = [signatures[id(item)] for item in ranked]
+    # 重排时被裁掉的结果没有进入提示，归还给其他分支
+    RUN_SIGNATURES.release(run_id, owner, {signatures[id(item)] for item in unique} - set(kept))
+    return ranked, kept
+
+
+def _release_results(state: WebSearchState, owner):
+    """释放本分支预留的结果签名，失败或被截断丢弃的分支不会挡住其他分支的结果"""
+    if state.get("run_id"):
+        RUN_SIGNATURES.release(state["run_id"], owner)
+
+
+@contextlib.contextmanager
+def _releasing(state: WebSearchState, owner):
+    try:
+        yield
+    except BaseException:
+        _release_results(state, owner)
+        raise
+
+
+def _query_summarizer(configurable: Configuration, budget, query, web_search_result):
+    """构造为单个搜索主题整理摘要的agent以及提示参数"""
+    agent = Agent(
+        model_id=configurable.query_generator_model,
+        retry_policy=configurable.retry_policy("llm"),
+        retry_budget=budget,
+        cache=configurable.response_cache(),
+        limiter=configurable.rate_limiter("llm", configurable.query_generator_model),
+        router=configurable.model_router("summary", configurable.query_generator_model),
+    )
+    agent.set_step_prompt(web_searcher_instructions)
+    web_search_result = compact_json(web_search_result)
+    prompt_kwargs = dict(query=query, current_date=get_current_date(), web_search_result=web_search_result)
+    return agent, prompt_kwargs
+
+
+def _web_summarizer(state: WebSearchState, configurable: Configuration, budget, response, owner):
+    """将搜索结果整理为摘要提示，返回agent、提示参数、收集到的来源以及结果签名
+
+    所有结果都全部重复时不需要再摘要，agent与提示参数为None
+    """
+    # 所有来源都保留在sources_gathered中用于引用，只有去重、重排后的结果进入提示
+    sources_gathered, web_search_result = _search_results(response)
+    web_search_result, signatures = _prompt_results(state, configurable, web_search_result, owner)
+    if not web_search_result:
+        return None, None, sources_gathered, signatures
+    agent, prompt_kwargs = _query_summarizer(configurable, budget, state["search_query"], web_search_result)
+    return agent, prompt_kwargs, sources_gathered, signatures
+
+
+def _web_research_update(state: WebSearchState, web_searcher, budget, sources_gathered, signatures, modified_text) -> OverallState:
+    logging.info("网络搜索")
+    logging.info(f"搜索标题: {state['search_query']}")
+    if web_searcher.search_cache is not None:
+        logging.info(f"搜索缓存统计: {web_searcher.search_cache.stats()}")
+    update = {
+        "sources_gathered": sources_gathered,
+        "url_registry": {source["short_url"]: source["value"] for source in sources_gathered},
+        "search_query": [state["search_query"]],
+        "result_signatures": signatures,
+        "retry_count": budget.used,
+    }
+    if modified_text is None:
+        logging.info("搜索结果均已在本次运行中用过，跳过摘要")
+        return update
+    modified_text = Post.extract_pattern(modified_text, pattern="text")
+    logging.info(f"网络搜索结果: {modified_text}")
+    return {**update, "web_research_result": [modified_text]}
+
+
+def _pending_update(state: WebSearchState, configurable: Configuration, budget, response, owner) -> OverallState:
+    # 批量摘要模式：只保存搜索结果，由summarize_research统一整理
+    sources_gathered, web_search_result = _search_results(response)
+    web_search_result, signatures = _prompt_results(state, configurable, web_search_result, owner)
+    logging.info(f"网络搜索(待批量摘要): {state['search_query']}")
+    pending = [{"id": state["id"], "search_query": state["search_query"], "results": web_search_result}]
+    return {
+        "sources_gathered": sources_gathered,
+        "url_registry": {source["short_url"]: source["value"] for source in sources_gathered},
+        "search_query": [state["search_query"]],
+        "pending_searches": pending if web_search_result else [],
+        "result_signatures": signatures,
+        "retry_count": budget.used,
+    }
+
+
+def _research(state: WebSearchState, config: RunnableConfig, owner) -> OverallState:
+    web_searcher, configurable, budget = _web_searcher(state, config)
+    with _releasing(state, owner):
+        # 执行搜索
+        response = web_searcher.step(prompt=state["search_query"],
+                                     count=10)
+        if configurable.batch_summarization:
+            return _pending_update(state, configurable, budget, response, owner)
+        agent, prompt_kwargs, sources_gathered, signatures = _web_summarizer(state, configurable, budget, response, owner)
+        modified_text = agent.step(**prompt_kwargs) if agent is not None else None
+    return _web_research_update(state, web_searcher, budget, sources_gathered, signatures, modified_text)
+
+
+async def _aresearch(state: WebSearchState, config: RunnableConfig, owner) -> OverallState:
+    web_searcher, configurable, budget = _web_searcher(state, config)
+    with _releasing(state, owner):
+        response = await web_searcher.astep(prompt=state["search_query"],
+                                            count=10)
+        if configurable.batch_summarization:
+            return _pending_update(state, configurable, budget, response, owner)
+        agent, prompt_kwargs, sources_gathered, signatures = _web_summarizer(state, configurable, budget, response, owner)
+        modified_text = await agent.astep(**prompt_kwargs) if agent is not None else None
+    return _web_research_update(state, web_searcher, budget, sources_gathered, signatures, modified_text)
+
+
+def _branch(state: WebSearchState, config: RunnableConfig):
+    """本分支在quorum join中的句柄，未配置quorum与截止时间时返回None"""
+    configurable = Configuration.from_runnable_config(config)
+    return join_branch(
+        state.get("run_id"),
+        state.get("batch", 0),
+        state.get("batch_size", 1),
+        configurable.join_quorum,
+        configurable.branch_deadline_seconds,
+        configurable.late_result_policy,
+    )
+
+
+def _straggler_update(state: WebSearchState, branch) -> OverallState:
+    # 被截断的分支仍然计入search_query，保证后续查询的id不会重复
+    logging.warning(f"搜索分支被截断: {state['search_query']} (迟到结果策略: {branch.policy})")
+    return {
+        "search_query": [state["search_query"]],
+        "straggler_log": [
+            {
+                "id": state["id"],
+                "search_query": state["search_query"],
+                "batch": state.get("batch", 0),
+                "event": "cut",
+                "policy": branch.policy,
+            }
+        ],
+    }
+
+
 def web_research(state: WebSearchState, config: RunnableConfig) -> OverallState:
     """
     使用web search agent执行网络搜索的LangGraph节点
+
+    配置了join_quorum或branch_deadline_seconds时，同一批分支中已完成的数量达到quorum，
+    或本分支超过截止时间后，本分支立即返回，reflection无需等待最慢的分支。
+
     Args:
         state: 包含搜索查询和研究循环计数的当前图状态
         config: 可运行配置，包括搜索API设置
@@ -93,73 +374,350 @@ def web_research(state: WebSearchState, config: RunnableConfig) -> OverallState:
     Returns:
         包含状态更新的字典，包括sources_gathered、research_loop_count和web_research_results
     """
-    # 配置
-    configurable = Configuration.from_runnable_config(config)
-    # 使用google genai客户端，因为langchain客户端不返回基础元数据
-    web_searcher = WebSearchAgent()
-
-    # 执行搜索
-    response = web_searcher.step(prompt=state["search_query"],
-                                 count=10)
-    # 长URL到短URL的映射
-    long2short_url_mappings = resolve_urls(response, state["id"])
-    sources_gathered = [{"short_url": long2short_url_mappings[item["url"]], "value": item["url"], "label": item["title"]} for item in response]
-    web_search_result = [{"snippet": item["snippet"], "title": item["title"], "url": long2short_url_mappings[item["url"]]} for item in response]
-    web_search_result = json.dumps(web_search_result, ensure_ascii=False, indent=4)
+    # 本次执行预留结果签名时使用的标识
+    owner = uuid4().hex
+    branch = _branch(state, config)
+    if branch is None:
+        return _research(state, config, owner)
+    finished, update = branch.run(
+        lambda: _research(state, config, owner), on_discard=lambda: _release_results(state, owner)
+    )
+    return update if finished else _straggler_update(state, branch)
 
-    agent = Agent(model_id=configurable.query_generator_model)
-    agent.set_step_prompt(web_searcher_instructions)
-    modified_text = agent.step(query=state["search_query"], current_date=get_current_date(), web_search_result=web_search_result)
-    modified_text = Post.extract_pattern(modified_text, pattern="text")
-    logging.info(f"网络搜索")
-    logging.info(f"搜索标题: {state['search_query']}")
-    logging.info(f"网络搜索结果: {modified_text}")
+
+async def aweb_research(state: WebSearchState, config: RunnableConfig) -> OverallState:
+    """web_research的异步版本，并行的搜索分支共享同一个事件循环"""
+    owner = uuid4().hex
+    branch = _branch(state, config)
+    if branch is None:
+        return await _aresearch(state, config, owner)
+    finished, update = await branch.arun(
+        lambda: _aresearch(state, config, owner), on_discard=lambda: _release_results(state, owner)
+    )
+    return update if finished else _straggler_update(state, branch)
+
+
+def _late_usage(late):
+    """被截断的分支在截断之后的用量，不论结果合并还是丢弃都计入本次运行"""
+    usage = {"llm_calls": 0, "llm_tokens": 0, "search_calls": 0, "served_models": []}
+    for _, branch_usage in late:
+        for key, value in branch_usage.items():
+            usage[key] += value
+    return usage
+
+
+def _merge_late_results(state: OverallState):
+    """把被截断后才到达的分支结果并入本轮反思，返回新的state以及需要写回的状态更新"""
+    late = LATE_RESULTS.drain(state["run_id"]) if state.get("run_id") else []
+    if not late:
+        return state, {}
+    update = {
+        "web_research_result": [],
+        "pending_searches": [],
+        "sources_gathered": [],
+        "url_registry": {},
+        "result_signatures": [],
+        "retry_count": 0,
+        "straggler_log": [],
+        **_late_usage(late),
+    }
+    results = [result for result, _ in late if result is not None]
+    for result in results:
+        # 批量摘要模式下迟到的是尚未摘要的搜索结果，交给下一轮的summarize_research
+        update["web_research_result"] += result.get("web_research_result", [])
+        update["pending_searches"] += result.get("pending_searches", [])
+        update["sources_gathered"] += result["sources_gathered"]
+        update["url_registry"].update(result["url_registry"])
+        update["result_signatures"] += result.get("result_signatures", [])
+        update["retry_count"] += result["retry_count"]
+        update["straggler_log"].append({"search_query": result["search_query"][0], "event": "merged"})
+    if results:
+        logging.info(f"合并{len(results)}个迟到的搜索分支结果")
+    state = {
+        **state,
+        "web_research_result": state["web_research_result"] + update["web_research_result"],
+        **{key: state.get(key, 0) + update[key] for key in ("llm_calls", "llm_tokens", "search_calls")},
+    }
+    return state, update
+
+
+def _batch_summarizer(configurable: Configuration, budget, pending):
+    """构造一次整理所有搜索主题的agent以及提示参数，提示超出token预算时返回(None, None)"""
+    searches = "\n\n".join(
+        f"## 搜索主题 {item['id']}: {item['search_query']}\n```json\n"
+        f"{compact_json(item['results'])}\n```"
+        for item in pending
+    )
+    prompt_kwargs = dict(current_date=get_current_date(), searches=searches)
+    tokens = estimate_tokens(batch_web_searcher_instructions.render(prompt_kwargs))
+    if tokens > configurable.batch_summary_token_budget:
+        logging.info(f"批量摘要提示约{tokens}个token，超出预算，改为逐个搜索主题摘要")
+        return None, None
+    agent = JsonAgent(
+        model_id=configurable.query_generator_model,
+        keys=BatchSummaries,
+        retry_policy=configurable.retry_policy("llm"),
+        retry_budget=budget,
+        cache=configurable.response_cache(),
+        limiter=configurable.rate_limiter("llm", configurable.query_generator_model),
+        router=configurable.model_router("summary", configurable.query_generator_model),
+        output_mode=configurable.structured_output,
+        stream=configurable.stream_structured_output,
+    )
+    agent.set_step_prompt(batch_web_searcher_instructions)
+    return agent, prompt_kwargs
+
+
+def _batch_summaries(pending, result):
+    """取出批量摘要中属于pending的非空摘要；批量调用失败时返回空字典"""
+    if not isinstance(result, BatchSummaries):
+        return {}
+    ids = {item["id"] for item in pending}
+    return {item.id: item.summary for item in result.summaries if item.id in ids and item.summary.strip()}
+
+
+def _summarize_update(pending, summaries, budget):
+    missing = len(pending) - len(summaries)
+    logging.info(f"批量摘要: {len(pending)}个搜索主题，{missing}个回退为单独摘要")
     return {
-        "sources_gathered": sources_gathered,
-        "search_query": [state["search_query"]],
-        "web_research_result": [modified_text],
+        "web_research_result": [summaries[item["id"]] for item in pending],
+        "pending_searches": None,
+        "retry_count": budget.used,
     }
 
 
-def reflection(state: OverallState, config: RunnableConfig) -> ReflectionState:
+def _fallback_summary(configurable: Configuration, budget, item):
+    agent, prompt_kwargs = _query_summarizer(configurable, budget, item["search_query"], item["results"])
+    return Post.extract_pattern(agent.step(**prompt_kwargs), pattern="text")
+
+
+async def _afallback_summary(configurable: Configuration, budget, item):
+    agent, prompt_kwargs = _query_summarizer(configurable, budget, item["search_query"], item["results"])
+    return Post.extract_pattern(await agent.astep(**prompt_kwargs), pattern="text")
+
+
+def summarize_research(state: OverallState, config: RunnableConfig) -> OverallState:
     """
-    识别知识差距并生成潜在后续查询的LangGraph节点
+    批量摘要模式下整理本轮所有搜索结果的LangGraph节点
 
-    分析当前摘要以识别需要进一步研究的领域，并生成潜在的后续查询。
-    使用结构化输出来提取JSON格式的后续查询。
+    用一次结构化的LLM调用为每个搜索主题生成摘要；批量调用失败、漏掉部分搜索主题
+    或提示超出token预算时，对缺失的搜索主题回退为逐个调用。未开启批量摘要时不做任何事。
 
     Args:
-        state: 包含运行摘要和研究主题的当前图状态
-        config: 可运行配置，包括LLM提供商设置
+        state: 包含待摘要搜索结果pending_searches的当前图状态
+        config: 可运行配置，包括batch_summarization设置
 
     Returns:
-        包含状态更新的字典，包括search_query键，包含生成的后续查询
+        包含状态更新的字典，包括web_research_result，并清空pending_searches
     """
+    pending = sorted(state.get("pending_searches") or [], key=lambda item: item["id"])
+    if not pending:
+        return {}
+    configurable = Configuration.from_runnable_config(config)
+    budget = _retry_budget(state, configurable)
+    agent, prompt_kwargs = _batch_summarizer(configurable, budget, pending)
+    summaries = _batch_summaries(pending, agent.step(**prompt_kwargs)) if agent is not None else {}
+    missing = [item for item in pending if item["id"] not in summaries]
+    if missing:
+        # 每个任务在复制的上下文中运行，线程中的调用同样计入本节点的UsageMeter
+        with ThreadPoolExecutor(max_workers=len(missing)) as executor:
+            futures = [
+                executor.submit(contextvars.copy_context().run, _fallback_summary, configurable, budget, item)
+                for item in missing
+            ]
+            summaries.update((item["id"], future.result()) for item, future in zip(missing, futures))
+    return _summarize_update(pending, summaries, budget)
+
+
+async def asummarize_research(state: OverallState, config: RunnableConfig) -> OverallState:
+    """summarize_research的异步版本，回退的单独摘要并发执行"""
+    pending = sorted(state.get("pending_searches") or [], key=lambda item: item["id"])
+    if not pending:
+        return {}
+    configurable = Configuration.from_runnable_config(config)
+    budget = _retry_budget(state, configurable)
+    agent, prompt_kwargs = _batch_summarizer(configurable, budget, pending)
+    summaries = _batch_summaries(pending, await agent.astep(**prompt_kwargs)) if agent is not None else {}
+    missing = [item for item in pending if item["id"] not in summaries]
+    texts = await asyncio.gather(*(_afallback_summary(configurable, budget, item) for item in missing))
+    summaries.update(zip([item["id"] for item in missing], texts))
+    return _summarize_update(pending, summaries, budget)
+
+
+def _packed_summaries(state: OverallState, configurable: Configuration, model_id, research_topic, indices=None):
+    """在模型的token预算内挑选去重后与研究主题最相关的摘要，indices为None时从所有摘要中挑选"""
+    results = state["web_research_result"]
+    packed, report = pack_evidence(
+        results if indices is None else [results[idx] for idx in indices],
+        research_topic,
+        configurable.evidence_budget(model_id),
+    )
+    if report["dropped_duplicates"] or report["dropped_over_budget"]:
+        logging.info(f"摘要打包丢弃: {report}")
+    return packed, report
+
+
+def _unreflected(state: OverallState):
+    """增量反思需要发送的摘要下标：上一轮因超出预算没有进入知识摘要的，以及上一轮之后新增的"""
+    return state.get("reflection_backlog", []) + list(range(state.get("reflected_count", 0), len(state["web_research_result"])))
+
+
+def _reflector(state: OverallState, config: RunnableConfig):
+    """构造reflection节点使用的agent以及提示参数"""
     configurable = Configuration.from_runnable_config(config)
     # 增加研究循环计数并获取推理模型
     state["research_loop_count"] = state.get("research_loop_count", 0) + 1
     reasoning_model = state.get("reasoning_model", configurable.reflection_model)
 
     # 格式化提示
-    agent = JsonAgent(model_id=reasoning_model, keys=Reflection)
-    agent.set_step_prompt(reflection_instructions)
-    result = agent.step(
+    agent = JsonAgent(
+        model_id=reasoning_model,
+        keys=Reflection,
+        retry_policy=configurable.retry_policy("llm"),
+        retry_budget=_retry_budget(state, configurable),
+        cache=configurable.response_cache(),
+        limiter=configurable.rate_limiter("llm", reasoning_model),
+        router=configurable.model_router("reflection", reasoning_model),
+        output_mode=configurable.structured_output,
+        stream=configurable.stream_structured_output,
+    )
+    research_topic = get_research_topic(state["messages"])
+    prompt_kwargs = dict(
         current_date=get_current_date(),
         number_queries=state["initial_search_query_count"],
-        research_topic=get_research_topic(state["messages"]),
-        summaries="\n\n---\n\n".join(state["web_research_result"]),
+        research_topic=research_topic,
+    )
+    if configurable.incremental_reflection:
+        # 增量模式：只发送知识摘要以及尚未进入过知识摘要的搜索结果
+        agent.set_step_prompt(incremental_reflection_instructions)
+        indices = _unreflected(state)
+        prompt_kwargs["knowledge_digest"] = state.get("knowledge_digest", "")
+    else:
+        agent.set_step_prompt(reflection_instructions)
+        indices = None
+    summaries, report = _packed_summaries(state, configurable, reasoning_model, research_topic, indices)
+    prompt_kwargs["summaries"] = "\n\n---\n\n".join(summaries)
+    return agent, prompt_kwargs, report
+
+
+def _new_follow_ups(state: OverallState, config: RunnableConfig, follow_up_queries):
+    """去掉与本次运行中已经搜索过的查询（或同一批中更靠前的查询）近似重复的后续查询"""
+    configurable = Configuration.from_runnable_config(config)
+    if not configurable.query_dedup:
+        return follow_up_queries
+    index = QueryIndex(
+        state.get("search_query", []),
+        threshold=configurable.query_dedup_threshold,
+        embedder=load_embedder(configurable.query_embedder) if configurable.query_embedder else None,
+        embedding_threshold=configurable.query_embedding_threshold,
     )
+    kept, dropped = index.filter(follow_up_queries)
+    if dropped:
+        metrics.FOLLOW_UPS_DROPPED.inc(len(dropped))
+        logging.info(f"去除已覆盖的后续查询: {dropped}")
+    return kept
+
+
+def _budget_stop(state: OverallState, configurable: Configuration, result, follow_up_queries):
+    """运行预算让本轮提前结束或截断了后续查询时返回记录，否则返回None
 
+    记录写入state的budget_stops，调用方据此区分因预算截断的报告；evaluate_research按记录路由。
+    """
+    max_research_loops = state.get("max_research_loops")
+    if max_research_loops is None:
+        max_research_loops = configurable.max_research_loops
+    if result.is_sufficient or state["research_loop_count"] >= max_research_loops or not follow_up_queries:
+        return None
+    # 反思节点自身的调用还没有写回state
+    meter = current_meter()
+    unreported = meter.unreported() if meter is not None else {}
+    usage = {**state, **{key: state.get(key, 0) + value for key, value in unreported.items()}}
+    budget = configurable.run_budget()
+    exhausted = budget.exhausted(usage)
+    if exhausted:
+        # 预算即将用完，用已有的证据直接生成答案
+        logging.warning(f"运行预算即将用完: {exhausted}，提前生成答案")
+        for limit in exhausted:
+            metrics.BUDGET_EXHAUSTED.inc(limit=limit)
+        return {
+            "research_loop_count": state["research_loop_count"],
+            "limits": exhausted,
+            "dropped_queries": follow_up_queries,
+            "finalized": True,
+        }
+    search_calls_left = budget.search_calls_left(usage)
+    if search_calls_left is None or search_calls_left >= len(follow_up_queries):
+        return None
+    logging.warning(f"搜索次数预算只够{search_calls_left}/{len(follow_up_queries)}个后续查询")
+    return {
+        "research_loop_count": state["research_loop_count"],
+        "limits": ["max_search_calls"],
+        "dropped_queries": follow_up_queries[search_calls_left:],
+        "finalized": search_calls_left == 0,
+    }
+
+
+def _reflection_update(state: OverallState, config: RunnableConfig, agent, report, result, follow_up_queries) -> ReflectionState:
+    configurable = Configuration.from_runnable_config(config)
     logging.info("反思分析")
     logging.info(result)
-    return {
+    update = {
         "is_sufficient": result.is_sufficient,
         "knowledge_gap": result.knowledge_gap,
-        "follow_up_queries": result.follow_up_queries,
+        "follow_up_queries": follow_up_queries,
         "research_loop_count": state["research_loop_count"],
         "number_of_ran_queries": len(state["search_query"]),
         "max_research_loops": state.get("max_research_loops", configurable.max_research_loops),
+        "retry_count": agent.retry_stats.retries,
+        "evidence_report": report,
     }
+    if configurable.incremental_reflection:
+        # 推进游标，下一轮只需要反思之后新增的搜索结果；超出预算的摘要没有进入知识摘要，留到下一轮
+        indices = _unreflected(state)
+        update["knowledge_digest"] = result.knowledge_digest or state.get("knowledge_digest", "")
+        update["reflected_count"] = len(state["web_research_result"])
+        update["reflection_backlog"] = [indices[idx] for idx in report["dropped_over_budget"]]
+    stop = _budget_stop(state, configurable, result, follow_up_queries)
+    if stop is not None:
+        update["budget_stops"] = [stop]
+    return update
+
+
+def _merge_updates(update, late):
+    if late:
+        update = {**late, **update, "retry_count": update["retry_count"] + late["retry_count"]}
+    return update
+
+
+def reflection(state: OverallState, config: RunnableConfig) -> ReflectionState:
+    """
+    识别知识差距并生成潜在后续查询的LangGraph节点
+
+    分析当前摘要以识别需要进一步研究的领域，并生成潜在的后续查询。
+    使用结构化输出来提取JSON格式的后续查询。
+
+    Args:
+        state: 包含运行摘要和研究主题的当前图状态
+        config: 可运行配置，包括LLM提供商设置
+
+    Returns:
+        包含状态更新的字典，包括search_query键，包含生成的后续查询
+    """
+    state, late = _merge_late_results(state)
+    agent, prompt_kwargs, report = _reflector(state, config)
+    result = agent.step(**prompt_kwargs)
+    follow_up_queries = _new_follow_ups(state, config, result.follow_up_queries)
+    return _merge_updates(_reflection_update(state, config, agent, report, result, follow_up_queries), late)
+
+
+async def areflection(state: OverallState, config: RunnableConfig) -> ReflectionState:
+    """reflection的异步版本"""
+    state, late = _merge_late_results(state)
+    agent, prompt_kwargs, report = _reflector(state, config)
+    result = await agent.astep(**prompt_kwargs)
+    # 配置了embedder时比较查询需要调用外部模型，放到线程中执行
+    follow_up_queries = await asyncio.to_thread(_new_follow_ups, state, config, result.follow_up_queries)
+    return _merge_updates(_reflection_update(state, config, agent, report, result, follow_up_queries), late)
 
 
 def evaluate_research(
@@ -189,19 +747,103 @@ def evaluate_research(
     logging.info(state)
     logging.info(f"最大研究循环数: {max_research_loops}")
     logging.info(f"研究循环计数: {state['research_loop_count']}")
-    if state["is_sufficient"] or state["research_loop_count"] >= max_research_loops:
+    # follow_up_queries会累加历次反思的结果，只发送尚未搜索过的查询
+    ran = {normalize_query(query) for query in state.get("search_query", [])}
+    follow_up_queries = [query for query in state["follow_up_queries"] if normalize_query(query) not in ran]
+    if state["is_sufficient"] or state["research_loop_count"] >= max_research_loops or not follow_up_queries:
         return "finalize_answer"
-    else:
-        return [
-            Send(
-                "web_research",
-                {
-                    "search_query": follow_up_query,
-                    "id": state["number_of_ran_queries"] + int(idx),
-                },
-            )
-            for idx, follow_up_query in enumerate(state["follow_up_queries"])
+    # 预算检查在reflection中完成并记录在budget_stops中，这里按记录路由
+    stop = next(
+        (stop for stop in state.get("budget_stops", []) if stop["research_loop_count"] == state["research_loop_count"]),
+        None,
+    )
+    if stop is not None:
+        if stop["finalized"]:
+            return "finalize_answer"
+        follow_up_queries = [query for query in follow_up_queries if query not in stop["dropped_queries"]]
+    # 较早轮次中没有发送的查询同样受搜索次数预算的限制
+    search_calls_left = configurable.run_budget().search_calls_left(state)
+    if search_calls_left is not None:
+        follow_up_queries = follow_up_queries[:search_calls_left]
+        if not follow_up_queries:
+            return "finalize_answer"
+    metrics.FANOUT_WIDTH.observe(len(follow_up_queries), source="reflection")
+    return [
+        Send(
+            "web_research",
+            {
+                "search_query": follow_up_query,
+                "id": state["number_of_ran_queries"] + int(idx),
+                "retry_count": state.get("retry_count", 0),
+                "run_id": state.get("run_id"),
+                "run_started_at": state.get("run_started_at"),
+                "research_topic": state.get("research_topic", ""),
+                "result_signatures": state.get("result_signatures", []),
+                "batch": state["research_loop_count"],
+                "batch_size": len(follow_up_queries),
+            },
+        )
+        for idx, follow_up_query in enumerate(follow_up_queries)
+    ]
+
+
+def _answer_writer(state: OverallState, config: RunnableConfig):
+    """构造finalize_answer节点使用的agent以及提示参数"""
+    configurable = Configuration.from_runnable_config(config)
+    reasoning_model = state.get("reasoning_model") or configurable.answer_model
+
+    # 格式化提示
+    agent = Agent(
+        model_id=reasoning_model,
+        retry_policy=configurable.retry_policy("llm"),
+        retry_budget=_retry_budget(state, configurable),
+        cache=configurable.response_cache(),
+        limiter=configurable.rate_limiter("llm", reasoning_model),
+        router=configurable.model_router("answer", reasoning_model),
+    )
+    agent.set_step_prompt(answer_instructions)
+    research_topic = get_research_topic(state["messages"])
+    summaries, report = _packed_summaries(state, configurable, reasoning_model, research_topic)
+    prompt_kwargs = dict(
+        current_date=get_current_date(),
+        research_topic=research_topic,
+        summaries="\n---\n\n".join(summaries),
+    )
+    return agent, prompt_kwargs, configurable, report
+
+
+def _url_registry(state: OverallState):
+    """短URL到长URL的映射，兼容没有url_registry的旧状态"""
+    if state.get("url_registry"):
+        return state["url_registry"]
+    return {source["short_url"]: source["value"] for source in state.get("sources_gathered", [])}
+
+
+def _answer_update(state: OverallState, agent, report, rewriter, message):
+    # sources_gathered只保留答案中实际引用的来源
+    unique_sources = [source for source in state["sources_gathered"] if source["short_url"] in rewriter.used]
+
+    logging.info("最终确定答案")
+    logging.info(message.content)
+    # 记录实际生成答案的模型（配置了模型梯队时可能是备用模型）
+    message.response_metadata["model_name"] = getattr(agent.llm, "served_model", None) or agent.llm.model_id
+    logging.info(f"本次运行累计重试次数: {state.get('retry_count', 0) + agent.retry_stats.retries}")
+    if state.get("run_started_at"):
+        metrics.RUN_DURATION.observe(time.time() - state["run_started_at"])
+    update = {
+        "messages": [message],
+        "sources_gathered": {"replace": unique_sources},
+        "retry_count": agent.retry_stats.retries,
+        "evidence_report": report,
+    }
+    # 最后一轮反思之后才到达的结果已无法使用
+    late = LATE_RESULTS.drain(state["run_id"]) if state.get("run_id") else []
+    if late:
+        update.update(_late_usage(late))
+        update["straggler_log"] = [
+            {"search_query": result["search_query"][0], "event": "dropped"} for result, _ in late if result is not None
         ]
+    return update
 
 
 def finalize_answer(state: OverallState, config: RunnableConfig):
@@ -217,43 +859,112 @@ def finalize_answer(state: OverallState, config: RunnableConfig):
     Returns:
         包含状态更新的字典，包括running_summary键，包含格式化的最终摘要和源
     """
+    agent, prompt_kwargs, configurable, report = _answer_writer(state, config)
+    # 用原始URL替换短URL
+    rewriter = CitationRewriter(_url_registry(state))
+    if not configurable.stream_answer:
+        content = rewriter.rewrite(agent.step(**prompt_kwargs))
+        return _answer_update(state, agent, report, rewriter, AIMessage(content=content))
+
+    # 流式生成：每个chunk改写URL后立即通过messages流模式发给客户端
+    step_prompt = agent.prompt_format(agent.step_prompt, **prompt_kwargs)
+    streamer = MessageStreamer(config, agent.llm.model_id, step_prompt)
+    content = ""
+    for chunk in agent.stream_prompt(step_prompt):
+        text = rewriter.feed(chunk)
+        streamer.token(text)
+        content += text
+    text = rewriter.flush()
+    streamer.token(text)
+    content += text
+    return _answer_update(state, agent, report, rewriter, streamer.end(content))
+
+
+async def afinalize_answer(state: OverallState, config: RunnableConfig):
+    """finalize_answer的异步版本"""
+    agent, prompt_kwargs, configurable, report = _answer_writer(state, config)
+    rewriter = CitationRewriter(_url_registry(state))
+    if not configurable.stream_answer:
+        content = rewriter.rewrite(await agent.astep(**prompt_kwargs))
+        return _answer_update(state, agent, report, rewriter, AIMessage(content=content))
+
+    step_prompt = agent.prompt_format(agent.step_prompt, **prompt_kwargs)
+    streamer = AsyncMessageStreamer(config, agent.llm.model_id, step_prompt)
+    await streamer.start()
+    content = ""
+    async for chunk in agent.astream_prompt(step_prompt):
+        text = rewriter.feed(chunk)
+        await streamer.token(text)
+        content += text
+    text = rewriter.flush()
+    await streamer.token(text)
+    content += text
+    return _answer_update(state, agent, report, rewriter, await streamer.end(content))
+
+
+def _usage_meter(state, config: RunnableConfig, node) -> UsageMeter:
+    """节点执行期间的用量计数器，带上本次运行的截止时间"""
     configurable = Configuration.from_runnable_config(config)
-    reasoning_model = state.get("reasoning_model") or configurable.answer_model
+    # generate_query执行时运行才刚开始，state中还没有run_started_at
+    started_at = state.get("run_started_at") or time.time()
+    return UsageMeter(configurable.run_budget().deadline(started_at), configurable.min_request_timeout, node)
 
-    # 格式化提示
-    agent = Agent(model_id=reasoning_model)
-    agent.set_step_prompt(answer_instructions)
-    content = agent.step(
-        current_date=get_current_date(),
-        research_topic=get_research_topic(state["messages"]),
-        summaries="\n---\n\n".join(state["web_research_result"]),
-    )
-
-    # 用原始URL替换短URL，并将所有使用的URL添加到sources_gathered
-    unique_sources = []
-    for source in state["sources_gathered"]:
-        if source["short_url"] in content:
-            content= content.replace(
-                source["short_url"], source["value"]
-            )
-            unique_sources.append(source)
 
-    logging.info("最终确定答案")
-    logging.info(content)
+def _with_usage(update, meter):
+    if not isinstance(update, dict):
+        return update
+    usage = meter.update()
+    served_models = update.get("served_models", []) + usage.pop("served_models")
     return {
-        "messages": [AIMessage(content=content)],
-        "sources_gathered": unique_sources,
+        **update,
+        **{key: update.get(key, 0) + value for key, value in usage.items()},
+        **({"served_models": served_models} if served_models else {}),
     }
 
 
+def _metered(func, name):
+    """统计节点内的LLM与搜索调用，作为状态更新累加到本次运行的用量中"""
+
+    @functools.wraps(func)
+    def wrapper(state, config):
+        meter = _usage_meter(state, config, name)
+        with meter.active():
+            update = func(state, config)
+        return _with_usage(update, meter)
+
+    return wrapper
+
+
+def _ametered(afunc, name):
+    @functools.wraps(afunc)
+    async def wrapper(state, config):
+        meter = _usage_meter(state, config, name)
+        with meter.active():
+            update = await afunc(state, config)
+        return _with_usage(update, meter)
+
+    return wrapper
+
+
+def _node(func, afunc):
+    """同时注册同步与异步实现：invoke/stream走同步路径，ainvoke/astream走异步路径，两者都记录耗时指标与运行用量"""
+    name = func.__name__
+    return RunnableLambda(
+        metrics.timed_node(name, _metered(func, name)),
+        afunc=metrics.atimed_node(name, _ametered(afunc, name)),
+        name=name,
+    )
+
+
 # 创建我们的代理图
 builder = StateGraph(OverallState, config_schema=Configuration)
 
 # 定义我们将在其间循环的节点
-builder.add_node("generate_query", generate_query)
-builder.add_node("web_research", web_research)
-builder.add_node("reflection", reflection)
-builder.add_node("finalize_answer", finalize_answer)
+builder.add_node("generate_query", _node(generate_query, agenerate_query))
+builder.add_node("web_research", _node(web_research, aweb_research))
+builder.add_node("summarize_research", _node(summarize_research, asummarize_research))
+builder.add_node("reflection", _node(reflection, areflection))
+builder.add_node("finalize_answer", _node(finalize_answer, afinalize_answer))
 
 # 将入口点设置为`generate_query`
 # 这意味着这个节点是第一个被调用的
@@ -262,8 +973,10 @@ builder.add_edge(START, "generate_query")
 builder.add_conditional_edges(
     "generate_query", continue_to_web_research, ["web_research"]
 )
+# 批量摘要模式下统一整理本轮的搜索结果，否则直接跳过
+builder.add_edge("web_research", "summarize_research")
 # 对网络研究进行反思
-builder.add_edge("web_research", "reflection")
+builder.add_edge("summarize_research", "reflection")
 # 评估研究
 builder.add_conditional_edges(
     "reflection", evaluate_research, ["web_research", "finalize_answer"]
@@ -271,5 +984,12 @@ builder.add_conditional_edges(
 # 最终确定答案
 builder.add_edge("finalize_answer", END)
 
-# 编译图
-graph = builder.compile(name="pro-search-agent")
+
+
+def build_graph(checkpointer=None):
+    """编译图；传入checkpointer（如agent.checkpoint.sqlite_checkpointer）后每个super-step都会持久化，中断的线程可以续跑"""
+    return builder.compile(name="pro-search-agent", checkpointer=checkpointer)
+
+
+# 编译图；langgraph服务端会自带持久化，这里不设置checkpointer
+graph = build_graph()
@@ -0,0 +1,171 @@
+import asyncio
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+
+from agent import metrics
+
+
+class LatencyTracker:
+    """Rolling window of recent call latencies."""
+
+    def __init__(self, window=200, min_samples=20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency):
+        with self._lock:
+            self._samples.append(latency)
+
+    def percentile(self, q):
+        """Return the q-quantile of the window, or None until min_samples calls were seen."""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class HedgeBudget:
+    """Caps backup requests at a share of all requests.
+
+    Every request earns ``ratio`` of a token and every hedge spends a whole
+    one, so over time at most ``ratio`` of the calls are duplicated.
+    ``max_tokens`` bounds how many hedges a quiet period can save up.
+    """
+
+    def __init__(self, ratio=0.05, max_tokens=10.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = 0.0
+        self._lock = threading.Lock()
+
+    def earn(self):
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def spend(self):
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+def _spawn(fn, *args):
+    """Run fn in a daemon thread and return a Future for its result."""
+    future = Future()
+    context = contextvars.copy_context()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=context.run, args=(run,), daemon=True).start()
+    return future
+
+
+class Hedger:
+    """Issue one backup request when a call outlives the tracked latency percentile.
+
+    Whichever request succeeds first wins and the other is cancelled. An
+    asyncio task is cancelled outright; a blocking call that is already
+    running cannot be interrupted, so its result is simply dropped.
+    """
+
+    def __init__(self, name, percentile=0.9, budget_ratio=0.05, min_samples=20):
+        self.name = name
+        self.percentile = percentile
+        self.tracker = LatencyTracker(min_samples=min_samples)
+        self.budget = HedgeBudget(budget_ratio)
+
+    def delay(self):
+        """Seconds to wait for the primary request before hedging, or None to never hedge."""
+        self.budget.earn()
+        return self.tracker.percentile(self.percentile)
+
+    def _timed(self, fn, *args):
+        started = time.perf_counter()
+        result = fn(*args)
+        self.tracker.record(time.perf_counter() - started)
+        return result
+
+    async def _atimed(self, afn, *args):
+        started = time.perf_counter()
+        result = await afn(*args)
+        self.tracker.record(time.perf_counter() - started)
+        return result
+
+    def call(self, fn, *args):
+        delay = self.delay()
+        if delay is None:
+            return self._timed(fn, *args)
+        primary = _spawn(self._timed, fn, *args)
+        done, pending = wait({primary}, timeout=delay)
+        if pending and self.budget.spend():
+            metrics.SEARCH_HEDGES.inc(outcome="issued")
+            backup = _spawn(self._timed, fn, *args)
+            pending.add(backup)
+        else:
+            backup = None
+        while True:
+            for future in done:
+                if future.exception() is None:
+                    for loser in pending:
+                        loser.cancel()
+                    if future is backup:
+                        metrics.SEARCH_HEDGES.inc(outcome="won")
+                    return future.result()
+            if not pending:
+                # 两个请求都失败时抛出主请求的错误，与不对冲时的行为一致
+                raise primary.exception()
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+    async def acall(self, afn, *args):
+        delay = self.delay()
+        if delay is None:
+            return await self._atimed(afn, *args)
+        primary = asyncio.ensure_future(self._atimed(afn, *args))
+        done, pending = await asyncio.wait({primary}, timeout=delay)
+        if pending and self.budget.spend():
+            metrics.SEARCH_HEDGES.inc(outcome="issued")
+            backup = asyncio.ensure_future(self._atimed(afn, *args))
+            pending.add(backup)
+        else:
+            backup = None
+        try:
+            while True:
+                for task in done:
+                    if task.exception() is None:
+                        if task is backup:
+                            metrics.SEARCH_HEDGES.inc(outcome="won")
+                        return task.result()
+                if not pending:
+                    raise primary.exception()
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+_hedgers = {}
+_hedgers_lock = threading.Lock()
+
+
+def get_hedger(name, percentile=0.9, budget_ratio=0.05, min_samples=20):
+    """Return the process-wide Hedger for name; latency history is shared by all runs."""
+    with _hedgers_lock:
+        hedger = _hedgers.get(name)
+        if hedger is None:
+            hedger = _hedgers[name] = Hedger(name, percentile, budget_ratio, min_samples)
+        hedger.percentile = percentile
+        hedger.budget.ratio = budget_ratio
+        hedger.tracker.min_samples = min_samples
+    return hedger
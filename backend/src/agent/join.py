@@ -0,0 +1,232 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import math
+import threading
+import time
+
+from agent.budget import current_meter
+
+MERGE = "merge"
+DISCARD = "discard"
+
+# 未被合并的迟到结果（例如最后一轮被截断的分支）保留的时间
+LATE_RESULT_TTL = 3600.0
+
+
+class Batch:
+    """The parallel web_research branches sent by one fan-out of one run."""
+
+    def __init__(self, size, needed):
+        self.size = size
+        self.needed = needed
+        self.completed = 0
+        self.settled = 0
+        self._waiters = []
+        self._lock = threading.Lock()
+
+    @property
+    def quorum_reached(self):
+        return self.completed >= self.needed
+
+    def add_waiter(self, wake):
+        """Call wake() once the quorum is reached (right away if it already is)."""
+        with self._lock:
+            if not self.quorum_reached:
+                self._waiters.append(wake)
+                return
+        wake()
+
+    def remove_waiter(self, wake):
+        with self._lock:
+            if wake in self._waiters:
+                self._waiters.remove(wake)
+
+    def settle(self, completed):
+        """Record a branch that finished in time or was cut off; return True once all have."""
+        with self._lock:
+            self.settled += 1
+            waiters = []
+            if completed:
+                self.completed += 1
+                if self.quorum_reached:
+                    waiters, self._waiters = self._waiters, []
+            done = self.settled >= self.size
+        for wake in waiters:
+            wake()
+        return done
+
+
+class LateResults:
+    """Process-wide store of branch results that arrived after their join, keyed by run id.
+
+    Entries are ``(result, usage)`` pairs: result is the branch's state update,
+    or None if the branch failed or its result was discarded, and usage the
+    LLM and search calls the branch made after it was cut off.
+    """
+
+    def __init__(self, ttl=LATE_RESULT_TTL):
+        self.ttl = ttl
+        self._results = {}
+        self._lock = threading.Lock()
+
+    def put(self, run_id, result, usage=None):
+        now = time.monotonic()
+        with self._lock:
+            for key in [key for key, (touched, _) in self._results.items() if now - touched > self.ttl]:
+                del self._results[key]
+            _, results = self._results.get(run_id, (now, []))
+            results.append((result, usage or {}))
+            self._results[run_id] = (now, results)
+
+    def drain(self, run_id):
+        """Remove and return every ``(result, usage)`` pair stored for run_id."""
+        with self._lock:
+            _, results = self._results.pop(run_id, (None, []))
+        return results
+
+
+LATE_RESULTS = LateResults()
+
+_batches = {}
+_batches_lock = threading.Lock()
+
+
+class Branch:
+    """One web_research branch taking part in a quorum join.
+
+    ``run``/``arun`` return ``(True, result)`` when the branch finishes
+    before its deadline and before the quorum of its batch is reached
+    without it, and ``(False, None)`` when it is cut off. A cut-off
+    branch keeps running in the background under the ``merge`` policy
+    and its result is put in :data:`LATE_RESULTS`; under ``discard`` it
+    is cancelled (async) or its result ignored (sync). Either way the
+    calls it made after the cut are reported with its entry in
+    :data:`LATE_RESULTS`, so they still count against the run budget.
+    ``on_discard`` is called once the branch's late result is dropped: it
+    failed after the cut, or the policy is ``discard``.
+    """
+
+    def __init__(self, key, batch, deadline, policy):
+        self.key = key
+        self.batch = batch
+        self.deadline = deadline
+        self.policy = policy
+
+    def _settle(self, completed):
+        if self.batch.settle(completed):
+            with _batches_lock:
+                if _batches.get(self.key) is self.batch:
+                    del _batches[self.key]
+
+    def _late(self, result, error=None, on_discard=None):
+        # 截断之后分支仍在进行的调用没有计入节点返回的用量，随迟到结果一起写回state
+        meter = current_meter()
+        usage = meter.update() if meter is not None else {}
+        if error is not None:
+            logging.warning(f"迟到的搜索分支失败: {error!r}")
+            result = None
+        elif self.policy != MERGE:
+            logging.info(f"丢弃迟到的搜索分支结果: {self.key}")
+            result = None
+        if result is None and on_discard is not None:
+            on_discard()
+        LATE_RESULTS.put(self.key[0], result, usage)
+
+    def run(self, fn, on_discard=None):
+        state = {}
+        lock = threading.Lock()
+        woken = threading.Event()
+
+        def work():
+            try:
+                result = fn()
+            except Exception as e:
+                result, error = None, e
+            else:
+                error = None
+            with lock:
+                state.update(result=result, error=error, finished=True)
+                cut = state.get("cut", False)
+            if cut:
+                self._late(result, error, on_discard)
+            woken.set()
+
+        context = contextvars.copy_context()
+        threading.Thread(target=context.run, args=(work,), daemon=True).start()
+        self.batch.add_waiter(woken.set)
+        woken.wait(self.deadline)
+        self.batch.remove_waiter(woken.set)
+        with lock:
+            finished = state.get("finished", False)
+            if not finished:
+                state["cut"] = True
+        self._settle(finished)
+        if not finished:
+            return False, None
+        if state["error"] is not None:
+            raise state["error"]
+        return True, state["result"]
+
+    async def arun(self, afn, on_discard=None):
+        loop = asyncio.get_running_loop()
+        task = asyncio.ensure_future(afn())
+        quorum = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: quorum.done() or quorum.set_result(None))
+
+        self.batch.add_waiter(wake)
+        try:
+            await asyncio.wait({task, quorum}, timeout=self.deadline, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            self.batch.remove_waiter(wake)
+            quorum.cancel()
+        if task.done():
+            self._settle(True)
+            return True, task.result()
+        self._settle(False)
+        if self.policy == MERGE:
+            _background.add(task)
+            task.add_done_callback(functools.partial(self._finish_late, on_discard=on_discard))
+        else:
+            task.cancel()
+            if on_discard is not None:
+                on_discard()
+        return False, None
+
+    def _finish_late(self, task, on_discard=None):
+        _background.discard(task)
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            self._late(None, task.exception(), on_discard)
+            return
+        self._late(task.result(), on_discard=on_discard)
+
+
+# 被截断但仍在运行的异步分支，保持引用以免任务被垃圾回收
+_background = set()
+
+
+def join_branch(run_id, batch, size, quorum, deadline, policy):
+    """Return the Branch for one web_research call, or None when no quorum join is configured.
+
+    Args:
+        run_id: Id of the research run the branch belongs to.
+        batch: Index of the fan-out within the run.
+        size: Number of branches sent by that fan-out.
+        quorum: Share of branches that must finish before the rest are cut off.
+        deadline: Seconds a branch may take before it is cut off; 0 disables it.
+        policy: ``merge`` or ``discard`` for results arriving after the cut.
+    """
+    needed = max(1, math.ceil(quorum * size))
+    if not run_id or (needed >= size and not deadline):
+        return None
+    key = (run_id, batch)
+    with _batches_lock:
+        entry = _batches.get(key)
+        if entry is None:
+            entry = _batches[key] = Batch(size, needed)
+    return Branch(key, entry, deadline or None, policy)
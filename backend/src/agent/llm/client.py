@@ -0,0 +1,143 @@
+import asyncio
+import os
+import threading
+import weakref
+
+import httpx
+
+DEFAULT_POOL_SIZE = 20
+DEFAULT_KEEPALIVE_EXPIRY = 60.0
+# 重试由agent.retry统一负责，关闭SDK内置的重试以免重试次数相乘
+SDK_MAX_RETRIES = 0
+
+_clients = {}
+# Async clients hold connections bound to the loop that opened them, so they
+# are pooled per event loop and dropped together with the loop.
+_async_clients = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def _env_float(name, default=None):
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _env_int(name, default=None):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _resolve(base_url, api_key, timeout, pool_size):
+    return (
+        base_url or os.getenv("LLM_BASE_URL"),
+        api_key or os.getenv("APP_TOKEN"),
+        timeout if timeout is not None else _env_float("LLM_TIMEOUT"),
+        pool_size or _env_int("LLM_POOL_SIZE", DEFAULT_POOL_SIZE),
+    )
+
+
+def _limits(pool_size):
+    return httpx.Limits(
+        max_connections=pool_size,
+        max_keepalive_connections=pool_size,
+        keepalive_expiry=DEFAULT_KEEPALIVE_EXPIRY,
+    )
+
+
+def get_client(base_url=None, api_key=None, timeout=None, pool_size=None):
+    """Return the process-wide OpenAI client for the given endpoint settings.
+
+    Clients are keyed by (base_url, api_key, timeout, pool_size) and share a
+    keep-alive connection pool, so every Agent talking to the same endpoint
+    reuses warm connections instead of paying a new TLS handshake per call.
+    Unset arguments fall back to the ``LLM_BASE_URL``, ``APP_TOKEN``,
+    ``LLM_TIMEOUT`` and ``LLM_POOL_SIZE`` environment variables.
+    """
+    key = _resolve(base_url, api_key, timeout, pool_size)
+    base_url, api_key, timeout, pool_size = key
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            # openai的导入耗时约0.3s，推迟到第一次创建客户端时
+            from openai import DefaultHttpxClient, OpenAI
+
+            http_client = DefaultHttpxClient(limits=_limits(pool_size))
+            kwargs = {"timeout": timeout} if timeout is not None else {}
+            client = OpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                http_client=http_client,
+                max_retries=SDK_MAX_RETRIES,
+                **kwargs,
+            )
+            _clients[key] = client
+    return client
+
+
+def get_async_client(base_url=None, api_key=None, timeout=None, pool_size=None):
+    """Return the AsyncOpenAI client for the running event loop.
+
+    Same keying and environment fallbacks as :func:`get_client`.
+    """
+    key = _resolve(base_url, api_key, timeout, pool_size)
+    base_url, api_key, timeout, pool_size = key
+    loop = asyncio.get_running_loop()
+    with _lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(key)
+        if client is None:
+            from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+            kwargs = {"timeout": timeout} if timeout is not None else {}
+            client = AsyncOpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                http_client=DefaultAsyncHttpxClient(limits=_limits(pool_size)),
+                max_retries=SDK_MAX_RETRIES,
+                **kwargs,
+            )
+            clients[key] = client
+    return client
+
+
+def close_clients():
+    """Close every pooled sync client and drop it from the registry."""
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
+
+
+async def aclose_clients():
+    """Close every pooled client, including the async ones of the running loop."""
+    close_clients()
+    loop = asyncio.get_running_loop()
+    with _lock:
+        clients = list(_async_clients.pop(loop, {}).values())
+    for client in clients:
+        await client.close()
+
+
+async def awarm_clients(connections=1, **kwargs):
+    """Open pooled connections of the running loop's AsyncOpenAI client ahead of the first request.
+
+    Every concurrent request opens one keep-alive connection, so DNS lookup
+    and TLS handshake are paid before traffic arrives. Any HTTP response,
+    even an error status, leaves a warm connection behind. Keyword
+    arguments are passed on to :func:`get_async_client`.
+
+    Returns:
+        The number of connections that could not be opened.
+    """
+    import openai
+
+    client = get_async_client(**kwargs)
+    results = await asyncio.gather(*(client.models.list() for _ in range(connections)), return_exceptions=True)
+    return sum(
+        isinstance(result, BaseException) and not isinstance(result, openai.APIStatusError) for result in results
+    )
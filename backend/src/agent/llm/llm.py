@@ -1,18 +1,50 @@
-from openai import OpenAI
-import os
+import contextlib
+import time
+
+from agent import metrics
+from agent.budget import current_meter
+from agent.llm.client import get_async_client, get_client
 
 class openaiLLM:
 
-    def __init__(self, model_id=""):
+    def __init__(self, model_id="", base_url=None, api_key=None, timeout=None, pool_size=None, limiter=None):
         self.model_id = model_id
+        self.generation_params = {"extra_body": {"enable_thinking": False}}
+        self.base_url = base_url
+        self.api_key = api_key
+        self.timeout = timeout
+        self.pool_size = pool_size
+        # 进程级共享的限流器，请求在本地排队而不是被上游以429拒绝
+        self.limiter = limiter
+
+    @property
+    def client(self):
+        # 进程级共享的客户端，复用keep-alive连接池
+        return get_client(
+            base_url=self.base_url,
+            api_key=self.api_key,
+            timeout=self.timeout,
+            pool_size=self.pool_size,
+        )
 
-    def generate_response(self, query):
-        client = OpenAI(
-            api_key=os.getenv('APP_TOKEN'),
-            base_url=os.getenv("LLM_BASE_URL"),
+    @property
+    def async_client(self):
+        # 当前事件循环共享的异步客户端
+        return get_async_client(
+            base_url=self.base_url,
+            api_key=self.api_key,
+            timeout=self.timeout,
+            pool_size=self.pool_size,
         )
 
-        response = client.chat.completions.create(
+    def slot(self):
+        return self.limiter.slot() if self.limiter is not None else contextlib.nullcontext()
+
+    def aslot(self):
+        return self.limiter.aslot() if self.limiter is not None else contextlib.nullcontext()
+
+    def request_kwargs(self, query, timeout=None):
+        kwargs = dict(
             model=self.model_id,
             messages=[
                 {"role": "system", "content": "You are a helpful assistant."},
@@ -21,6 +53,106 @@ class openaiLLM:
                     "content": query
                 }
             ],
-            extra_body={"enable_thinking": False},
+            **self.generation_params,
         )
-        return response.choices[0].message.content
\ No newline at end of file
+        # 运行设置了时间预算时，剩余时间作为本次请求的超时；timeout更短时以timeout为准
+        meter = current_meter()
+        remaining = meter.timeout() if meter is not None else None
+        timeouts = [t for t in (timeout, remaining) if t is not None]
+        if timeouts:
+            kwargs["timeout"] = min(timeouts)
+        return kwargs
+
+    def stream_kwargs(self, query, timeout=None):
+        return dict(stream=True, stream_options={"include_usage": True}, **self.request_kwargs(query, timeout))
+
+    @staticmethod
+    def message_text(message):
+        # 使用function calling时结构化输出在工具调用的参数中
+        if message.tool_calls:
+            return message.tool_calls[0].function.arguments
+        return message.content
+
+    @staticmethod
+    def delta_text(chunk):
+        if not chunk.choices:
+            return None
+        delta = chunk.choices[0].delta
+        if delta.tool_calls:
+            return delta.tool_calls[0].function.arguments
+        return delta.content
+
+    def record(self, started, mode, status, usage=None, query="", text=""):
+        metrics.LLM_DURATION.observe(time.perf_counter() - started, model=self.model_id, mode=mode)
+        metrics.LLM_REQUESTS.inc(model=self.model_id, status=status)
+        metrics.record_usage(self.model_id, usage)
+        meter = current_meter()
+        if meter is not None:
+            meter.record_llm(usage, query, text, self.model_id if status == "ok" else None)
+
+    def generate_response(self, query, timeout=None):
+        with self.slot():
+            started = time.perf_counter()
+            try:
+                response = self.client.chat.completions.create(**self.request_kwargs(query, timeout))
+            except Exception:
+                self.record(started, "blocking", "error", query=query)
+                raise
+            self.record(started, "blocking", "ok", response.usage, query)
+            return self.message_text(response.choices[0].message)
+
+    async def agenerate_response(self, query, timeout=None):
+        async with self.aslot():
+            started = time.perf_counter()
+            try:
+                response = await self.async_client.chat.completions.create(**self.request_kwargs(query, timeout))
+            except Exception:
+                self.record(started, "blocking", "error", query=query)
+                raise
+            self.record(started, "blocking", "ok", response.usage, query)
+            return self.message_text(response.choices[0].message)
+
+    def stream_response(self, query, timeout=None):
+        with self.slot():
+            started = time.perf_counter()
+            usage = None
+            parts = []
+            try:
+                stream = self.client.chat.completions.create(**self.stream_kwargs(query, timeout))
+                with stream:
+                    for chunk in stream:
+                        usage = chunk.usage or usage
+                        text = self.delta_text(chunk)
+                        if text:
+                            parts.append(text)
+                            yield text
+            except GeneratorExit:
+                # 调用方已拿到需要的内容并提前关闭了流
+                self.record(started, "stream", "ok", usage, query, "".join(parts))
+                raise
+            except Exception:
+                self.record(started, "stream", "error", query=query)
+                raise
+            self.record(started, "stream", "ok", usage, query, "".join(parts))
+
+    async def astream_response(self, query, timeout=None):
+        async with self.aslot():
+            started = time.perf_counter()
+            usage = None
+            parts = []
+            try:
+                stream = await self.async_client.chat.completions.create(**self.stream_kwargs(query, timeout))
+                async with stream:
+                    async for chunk in stream:
+                        usage = chunk.usage or usage
+                        text = self.delta_text(chunk)
+                        if text:
+                            parts.append(text)
+                            yield text
+            except GeneratorExit:
+                self.record(started, "stream", "ok", usage, query, "".join(parts))
+                raise
+            except Exception:
+                self.record(started, "stream", "error", query=query)
+                raise
+            self.record(started, "stream", "ok", usage, query, "".join(parts))
@@ -0,0 +1,209 @@
+import logging
+import threading
+import time
+from collections import deque
+
+from agent import metrics
+from agent.hedge import LatencyTracker
+from agent.llm.llm import openaiLLM
+from agent.packing import estimate_tokens
+
+
+class ModelHealth:
+    """Rolling latency and error rate of one model in one request mode."""
+
+    def __init__(self, window=100, min_samples=10):
+        self.min_samples = min_samples
+        self.latency = LatencyTracker(window, min_samples)
+        self._errors = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency=None, error=False):
+        with self._lock:
+            self._errors.append(error)
+        if not error:
+            self.latency.record(latency)
+
+    def error_rate(self):
+        """Share of failed calls in the window, 0 until min_samples calls were seen."""
+        with self._lock:
+            if len(self._errors) < self.min_samples:
+                return 0.0
+            return sum(self._errors) / len(self._errors)
+
+
+_health = {}
+_health_lock = threading.Lock()
+
+
+def model_health(model_id, mode):
+    """Return the process-wide ModelHealth of a model for "blocking" or "stream" calls."""
+    with _health_lock:
+        health = _health.get((model_id, mode))
+        if health is None:
+            health = _health[(model_id, mode)] = ModelHealth()
+    return health
+
+
+class ModelRouter:
+    """A ladder of models serving one role, ordered per call.
+
+    Models whose context window cannot hold the prompt are skipped. Of the
+    rest, models below ``max_error_rate`` and, for streamed calls, within
+    the role's time-to-first-token SLO (at the tracked percentile) are
+    tried first, in ladder order; degraded models are only tried after
+    them.
+
+    Args:
+        role: Name of the role, used as a metric label.
+        ladder: Model ids, the preferred one first.
+        slo: Time-to-first-token SLO of the role in seconds. Every streamed
+            call but one to the last candidate gets it as request timeout, so
+            a stalled model fails over. Blocking calls are not bounded by it,
+            since long answers legitimately take much longer.
+        limiters: Rate limiter per model id.
+        context_windows: Context window in tokens per model id.
+        max_error_rate: Rolling error rate above which a model is degraded.
+        percentile: Latency percentile compared with the SLO.
+    """
+
+    def __init__(self, role, ladder, slo=None, limiters=None, context_windows=None, max_error_rate=0.5, percentile=0.9):
+        self.role = role
+        self.ladder = list(ladder)
+        self.slo = slo or None
+        self.limiters = limiters or {}
+        self.context_windows = context_windows or {}
+        self.max_error_rate = max_error_rate
+        self.percentile = percentile
+
+    def _healthy(self, model_id, mode):
+        health = model_health(model_id, mode)
+        if health.error_rate() > self.max_error_rate:
+            return False
+        if mode != "stream" or self.slo is None:
+            return True
+        latency = health.latency.percentile(self.percentile)
+        return latency is None or latency <= self.slo
+
+    def order(self, prompt, mode):
+        """Return the models to try for prompt, best first."""
+        tokens = estimate_tokens(prompt)
+        fitting = [m for m in self.ladder if tokens < self.context_windows.get(m, float("inf"))] or self.ladder
+        healthy = [m for m in fitting if self._healthy(m, mode)]
+        return healthy + [m for m in fitting if m not in healthy]
+
+
+class RoutedLLM:
+    """Drop-in replacement for openaiLLM that serves every call from a ModelRouter.
+
+    A call that fails, or a stream that misses the SLO for its first
+    chunk, is retried right away on the next model of the ladder; only a
+    stream that has not produced its first chunk yet can fail over.
+    ``served_model`` is the model that answered the last call.
+    """
+
+    def __init__(self, router):
+        self.router = router
+        self.llms = {m: openaiLLM(model_id=m, limiter=router.limiters.get(m)) for m in router.ladder}
+        self.served_model = None
+
+    @property
+    def model_id(self):
+        # 缓存key与流式消息使用角色的首选模型，备用模型的响应不会写入缓存
+        return self.router.ladder[0]
+
+    @property
+    def generation_params(self):
+        return self.llms[self.model_id].generation_params
+
+    @generation_params.setter
+    def generation_params(self, params):
+        for llm in self.llms.values():
+            llm.generation_params = params
+
+    def _candidates(self, query, mode):
+        order = self.router.order(query, mode)
+        for idx, model_id in enumerate(order):
+            last = idx == len(order) - 1
+            # SLO只约束流式调用的首个chunk，阻塞调用需要等待完整的回答
+            timeout = self.router.slo if mode == "stream" and not last else None
+            yield model_id, self.llms[model_id], timeout, last
+
+    def _served(self, model_id, mode, started):
+        model_health(model_id, mode).record(time.perf_counter() - started)
+        metrics.LLM_ROUTED.inc(role=self.router.role, model=model_id, outcome="served")
+        self.served_model = model_id
+
+    def _failed(self, model_id, mode, error, last):
+        model_health(model_id, mode).record(error=True)
+        if not last:
+            metrics.LLM_ROUTED.inc(role=self.router.role, model=model_id, outcome="failover")
+            logging.warning(f"{self.router.role}: {model_id} 调用失败，切换到下一个模型: {error!r}")
+
+    def generate_response(self, query):
+        for model_id, llm, timeout, last in self._candidates(query, "blocking"):
+            started = time.perf_counter()
+            try:
+                response = llm.generate_response(query, timeout)
+            except Exception as e:
+                self._failed(model_id, "blocking", e, last)
+                if last:
+                    raise
+                continue
+            self._served(model_id, "blocking", started)
+            return response
+
+    async def agenerate_response(self, query):
+        for model_id, llm, timeout, last in self._candidates(query, "blocking"):
+            started = time.perf_counter()
+            try:
+                response = await llm.agenerate_response(query, timeout)
+            except Exception as e:
+                self._failed(model_id, "blocking", e, last)
+                if last:
+                    raise
+                continue
+            self._served(model_id, "blocking", started)
+            return response
+
+    def stream_response(self, query):
+        # 流式调用以首个chunk的延迟衡量模型是否满足SLO
+        for model_id, llm, timeout, last in self._candidates(query, "stream"):
+            started = time.perf_counter()
+            chunks = llm.stream_response(query, timeout)
+            try:
+                first = next(chunks, None)
+            except Exception as e:
+                self._failed(model_id, "stream", e, last)
+                if last:
+                    raise
+                continue
+            self._served(model_id, "stream", started)
+            try:
+                if first is not None:
+                    yield first
+                yield from chunks
+            finally:
+                chunks.close()
+            return
+
+    async def astream_response(self, query):
+        for model_id, llm, timeout, last in self._candidates(query, "stream"):
+            started = time.perf_counter()
+            chunks = llm.astream_response(query, timeout)
+            try:
+                first = await anext(chunks, None)
+            except Exception as e:
+                self._failed(model_id, "stream", e, last)
+                if last:
+                    raise
+                continue
+            self._served(model_id, "stream", started)
+            try:
+                if first is not None:
+                    yield first
+                async for chunk in chunks:
+                    yield chunk
+            finally:
+                await chunks.aclose()
+            return
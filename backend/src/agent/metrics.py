@@ -0,0 +1,204 @@
+import bisect
+import functools
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 10, 15, 20, 50)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """A monotonically increasing Prometheus counter with optional labels."""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}_total{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram:
+    """A cumulative Prometheus histogram with optional labels."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items()]
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(float(bound)))])
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {count}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """Render all metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+RUN_DURATION = REGISTRY.histogram(
+    "agent_run_duration_seconds", "Wall time of a research run from generate_query to finalize_answer."
+)
+NODE_DURATION = REGISTRY.histogram(
+    "agent_node_duration_seconds", "Wall time of one graph node execution.", ["node"]
+)
+NODE_ERRORS = REGISTRY.counter(
+    "agent_node_errors", "Graph node executions that raised.", ["node"]
+)
+FANOUT_WIDTH = REGISTRY.histogram(
+    "agent_fanout_width", "Number of web_research branches sent in one fan-out.", ["source"], COUNT_BUCKETS
+)
+LLM_DURATION = REGISTRY.histogram(
+    "agent_llm_request_duration_seconds", "Latency of one LLM request.", ["model", "mode"]
+)
+LLM_REQUESTS = REGISTRY.counter(
+    "agent_llm_requests", "LLM requests by outcome.", ["model", "status"]
+)
+LLM_ROUTED = REGISTRY.counter(
+    "agent_llm_routed", "LLM calls served by each model of a role's ladder, and calls that failed over from it.", ["role", "model", "outcome"]
+)
+LLM_TOKENS = REGISTRY.counter(
+    "agent_llm_tokens", "Tokens reported in response.usage.", ["model", "type"]
+)
+RETRIES = REGISTRY.counter(
+    "agent_retries", "Retries spent by the retry policy.", ["agent", "kind"]
+)
+RATE_LIMIT_WAIT = REGISTRY.histogram(
+    "agent_rate_limit_wait_seconds", "Time a request queued locally in a rate limiter.", ["limiter"]
+)
+RATE_LIMITED = REGISTRY.counter(
+    "agent_rate_limited", "Upstream rate-limit responses seen by a rate limiter.", ["limiter"]
+)
+SEARCH_DURATION = REGISTRY.histogram(
+    "agent_search_duration_seconds", "Latency of one MCP search call."
+)
+SEARCH_REQUESTS = REGISTRY.counter(
+    "agent_search_requests", "MCP search calls by outcome.", ["status"]
+)
+SEARCH_HEDGES = REGISTRY.counter(
+    "agent_search_hedges", "Backup search requests issued, and how many of them won.", ["outcome"]
+)
+SEARCH_RESULTS = REGISTRY.histogram(
+    "agent_search_results", "Number of results returned by one search.", buckets=COUNT_BUCKETS
+)
+FOLLOW_UPS_DROPPED = REGISTRY.counter(
+    "agent_follow_up_queries_dropped", "Follow-up queries dropped as near-duplicates of queries the run already covered."
+)
+BUDGET_EXHAUSTED = REGISTRY.counter(
+    "agent_budget_exhausted", "Runs sent to finalize_answer early because a run budget was nearly used up.", ["limit"]
+)
+
+
+def record_usage(model_id, usage):
+    """Count the prompt/completion tokens of an OpenAI usage object."""
+    if usage is None:
+        return
+    LLM_TOKENS.inc(usage.prompt_tokens or 0, model=model_id, type="prompt")
+    LLM_TOKENS.inc(usage.completion_tokens or 0, model=model_id, type="completion")
+
+
+def timed_node(name, func):
+    """Wrap a sync node so its wall time and errors are recorded."""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except BaseException:
+            NODE_ERRORS.inc(node=name)
+            raise
+        finally:
+            NODE_DURATION.observe(time.perf_counter() - started, node=name)
+
+    return wrapper
+
+
+def atimed_node(name, afunc):
+    """Async counterpart of :func:`timed_node`."""
+
+    @functools.wraps(afunc)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await afunc(*args, **kwargs)
+        except BaseException:
+            NODE_ERRORS.inc(node=name)
+            raise
+        finally:
+            NODE_DURATION.observe(time.perf_counter() - started, node=name)
+
+    return wrapper
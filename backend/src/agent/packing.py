@@ -0,0 +1,161 @@
+import json
+import math
+import re
+from collections import Counter
+
+_CJK = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]")
+_TERM = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]|[^\W_]+")
+# 引用链接对相关性和去重没有意义，只会带来噪声
+_LINK = re.compile(r"\]\([^)]*\)")
+
+
+def estimate_tokens(text):
+    """Estimate the token count of text without calling a tokenizer.
+
+    CJK characters are counted as one token each and the rest of the text as
+    one token per four characters, which errs on the high side for both the
+    Qwen and OpenAI tokenizers.
+    """
+    cjk = len(_CJK.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def terms(text):
+    """Split text into lower-cased terms: single CJK characters and latin words."""
+    return _TERM.findall(_LINK.sub("]", text).lower())
+
+
+def compact_json(obj):
+    """Serialize obj as JSON without indentation or spaces after separators."""
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def _bm25_terms(text):
+    # 单个汉字区分度太低，补充相邻词项组成的二元组
+    tokens = terms(text)
+    return tokens + [a + b for a, b in zip(tokens, tokens[1:])]
+
+
+def bm25_scores(documents, query_weights, k1=1.2, b=0.75):
+    """Score documents against weighted query terms with Okapi BM25.
+
+    Term statistics come from ``documents`` alone, which is enough to rank a
+    single page of search results without an external index.
+
+    Args:
+        documents: Texts to score.
+        query_weights: Mapping of query term to its weight.
+    """
+    counts = [Counter(_bm25_terms(doc)) for doc in documents]
+    if not counts:
+        return []
+    lengths = [sum(c.values()) for c in counts]
+    avg_length = sum(lengths) / len(lengths) or 1.0
+    df = Counter(term for c in counts for term in c.keys() & query_weights.keys())
+    idf = {term: math.log(1 + (len(counts) - n + 0.5) / (n + 0.5)) for term, n in df.items()}
+    scores = []
+    for c, length in zip(counts, lengths):
+        norm = k1 * (1 - b + b * length / avg_length)
+        scores.append(sum(
+            query_weights[term] * idf[term] * c[term] * (k1 + 1) / (c[term] + norm)
+            for term in idf if term in c
+        ))
+    return scores
+
+
+def rank_results(results, query, topic="", top_k=None, token_budget=None, topic_weight=0.5):
+    """Rerank search results by BM25 relevance of their title and snippet.
+
+    Results are scored against the search query and, with a lower weight,
+    the research topic. The best ones are kept until ``top_k`` results or
+    ``token_budget`` estimated tokens of compact JSON are reached; the most
+    relevant result is always kept.
+
+    Returns:
+        The kept results, most relevant first.
+    """
+    weights = Counter(_bm25_terms(query))
+    for term in _bm25_terms(topic):
+        weights[term] += topic_weight
+    scores = bm25_scores([f"{item['title']} {item['snippet']}" for item in results], weights)
+    ranked = sorted(range(len(results)), key=lambda i: -scores[i])
+    kept, used = [], 0
+    for idx in ranked[:top_k or None]:
+        cost = estimate_tokens(compact_json(results[idx]))
+        if kept and token_budget and used + cost > token_budget:
+            break
+        kept.append(results[idx])
+        used += cost
+    return kept
+
+
+def _shingles(tokens, size=3):
+    if len(tokens) < size:
+        return {tuple(tokens)} if tokens else set()
+    return {tuple(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+
+def _containment(a, b):
+    """Share of the smaller shingle set that also appears in the other one."""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+
+def _relevance(counts, topic_counts):
+    if not counts or not topic_counts:
+        return 0.0
+    dot = sum(count * topic_counts[term] for term, count in counts.items() if term in topic_counts)
+    norm = math.sqrt(sum(c * c for c in counts.values())) * math.sqrt(sum(c * c for c in topic_counts.values()))
+    return dot / norm
+
+
+def pack_evidence(summaries, topic, token_budget, overlap_threshold=0.8):
+    """Select the summaries that go into a prompt.
+
+    Summaries that mostly overlap an earlier (longer) one are dropped as
+    duplicates. The rest are ranked by relevance to the research topic and
+    added greedily until ``token_budget`` is reached. Kept summaries stay in
+    their original order.
+
+    Returns:
+        A ``(packed, report)`` tuple: the kept summaries and a dict describing
+        the token usage and the indices dropped as duplicates or over budget.
+    """
+    tokens = [terms(summary) for summary in summaries]
+    shingles = [_shingles(t) for t in tokens]
+
+    duplicates = []
+    unique = []
+    # 较长的摘要信息量更大，优先保留
+    for idx in sorted(range(len(summaries)), key=lambda i: -len(summaries[i])):
+        if not summaries[idx].strip():
+            duplicates.append(idx)
+            continue
+        if any(_containment(shingles[idx], shingles[kept]) >= overlap_threshold for kept in unique):
+            duplicates.append(idx)
+            continue
+        unique.append(idx)
+
+    topic_counts = Counter(terms(topic))
+    ranked = sorted(unique, key=lambda i: -_relevance(Counter(tokens[i]), topic_counts))
+
+    kept, over_budget, used = [], [], 0
+    for idx in ranked:
+        cost = estimate_tokens(summaries[idx])
+        if used + cost > token_budget:
+            over_budget.append(idx)
+            continue
+        kept.append(idx)
+        used += cost
+
+    kept.sort()
+    report = {
+        "total": len(summaries),
+        "kept": len(kept),
+        "tokens": used,
+        "token_budget": token_budget,
+        "dropped_duplicates": sorted(duplicates),
+        "dropped_over_budget": sorted(over_budget),
+    }
+    return [summaries[idx] for idx in kept], report
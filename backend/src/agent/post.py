@@ -1,12 +1,156 @@
+import functools
+import json
 import re
 
+_WORD = re.compile(r"[^\W\d]\w*")
+# 模型偶尔输出Python风格的字面量
+_LITERALS = {"True": "true", "False": "false", "None": "null"}
+
+
+@functools.lru_cache(maxsize=32)
+def _fence(pattern):
+    return re.compile(f"```{pattern}\\s(.*?)```", re.DOTALL)
+
+
+def _strip_trailing_comma(out):
+    """Drop a dangling comma (and the whitespace after it) at the end of out."""
+    i = len(out)
+    while i and out[i - 1].isspace():
+        i -= 1
+    if i and out[i - 1] == ",":
+        del out[i - 1:]
+
+
 class Post:
     @staticmethod
     def extract_pattern(text, pattern):
-        pattern = re.compile(f"```{pattern}\s(.*?)```", re.DOTALL)
-        matches = pattern.findall(text)
+        matches = _fence(pattern).findall(text)
         return matches[0] if matches else text
 
+    @staticmethod
+    def repair_json(text):
+        """Best-effort repair of near-valid JSON emitted by a model.
+
+        Skips text before the first ``{``/``[`` and after the value closes,
+        drops ``//`` and ``/* */`` comments and trailing commas, maps Python
+        literals to JSON and closes a truncated string or open brackets.
+
+        Raises:
+            ValueError: If the text contains no JSON object or array.
+        """
+        starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+        if not starts:
+            raise ValueError("no JSON value found")
+        out, stack = [], []
+        in_string = escape = False
+        i = min(starts)
+        while i < len(text):
+            ch = text[i]
+            if in_string:
+                out.append(ch)
+                if escape:
+                    escape = False
+                elif ch == "\\":
+                    escape = True
+                elif ch == '"':
+                    in_string = False
+            elif ch == '"':
+                in_string = True
+                out.append(ch)
+            elif ch in "{[":
+                stack.append("}" if ch == "{" else "]")
+                out.append(ch)
+            elif ch in "}]":
+                _strip_trailing_comma(out)
+                if stack:
+                    out.append(stack.pop())
+                if not stack:
+                    break
+            elif text.startswith("//", i):
+                end = text.find("\n", i)
+                i = len(text) if end < 0 else end
+                continue
+            elif text.startswith("/*", i):
+                end = text.find("*/", i + 2)
+                i = len(text) if end < 0 else end + 2
+                continue
+            elif ch.isalpha() or ch == "_":
+                word = _WORD.match(text, i).group()
+                out.append(_LITERALS.get(word, word))
+                i += len(word)
+                continue
+            else:
+                out.append(ch)
+            i += 1
+        if in_string:
+            if escape:
+                out.pop()
+            out.append('"')
+        _strip_trailing_comma(out)
+        while out and out[-1].isspace():
+            out.pop()
+        if out and out[-1] == ":":
+            out.append("null")
+        while stack:
+            out.append(stack.pop())
+        return "".join(out)
+
+    @staticmethod
+    def load_json(text):
+        """Parse the ```json block of text (or text itself), repairing it locally if needed."""
+        text = Post.extract_pattern(text, pattern="json")
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            # strict=False允许字符串中出现未转义的换行符
+            return json.loads(Post.repair_json(text), strict=False)
+
+
+class JSONStreamParser:
+    """Follow a streamed completion and notice when its first JSON value is complete.
+
+    Text before the first ``{``/``[`` (such as a ```json fence) is skipped;
+    ``feed`` returns True as soon as the value's closing bracket arrives so
+    the caller can stop reading the stream.
+    """
+
+    def __init__(self):
+        self._chars = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self.complete = False
+
+    @property
+    def text(self):
+        return "".join(self._chars)
+
+    def feed(self, chunk):
+        for ch in chunk:
+            if self.complete:
+                break
+            if not self._chars:
+                if ch in "{[":
+                    self._chars.append(ch)
+                    self._depth = 1
+                continue
+            self._chars.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                self.complete = self._depth == 0
+        return self.complete
+
 
 if __name__ == "__main__":
     text = """```markdown
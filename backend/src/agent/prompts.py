@@ -1,20 +1,26 @@
 from datetime import datetime
 
+from agent.templates import TEMPLATES
+
 
 # Get current date in a readable format
 def get_current_date():
     return datetime.now().strftime("%B %d, %Y")
 
 
-query_writer_instructions = """# 任务说明
+# 所有模板都由不含变量的静态前缀和包含全部变量的后缀组成，
+# 静态前缀在每次调用中完全相同，可以命中模型服务的前缀缓存
+query_writer_instructions = TEMPLATES.register(
+    "query_writer",
+    static="""# 任务说明
 你的任务是根据当前的研究主题决定多个用于网络搜索的标题，这些标题会被用于从网页搜集信息，并整合成一份专业的研究报告
 
 # Instruction
 - 针对当前的研究主题，你可以将其拆解成若干个搜索主题，每个搜索主题都应该是针对当前研究主题不同维度的切分
-- 针对当前研究主题，最多不产生{number_queries}条搜索主题
+- 针对当前研究主题，最多不产生「搜索主题数量上限」中给定数量的搜索主题
 - 你的搜索主题应该尽可能的广泛，如果研究主题本身就非常宽泛，则产出1条以上的搜索主题
 - 每个搜索主题应该具备独立性，即不要同时产出多个相似或者耦合的搜索主题
-- 搜索主题应该考虑时间，即除非研究主题要求，不然尽可能搜集近期的资料，当前时间是{current_date}
+- 搜索主题应该考虑时间，即除非研究主题要求，不然尽可能搜集近期的资料，当前时间见「当前日期」
 
 # Output Format
 你生成的内容应该是一个标准的json格式的内容，并包含两个字端
@@ -37,16 +43,27 @@ query_writer_instructions = """# 任务说明
 }
 ```
 
+""",
+    variable="""# 当前日期
+{current_date}
+
+# 搜索主题数量上限
+{number_queries}
+
 # Context
 {research_topic}
 
-# Output"""
+# Output""",
+    variables=("current_date", "number_queries", "research_topic"),
+)
 
-web_searcher_instructions = """# 角色定义
+web_searcher_instructions = TEMPLATES.register(
+    "web_searcher",
+    static="""# 角色定义
 你是一个情报整合大师，你擅长处理给到的所有情报，并将其处理成一个精简的内容，并注明当前内容的来源
 
 # Instruction
-1. 当前日期是{current_date}, 必要时可以根据当前日期来过滤搜索内容中的有用信息
+1. 当前日期见「当前日期」, 必要时可以根据当前日期来过滤搜索内容中的有用信息
 2. 你需要结合当前的搜索内容来决定当前要整合的重点，即找到所有材料中和当前搜索契合的内容，并总结
 3. 在整合的内容中注意标明当前内容的信息来源是哪里
 4. 当前给定的内容包括搜索的主题，搜索结果，搜索的结果格式如下
@@ -66,6 +83,10 @@ web_searcher_instructions = """# 角色定义
 当前内容xxxx[sohu](https://search.com/id/1:000), 当前片段002...[baidu](https://search.com/id/2:004)
 ```
 
+""",
+    variable="""# 当前日期
+{current_date}
+
 # 搜索主题
 {query}
 
@@ -76,10 +97,65 @@ web_searcher_instructions = """# 角色定义
 
 # 输出
 现在让我们开始任务吧
-"""
+""",
+    variables=("current_date", "query", "web_search_result"),
+)
+
+batch_web_searcher_instructions = TEMPLATES.register(
+    "batch_web_searcher",
+    static="""# 角色定义
+你是一个情报整合大师，你擅长处理给到的所有情报，并将其处理成一个精简的内容，并注明当前内容的来源
+
+# Instruction
+1. 当前日期见「当前日期」, 必要时可以根据当前日期来过滤搜索内容中的有用信息
+2. 本次会给出多个搜索主题，每个搜索主题都有一个编号以及各自的搜索结果，你需要分别为每个搜索主题整合一段内容
+3. 每段内容只能使用对应搜索主题自己的搜索结果，找到其中和该搜索主题契合的内容，并总结
+4. 在整合的内容中注意标明当前内容的信息来源是哪里
+5. 每个搜索主题的搜索结果格式如下
+```json
+[
+	{
+		"snippet": "xxx（返回的相关片段）",
+		"url": "https://xxxx",
+		"title": "xxx（当前返回片段的搜索主题）"
+	}
+]
+```
 
-reflection_instructions = """ # 任务说明
-你是一个科研方面的专家，现在你在协助分析针对研究课题：{research_topic}，从网络采集的信息整合，你需要判断
+# Output Format
+你生成的内容应该是一个标准的json格式的内容，并包含一个字段
+<param>
+ <attribute>summaries</attribute>
+ <type>List</type>
+ <description>每个搜索主题一项，包含搜索主题的编号id以及整合后的内容summary，summary中针对所有引用的内容用标准的markdown下对url进行引用的格式：[代号（可以是网站名，也可以是主题，3-5个字）](url)</description>
+</param>
+下面是一个输出样例
+```json
+{
+ "summaries": [
+  {"id": 0, "summary": "当前内容xxxx[sohu](https://search.com/id/1:000), 当前片段002..."},
+  {"id": 1, "summary": "当前内容yyyy[baidu](https://search.com/id/2:004)..."}
+ ]
+}
+```
+
+""",
+    variable="""# 当前日期
+{current_date}
+
+# 搜索主题及搜索结果
+{searches}
+
+# 输出
+现在让我们开始任务吧
+""",
+    variables=("current_date", "searches"),
+)
+
+reflection_instructions = TEMPLATES.register(
+    "reflection",
+    static=""" # 任务说明
+你是一个科研方面的专家，现在你在协助分析针对「研究课题」从网络采集的信息整合，你需要判断
 1. 当前从网络整合的信息对于当前的研究课题是否充足
 2. 如果不充足，请给出进一步的搜索主题
 
@@ -90,8 +166,8 @@ reflection_instructions = """ # 任务说明
 - 如果当前从网络采集的信息以及符合研究课题中的所有内容，则不需要产出后续的搜索主题
 - 如果当前从网络采集的信息并不充足，那么你需要提供后续的搜索主题以便进一步的从网络采集更多的信息
 - 请确保所有后续提供的搜索主题包含充足且必要的上下文内容
-- 请确保所有后续提供的搜索主题会考虑时间，已知当前时间是{current_date}
-- 请确保最多不产出超过{number_queries}条后续搜索主题
+- 请确保所有后续提供的搜索主题会考虑时间，当前时间见「当前日期」
+- 请确保后续搜索主题的数量不超过「后续搜索主题数量上限」
 
 
 # Output Format
@@ -124,18 +200,32 @@ reflection_instructions = """ # 任务说明
 }
 ```
 
+""",
+    variable="""# 当前日期
+{current_date}
+
+# 后续搜索主题数量上限
+{number_queries}
+
+# 研究课题
+{research_topic}
+
 # Summaries:
 <!--此处是目前为止从网络采集的所有针对当前研究课题的信息-->
 {summaries}
 
 # Output
-"""
+""",
+    variables=("current_date", "number_queries", "research_topic", "summaries"),
+)
 
-answer_instructions = """# 任务说明
+answer_instructions = TEMPLATES.register(
+    "answer",
+    static="""# 任务说明
 你是一个科研方面的专家，现在针对给定的一个研究课题，以及各种从网络上采集过来的针对当前研究课题的信息攥写一篇专业的研究报告，要求内容尽可能专业且详尽
 
 # Instruction
-- 当前日期是{current_date}
+- 当前日期见「当前日期」
 - 你可以综合考虑给定的研究课题，以及提供的从网络上采集的所有信息
 - 基于给到的所有信息，你需要为用户生成一篇**高质量**的研究报告，在研究报告中你可以大量使用Summary中的信息来论证你的观点，你也可以使用表格等方式来辅助说明你的观点
 - 你输出的研究报告应该是一个标准的markdown格式，并且要区分一级标题、二级标题、三级标题，以此类推
@@ -144,6 +234,10 @@ answer_instructions = """# 任务说明
 # Output Format
 你输出的内容应该严格遵守markdown的语法
 
+""",
+    variable="""# 当前日期
+{current_date}
+
 # User Context
 {research_topic}
 
@@ -151,4 +245,86 @@ answer_instructions = """# 任务说明
 {summaries}
 
 # Output
-"""
+""",
+    variables=("current_date", "research_topic", "summaries"),
+)
+
+incremental_reflection_instructions = TEMPLATES.register(
+    "incremental_reflection",
+    static=""" # 任务说明
+你是一个科研方面的专家，现在你在协助分析针对「研究课题」从网络采集的信息整合。之前各轮采集的信息已经被压缩成一份知识摘要，本轮只提供新采集的信息，你需要
+1. 将新采集的信息合并进知识摘要，得到更新后的知识摘要
+2. 结合更新后的知识摘要判断当前信息对于当前的研究课题是否充足
+3. 如果不充足，请给出进一步的搜索主题
+
+# Instruction
+- 更新后的知识摘要需要保留之前知识摘要中的关键事实、数据以及引用链接（markdown格式的[代号](url)），并补充新采集信息中的关键内容，尽量精简，不要超过1500字
+- 判断距离可以做当前研究课题研报攥写还差哪些关键内容，以及哪些部分的信息还不充足需要更加深入的信息采集
+- 你判断的依据可以从以下几点考虑
+ - 聚焦那些尚未被充分涵盖的技术细节、实施要点或新兴趋势。
+- 如果当前的信息以及符合研究课题中的所有内容，则不需要产出后续的搜索主题
+- 如果当前的信息并不充足，那么你需要提供后续的搜索主题以便进一步的从网络采集更多的信息
+- 请确保所有后续提供的搜索主题包含充足且必要的上下文内容
+- 请确保所有后续提供的搜索主题会考虑时间，当前时间见「当前日期」
+- 请确保后续搜索主题的数量不超过「后续搜索主题数量上限」
+
+
+# Output Format
+你输出的内容是一个标准的json格式并包含4个字段
+<param>
+ <attribute>knowledge_digest</attribute>
+ <type>string</type>
+ <description>合并了新采集信息之后的知识摘要</description>
+</param>
+
+<param>
+ <attribute>is_sufficient</attribute>
+ <type>bool</type>
+ <description>判断当前的信息是否充足，如果充足则输出true，如果不充足则输出false</description>
+</param>
+
+<param>
+ <attribute>knowledge_gap</attribute>
+ <type>string</type>
+ <description>如果is_sufficient是false，则需要申明当前距离可以攥写当前研究课题的研究报告还差哪些内容，之间的gap有哪些</description>
+</param>
+
+<param>
+ <attribute>follow_up_queries</attribute>
+ <type>List</type>
+ <description>如果is_sufficient是false，则需要提供后续的搜索主题的内容，重点参考knowledge_gap提及的内容</description>
+</param>
+
+下面是一个输出样例，你可以参考
+
+```json
+{
+ "knowledge_digest": "xxxx",
+ "is_sufficient": true, // or false
+ "knowledge_gap": "xxxx",
+ "follow_up_queries": ["搜索主题1", "搜索主题2", "搜索主题3", ...]
+}
+```
+
+""",
+    variable="""# 当前日期
+{current_date}
+
+# 后续搜索主题数量上限
+{number_queries}
+
+# 研究课题
+{research_topic}
+
+# Knowledge Digest:
+<!--此处是之前各轮采集信息压缩后的知识摘要，第一轮时为空-->
+{knowledge_digest}
+
+# New Summaries:
+<!--此处是本轮新从网络采集的针对当前研究课题的信息-->
+{summaries}
+
+# Output
+""",
+    variables=("current_date", "number_queries", "research_topic", "knowledge_digest", "summaries"),
+)
@@ -0,0 +1,107 @@
+import functools
+import importlib
+import math
+import re
+
+from agent.packing import terms
+
+_PUNCT = re.compile(r"[^\w\s]")
+
+
+def normalize_query(query):
+    """Lower-case query, drop punctuation and collapse whitespace."""
+    return " ".join(_PUNCT.sub(" ", str(query).casefold()).split())
+
+
+def _char_ngrams(text, n=3):
+    text = text.replace(" ", "")
+    if len(text) <= n:
+        return {text} if text else set()
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def _jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+@functools.lru_cache(maxsize=16)
+def load_embedder(path):
+    """Import an embedding function given as ``"package.module:function"``.
+
+    The function takes a list of strings and returns one vector per string.
+    """
+    module, _, name = path.partition(":")
+    if not name:
+        raise ValueError(f"embedder必须写成'模块:函数'的形式: {path}")
+    return getattr(importlib.import_module(module), name)
+
+
+class QueryIndex:
+    """Search queries already run (or accepted) in one research run.
+
+    A query counts as covered when its character trigram or term Jaccard
+    similarity to an indexed query reaches ``threshold``, or, with an
+    embedder, when the cosine similarity of the embeddings reaches
+    ``embedding_threshold``.
+    """
+
+    def __init__(self, queries=(), threshold=0.7, embedder=None, embedding_threshold=0.9):
+        self.threshold = threshold
+        self.embedder = embedder
+        self.embedding_threshold = embedding_threshold
+        self._entries = []
+        self._vectors = {}
+        for query in queries:
+            self.add(query)
+
+    def add(self, query):
+        normalized = normalize_query(query)
+        self._entries.append((query, normalized, _char_ngrams(normalized), set(terms(normalized))))
+
+    def _embed(self, queries):
+        # 一次批量计算所有缺少的向量，每个查询只调用一次embedder
+        missing = [query for query in dict.fromkeys(queries) if query not in self._vectors]
+        if missing:
+            self._vectors.update(zip(missing, self.embedder(missing)))
+        return [self._vectors[query] for query in queries]
+
+    def match(self, query):
+        """Return ``(indexed_query, score)`` for the closest covered query, or ``(None, best_score)``."""
+        normalized = normalize_query(query)
+        grams, tokens = _char_ngrams(normalized), set(terms(normalized))
+        best, best_score = None, 0.0
+        for entry, entry_normalized, entry_grams, entry_tokens in self._entries:
+            if normalized == entry_normalized:
+                return entry, 1.0
+            score = max(_jaccard(grams, entry_grams), _jaccard(tokens, entry_tokens))
+            if score > best_score:
+                best, best_score = entry, score
+        if best_score >= self.threshold:
+            return best, best_score
+        if self.embedder is not None and self._entries:
+            *vectors, vector = self._embed([entry[0] for entry in self._entries] + [query])
+            scores = [_cosine(vector, other) for other in vectors]
+            idx = max(range(len(scores)), key=scores.__getitem__)
+            if scores[idx] >= self.embedding_threshold:
+                return self._entries[idx][0], scores[idx]
+        return None, best_score
+
+    def filter(self, queries):
+        """Split queries into new ones, which are added to the index, and ``(query, covered_by, score)`` for the rest."""
+        kept, dropped = [], []
+        for query in queries:
+            covered_by, score = self.match(query)
+            if covered_by is None:
+                kept.append(query)
+                self.add(query)
+            else:
+                dropped.append((query, covered_by, score))
+        return kept, dropped
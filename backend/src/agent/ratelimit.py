@@ -0,0 +1,143 @@
+import asyncio
+import contextlib
+import threading
+import time
+
+from agent import metrics
+from agent.retry import RATE_LIMITED, classify_error
+
+# 因并发上限而排队时的轮询间隔；令牌不足时则按令牌桶算出的等待时间休眠
+POLL_INTERVAL = 0.02
+# 收到429但没有Retry-After时，整个限流器暂停的时间
+DEFAULT_COOLDOWN = 1.0
+
+
+class AdaptiveLimiter:
+    """A token bucket plus an in-flight cap shared by every caller of one upstream.
+
+    Both limits adapt AIMD style: a rate-limited response halves the
+    current rate and concurrency and pauses the limiter for Retry-After
+    seconds, while each success grows them back towards the configured
+    ceilings. Callers queue locally instead of sending requests that the
+    upstream would reject.
+    """
+
+    def __init__(self, name, qps=10.0, burst=10, max_in_flight=8):
+        self.name = name
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        self._blocked_until = 0.0
+        self.in_flight = 0
+        self.throttled = 0
+        self.rate = float(qps)
+        self.concurrency = float(max_in_flight)
+        self.configure(qps, burst, max_in_flight)
+
+    def configure(self, qps, burst, max_in_flight):
+        """Update the ceilings; the adaptive state is clamped to them."""
+        with self._lock:
+            self.max_rate = float(qps)
+            self.burst = max(int(burst), 1)
+            self.max_in_flight = max(int(max_in_flight), 1)
+            self.rate = min(self.rate, self.max_rate)
+            self.concurrency = min(self.concurrency, self.max_in_flight)
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def _reserve(self):
+        """Take a slot and a token, or return how long to wait before trying again."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._blocked_until:
+                return self._blocked_until - now
+            if self.in_flight >= int(self.concurrency):
+                return POLL_INTERVAL
+            self._refill(now)
+            if self._tokens < 1:
+                return (1 - self._tokens) / self.rate
+            self._tokens -= 1
+            self.in_flight += 1
+            return 0.0
+
+    def acquire(self):
+        started = time.perf_counter()
+        while (wait := self._reserve()) > 0:
+            time.sleep(wait)
+        metrics.RATE_LIMIT_WAIT.observe(time.perf_counter() - started, limiter=self.name)
+
+    async def aacquire(self):
+        started = time.perf_counter()
+        while (wait := self._reserve()) > 0:
+            await asyncio.sleep(wait)
+        metrics.RATE_LIMIT_WAIT.observe(time.perf_counter() - started, limiter=self.name)
+
+    def release(self, exc=None):
+        """Free the slot and adapt to the outcome of the call that held it."""
+        kind, retry_after = classify_error(exc) if exc is not None else (None, None)
+        with self._lock:
+            self.in_flight -= 1
+            if kind == RATE_LIMITED:
+                self.throttled += 1
+                # 同一批并发请求可能同时收到429，暂停期间只降一次速
+                if time.monotonic() >= self._blocked_until:
+                    self.rate = max(self.rate / 2, self.max_rate / 20)
+                    self.concurrency = max(self.concurrency / 2, 1.0)
+                cooldown = retry_after if retry_after is not None else DEFAULT_COOLDOWN
+                self._blocked_until = max(self._blocked_until, time.monotonic() + cooldown)
+                # 暂停期间不积累令牌，恢复后不会一拥而上
+                self._tokens = 0.0
+                self._refilled_at = self._blocked_until
+            elif exc is None or isinstance(exc, GeneratorExit):
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+                self.concurrency = min(self.max_in_flight, self.concurrency + 1 / self.concurrency)
+        if kind == RATE_LIMITED:
+            metrics.RATE_LIMITED.inc(limiter=self.name)
+
+    @contextlib.contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        except BaseException as e:
+            self.release(e)
+            raise
+        else:
+            self.release()
+
+    @contextlib.asynccontextmanager
+    async def aslot(self):
+        await self.aacquire()
+        try:
+            yield
+        except BaseException as e:
+            self.release(e)
+            raise
+        else:
+            self.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "rate": self.rate,
+                "concurrency": int(self.concurrency),
+                "in_flight": self.in_flight,
+                "throttled": self.throttled,
+            }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(name, qps=10.0, burst=10, max_in_flight=8):
+    """Return the process-wide limiter for name, updating its ceilings."""
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            limiter = _limiters[name] = AdaptiveLimiter(name, qps, burst, max_in_flight)
+            return limiter
+    limiter.configure(qps, burst, max_in_flight)
+    return limiter
@@ -0,0 +1,240 @@
+import asyncio
+import logging
+import random
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+
+from agent import metrics
+
+RETRYABLE = "retryable"
+RATE_LIMITED = "rate_limited"
+FATAL = "fatal"
+
+# 出现这些关键字的400错误说明提示超出了模型的上下文窗口，重试不会成功
+CONTEXT_OVERFLOW_MARKERS = (
+    "context length",
+    "context_length",
+    "maximum context",
+    "range of input length",
+    "too long",
+)
+
+
+class AppCallError(Exception):
+    """A DashScope application call that came back with a non-200 status."""
+
+    def __init__(self, status_code, code=None, message=None, retry_after=None):
+        super().__init__(f"调用失败: status={status_code} code={code} message={message}")
+        self.status_code = status_code
+        self.code = code
+        self.message = message
+        self.retry_after = retry_after
+
+
+def _retry_after(headers):
+    if not headers:
+        return None
+    value = headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _classify_status(status_code, message):
+    if status_code == 429:
+        return RATE_LIMITED
+    if status_code in (400, 401, 403, 404, 422):
+        return FATAL
+    if status_code is not None and status_code >= 500:
+        return RETRYABLE
+    message = (message or "").lower()
+    if any(marker in message for marker in CONTEXT_OVERFLOW_MARKERS):
+        return FATAL
+    return RETRYABLE
+
+
+def classify_error(exc):
+    """Classify an exception raised by an LLM or MCP call.
+
+    Returns:
+        A ``(kind, retry_after)`` tuple where kind is one of ``RETRYABLE``,
+        ``RATE_LIMITED`` or ``FATAL`` and retry_after is the server-provided
+        wait in seconds, if any.
+    """
+    if isinstance(exc, AppCallError):
+        kind = _classify_status(exc.status_code, exc.message)
+        if exc.code == "Throttling" or (exc.code or "").startswith("Throttling."):
+            kind = RATE_LIMITED
+        return kind, exc.retry_after
+    # openai按需导入，尚未导入时异常不可能来自openai
+    openai = sys.modules.get("openai")
+    if openai is not None:
+        if isinstance(exc, openai.APIStatusError):
+            return _classify_status(exc.status_code, str(exc)), _retry_after(exc.response.headers)
+        if isinstance(exc, (openai.APIConnectionError, openai.APITimeoutError)):
+            return RETRYABLE, None
+        if isinstance(exc, (openai.LengthFinishReasonError, openai.ContentFilterFinishReasonError)):
+            return FATAL, None
+    # 其余错误多为模型输出格式不合法（json解析、pydantic校验），重新生成通常可以恢复
+    return RETRYABLE, None
+
+
+@dataclass
+class RetryPolicy:
+    """Exponential backoff with full jitter, bounded by attempts and a deadline."""
+
+    max_attempts: int = 5
+    base_delay: float = 1.0
+    max_delay: float = 30.0
+    multiplier: float = 2.0
+    deadline: float = 120.0
+
+    def backoff(self, attempt, retry_after=None):
+        """Return how long to sleep before the given retry attempt (1-based)."""
+        ceiling = min(self.max_delay, self.base_delay * self.multiplier ** (attempt - 1))
+        delay = random.uniform(0, ceiling)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+
+class RetryBudget:
+    """Thread-safe cap on the number of retries a run may spend.
+
+    With a ``parent`` every retry is also drawn from the parent budget, so
+    the nodes and parallel branches of one run share its cap while
+    ``used`` still counts only their own retries.
+    """
+
+    def __init__(self, limit, parent=None):
+        self.limit = limit
+        self.parent = parent
+        self.used = 0
+        self._lock = threading.Lock()
+
+    @property
+    def remaining(self):
+        remaining = max(self.limit - self.used, 0)
+        return remaining if self.parent is None else min(remaining, self.parent.remaining)
+
+    def spend(self):
+        with self._lock:
+            if self.used >= self.limit:
+                return False
+            if self.parent is not None and not self.parent.spend():
+                return False
+            self.used += 1
+            return True
+
+
+# 运行结束后共享的重试预算在进程内保留的时间，与迟到结果一致
+RUN_BUDGET_TTL = 3600.0
+
+
+class RunRetryBudgets:
+    """Process-wide retry budget of each run, keyed by run id.
+
+    Parallel branches are sent with a copy of the run's state and cannot
+    see each other's retries, so they draw from the run's budget here.
+    """
+
+    def __init__(self, ttl=RUN_BUDGET_TTL):
+        self.ttl = ttl
+        self._runs = {}
+        self._lock = threading.Lock()
+
+    def get(self, run_id, limit, used=0):
+        """Return the run's shared budget, created with ``used`` retries already spent (e.g. from the graph state)."""
+        now = time.monotonic()
+        with self._lock:
+            for key in [key for key, (touched, _) in self._runs.items() if now - touched > self.ttl]:
+                del self._runs[key]
+            _, budget = self._runs.get(run_id, (now, None))
+            if budget is None:
+                budget = RetryBudget(limit)
+                budget.used = used
+            self._runs[run_id] = (now, budget)
+        return budget
+
+
+RUN_RETRY_BUDGETS = RunRetryBudgets()
+
+
+@dataclass
+class RetryStats:
+    """Counters describing what the retry loop did for one or more calls."""
+
+    attempts: int = 0
+    retries: int = 0
+    by_kind: dict = field(default_factory=dict)
+
+    def record(self, kind):
+        self.by_kind[kind] = self.by_kind.get(kind, 0) + 1
+
+
+class RetryExhausted(Exception):
+    """Raised once a call can no longer be retried; wraps the last error."""
+
+    def __init__(self, reason, last_error):
+        super().__init__(f"{reason}: {last_error!r}")
+        self.reason = reason
+        self.last_error = last_error
+
+
+class Retrier:
+    """Drive a callable through a :class:`RetryPolicy`.
+
+    The same instance can run several calls; ``stats`` accumulates over all
+    of them so callers can report how many retries a node spent.
+    """
+
+    def __init__(self, policy=None, budget=None, name="call"):
+        self.policy = policy or RetryPolicy()
+        self.budget = budget
+        self.name = name
+        self.stats = RetryStats()
+
+    def _next_delay(self, exc, attempt, started):
+        """Return the delay before the next attempt, or raise RetryExhausted."""
+        kind, retry_after = classify_error(exc)
+        self.stats.record(kind)
+        if kind == FATAL:
+            raise RetryExhausted("fatal error", exc) from exc
+        if attempt >= self.policy.max_attempts:
+            raise RetryExhausted(f"gave up after {attempt} attempts", exc) from exc
+        delay = self.policy.backoff(attempt, retry_after)
+        if time.monotonic() - started + delay > self.policy.deadline:
+            raise RetryExhausted("retry deadline exceeded", exc) from exc
+        if self.budget is not None and not self.budget.spend():
+            raise RetryExhausted("retry budget exhausted", exc) from exc
+        self.stats.retries += 1
+        metrics.RETRIES.inc(agent=self.name, kind=kind)
+        logging.warning(
+            f"{self.name} 第{attempt}次调用失败({kind})，{delay:.2f}s后重试: {exc!r}"
+        )
+        return delay
+
+    def call(self, fn, *args, **kwargs):
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            self.stats.attempts += 1
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                time.sleep(self._next_delay(e, attempt, started))
+
+    async def acall(self, afn, *args, **kwargs):
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            self.stats.attempts += 1
+            try:
+                return await afn(*args, **kwargs)
+            except Exception as e:
+                await asyncio.sleep(self._next_delay(e, attempt, started))
@@ -10,24 +10,76 @@ from typing_extensions import Annotated
 import operator
 
 
+def merge_sources(left: list, right: list | dict) -> list:
+    """Append sources, skipping short urls that are already present; ``{"replace": sources}`` replaces them."""
+    if isinstance(right, dict):
+        return list(right["replace"])
+    seen = {source["short_url"] for source in left}
+    merged = list(left)
+    for source in right:
+        if source["short_url"] not in seen:
+            seen.add(source["short_url"])
+            merged.append(source)
+    return merged
+
+
+def collect_pending(left: list, right: list | None) -> list:
+    """Append pending search results; None clears them once they are summarized."""
+    if right is None:
+        return []
+    return left + right
+
+
+def merge_registry(left: dict, right: dict) -> dict:
+    """Merge short url -> long url registries; short urls are stable so entries never conflict."""
+    return {**left, **right}
+
+
 class OverallState(TypedDict):
     messages: Annotated[list, add_messages]
     search_query: Annotated[list, operator.add]
     web_research_result: Annotated[list, operator.add]
-    sources_gathered: Annotated[list, operator.add]
+    sources_gathered: Annotated[list, merge_sources]
+    url_registry: Annotated[dict, merge_registry]
     initial_search_query_count: int
     max_research_loops: int
     research_loop_count: int
     reasoning_model: str
+    retry_count: Annotated[int, operator.add]
+    llm_calls: Annotated[int, operator.add]
+    llm_tokens: Annotated[int, operator.add]
+    search_calls: Annotated[int, operator.add]
+    served_models: Annotated[list, operator.add]
+    evidence_report: dict
+    knowledge_digest: str
+    reflected_count: int
+    reflection_backlog: list
+    run_started_at: float
+    run_id: str
+    research_topic: str
+    result_signatures: Annotated[list, operator.add]
+    straggler_log: Annotated[list, operator.add]
+    budget_stops: Annotated[list, operator.add]
+    pending_searches: Annotated[list, collect_pending]
 
 
 class ReflectionState(TypedDict):
     is_sufficient: bool
     knowledge_gap: str
     follow_up_queries: Annotated[list, operator.add]
+    search_query: list
     research_loop_count: int
     number_of_ran_queries: int
     max_research_loops: int
+    retry_count: int
+    run_id: str
+    research_topic: str
+    result_signatures: Annotated[list, operator.add]
+    run_started_at: float
+    llm_calls: int
+    llm_tokens: int
+    search_calls: int
+    budget_stops: list
 
 
 class Query(TypedDict):
@@ -37,11 +89,22 @@ class Query(TypedDict):
 
 class QueryGenerationState(TypedDict):
     search_query: list[Query]
+    retry_count: int
+    run_id: str
+    run_started_at: float
+    research_topic: str
 
 
 class WebSearchState(TypedDict):
     search_query: str
     id: str
+    retry_count: int
+    run_id: str
+    run_started_at: float
+    research_topic: str
+    result_signatures: list
+    batch: int
+    batch_size: int
 
 
 @dataclass(kw_only=True)
@@ -0,0 +1,79 @@
+from uuid import uuid4
+
+from langchain_core.callbacks import AsyncCallbackManager, CallbackManager
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, LLMResult
+
+
+def _configure(manager_cls, config):
+    config = config or {}
+    return manager_cls.configure(
+        inheritable_callbacks=config.get("callbacks"),
+        inheritable_tags=config.get("tags"),
+        inheritable_metadata=config.get("metadata"),
+    )
+
+
+def _chunk(text, message_id):
+    return ChatGenerationChunk(message=AIMessageChunk(content=text, id=message_id))
+
+
+def _result(message):
+    return LLMResult(generations=[[ChatGeneration(message=message)]])
+
+
+class MessageStreamer:
+    """Report a streamed openaiLLM completion as a chat model run.
+
+    openaiLLM talks to the OpenAI SDK directly, so LangGraph cannot see its
+    tokens. This forwards each chunk to the run's callbacks the same way a
+    LangChain chat model would, which makes ``stream_mode="messages"`` emit
+    the tokens of the node that owns ``config``. The final message shares the
+    chunk id, so LangGraph does not emit it a second time.
+    """
+
+    def __init__(self, config, model_id, prompt):
+        self.message_id = f"run-{uuid4()}"
+        self.run_managers = _configure(CallbackManager, config).on_chat_model_start(
+            {"name": model_id}, [[HumanMessage(content=prompt)]], name=model_id
+        )
+
+    def token(self, text):
+        if not text:
+            return
+        for run_manager in self.run_managers:
+            run_manager.on_llm_new_token(text, chunk=_chunk(text, self.message_id))
+
+    def end(self, content):
+        message = AIMessage(content=content, id=self.message_id)
+        for run_manager in self.run_managers:
+            run_manager.on_llm_end(_result(message))
+        return message
+
+
+class AsyncMessageStreamer:
+    """Async counterpart of :class:`MessageStreamer`; call :meth:`start` first."""
+
+    def __init__(self, config, model_id, prompt):
+        self.message_id = f"run-{uuid4()}"
+        self.config = config
+        self.model_id = model_id
+        self.prompt = prompt
+        self.run_managers = []
+
+    async def start(self):
+        self.run_managers = await _configure(AsyncCallbackManager, self.config).on_chat_model_start(
+            {"name": self.model_id}, [[HumanMessage(content=self.prompt)]], name=self.model_id
+        )
+
+    async def token(self, text):
+        if not text:
+            return
+        for run_manager in self.run_managers:
+            await run_manager.on_llm_new_token(text, chunk=_chunk(text, self.message_id))
+
+    async def end(self, content):
+        message = AIMessage(content=content, id=self.message_id)
+        for run_manager in self.run_managers:
+            await run_manager.on_llm_end(_result(message))
+        return message
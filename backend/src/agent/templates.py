@@ -0,0 +1,107 @@
+import functools
+import re
+
+PLACEHOLDER = re.compile(r"\{([A-Za-z_]\w*)\}")
+
+
+class TemplateError(ValueError):
+    """A prompt template is malformed or rendered without all of its variables."""
+
+
+class PromptTemplate:
+    """A prompt compiled once into literal segments and placeholder names.
+
+    Rendering joins the segments with the values in a single pass, so a
+    value that itself contains ``{name}`` is never substituted again. Text
+    that is not a ``{identifier}`` placeholder, such as JSON examples, is
+    left untouched.
+    """
+
+    def __init__(self, text, name="<inline>"):
+        parts = PLACEHOLDER.split(text)
+        self.name = name
+        self.text = text
+        self._literals = parts[0::2]
+        self._fields = parts[1::2]
+        self.variables = frozenset(self._fields)
+
+    @classmethod
+    def from_parts(cls, static, variable, name):
+        """Build a template laid out as a static prefix followed by the variable suffix.
+
+        Keeping every placeholder in the suffix makes the prefix byte-identical
+        across calls, so providers with prefix (KV) caching can reuse it.
+        """
+        if PLACEHOLDER.search(static):
+            raise TemplateError(f"{name}: 静态前缀中不能包含变量 {PLACEHOLDER.findall(static)}")
+        return cls(static + variable, name)
+
+    @property
+    def static_prefix(self):
+        """The text before the first placeholder."""
+        return self._literals[0]
+
+    def render(self, values, strict=True):
+        """Fill in the placeholders from values; extra values are ignored.
+
+        Args:
+            values: Mapping of placeholder name to value, converted with str().
+            strict: Raise TemplateError for missing values instead of leaving
+                the placeholder in the output.
+        """
+        if strict:
+            missing = self.variables - values.keys()
+            if missing:
+                raise TemplateError(f"{self.name}: 缺少变量 {sorted(missing)}")
+        out = [self._literals[0]]
+        for field, literal in zip(self._fields, self._literals[1:]):
+            out.append(str(values[field]) if field in values else "{" + field + "}")
+            out.append(literal)
+        return "".join(out)
+
+    def __str__(self):
+        return self.text
+
+
+class TemplateRegistry:
+    """Named prompt templates, compiled and validated when they are registered."""
+
+    def __init__(self):
+        self._templates = {}
+
+    def register(self, name, static, variable, variables):
+        """Compile and register a template.
+
+        Args:
+            name: Unique template name.
+            static: Instructions shared by every call; must not contain placeholders.
+            variable: Suffix holding every placeholder.
+            variables: The placeholder names the suffix is expected to contain.
+        """
+        if name in self._templates:
+            raise TemplateError(f"模板重复注册: {name}")
+        template = PromptTemplate.from_parts(static, variable, name)
+        if template.variables != set(variables):
+            raise TemplateError(
+                f"{name}: 模板变量 {sorted(template.variables)} 与声明的变量 {sorted(variables)} 不一致"
+            )
+        self._templates[name] = template
+        return template
+
+    def get(self, name):
+        return self._templates[name]
+
+    def __contains__(self, name):
+        return name in self._templates
+
+    def names(self):
+        return list(self._templates)
+
+
+TEMPLATES = TemplateRegistry()
+
+
+@functools.lru_cache(maxsize=256)
+def compile_template(text):
+    """Compile an ad-hoc string template, caching the result by its text."""
+    return PromptTemplate(text)
@@ -11,6 +11,21 @@ class SearchQueryList(BaseModel):
     )
 
 
+class QuerySummary(BaseModel):
+    id: int = Field(
+        description="The id of the search query this summary belongs to."
+    )
+    summary: str = Field(
+        description="The summary of that query's search results, with markdown citations."
+    )
+
+
+class BatchSummaries(BaseModel):
+    summaries: List[QuerySummary] = Field(
+        description="One summary per search query."
+    )
+
+
 class Reflection(BaseModel):
     is_sufficient: bool = Field(
         description="Whether the provided summaries are sufficient to answer the user's question."
@@ -21,3 +36,7 @@ class Reflection(BaseModel):
     follow_up_queries: List[str] = Field(
         description="A list of follow-up queries to address the knowledge gap."
     )
+    knowledge_digest: str = Field(
+        default="",
+        description="A compact running digest of everything gathered so far, used by incremental reflection."
+    )
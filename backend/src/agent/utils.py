@@ -1,6 +1,12 @@
+import hashlib
+import re
 from typing import Any, Dict, List
 from langchain_core.messages import AnyMessage, AIMessage, HumanMessage
 
+SHORT_URL_PREFIX = "https://search.com/id/"
+SHORT_URL_PATTERN = re.compile(re.escape(SHORT_URL_PREFIX) + r"\d+-\d+")
+_SHORT_URL_TAIL = re.compile(r"[\d-]*")
+
 
 def get_research_topic(messages: List[AnyMessage]) -> str:
     """
@@ -19,23 +25,78 @@ def get_research_topic(messages: List[AnyMessage]) -> str:
     return research_topic
 
 
-def resolve_urls(urls_to_resolve: List[Any], id: int) -> Dict[str, str]:
+def short_url(url: str) -> str:
     """
-    Create a map of the vertex ai search urls (very long) to a short url with a unique id for each url.
-    Ensures each original URL gets a consistent shortened form while maintaining uniqueness.
+    Derive the stable short url of a long url.
+
+    The id is a hash of the url, so every branch and loop of a run (and every
+    run) maps the same url to the same short url without coordinating.
     """
-    prefix = f"https://search.com/id/"
-    urls = [site["url"] for site in urls_to_resolve]
+    digest = int(hashlib.sha1(url.encode("utf-8")).hexdigest(), 16) % 10**10
+    return f"{SHORT_URL_PREFIX}{digest // 10**6}-{digest % 10**6}"
+
 
-    # Create a dictionary that maps each unique URL to its first occurrence index
+def resolve_urls(urls_to_resolve: List[Any]) -> Dict[str, str]:
+    """
+    Create a map of the search result urls (very long) to a stable short url for each url.
+    """
     resolved_map = {}
-    for idx, url in enumerate(urls):
+    for site in urls_to_resolve:
+        url = site["url"]
         if url not in resolved_map:
-            resolved_map[url] = f"{prefix}{id}-{idx}"
+            resolved_map[url] = short_url(url)
 
     return resolved_map
 
 
+class CitationRewriter:
+    """Rewrite short citation URLs back to the original long URLs.
+
+    Text can be fed incrementally (e.g. while streaming an LLM answer): any
+    tail that could still turn into a short URL once the next chunk arrives
+    is held back, so a URL split across chunk boundaries is still rewritten.
+    The short URLs that were rewritten are collected in ``used``.
+    """
+
+    def __init__(self, short2long: Dict[str, str]):
+        self.short2long = short2long
+        self.used = set()
+        self._buffer = ""
+
+    def _replace(self, match):
+        short_url = match.group(0)
+        long_url = self.short2long.get(short_url)
+        if long_url is None:
+            return short_url
+        self.used.add(short_url)
+        return long_url
+
+    def rewrite(self, text: str) -> str:
+        return SHORT_URL_PATTERN.sub(self._replace, text)
+
+    def _safe_length(self) -> int:
+        buffer = self._buffer
+        start = buffer.rfind(SHORT_URL_PREFIX)
+        if start != -1 and _SHORT_URL_TAIL.fullmatch(buffer, start + len(SHORT_URL_PREFIX)):
+            return start
+        for size in range(min(len(SHORT_URL_PREFIX) - 1, len(buffer)), 0, -1):
+            if SHORT_URL_PREFIX.startswith(buffer[-size:]):
+                return len(buffer) - size
+        return len(buffer)
+
+    def feed(self, chunk: str) -> str:
+        """Add a chunk and return the rewritten text that is safe to emit."""
+        self._buffer += chunk
+        safe = self._safe_length()
+        text, self._buffer = self._buffer[:safe], self._buffer[safe:]
+        return self.rewrite(text)
+
+    def flush(self) -> str:
+        """Return whatever is still held back, rewritten."""
+        text, self._buffer = self._buffer, ""
+        return self.rewrite(text)
+
+
 def insert_citation_markers(text, citations_list):
     """
     Inserts citation markers into a text string based on start and end indices.
@@ -50,29 +111,26 @@ def insert_citation_markers(text, citations_list):
     Returns:
         str: The text with citation markers inserted.
     """
-    # Sort citations by end_index in descending order.
-    # If end_index is the same, secondary sort by start_index descending.
-    # This ensures that insertions at the end of the string don't affect
-    # the indices of earlier parts of the string that still need to be processed.
+    # Sort citations by end_index, then start_index, so the output can be built
+    # front to back in a single pass over the original text. Citations with
+    # identical indices keep the order of the previous back-to-front insertion
+    # (last one first), hence sorting the reversed list.
     sorted_citations = sorted(
-        citations_list, key=lambda c: (c["end_index"], c["start_index"]), reverse=True
+        reversed(citations_list), key=lambda c: (c["end_index"], c["start_index"])
     )
 
-    modified_text = text
+    parts = []
+    last_idx = 0
     for citation_info in sorted_citations:
-        # These indices refer to positions in the *original* text,
-        # but since we iterate from the end, they remain valid for insertion
-        # relative to the parts of the string already processed.
+        # Indices refer to positions in the *original* text.
         end_idx = citation_info["end_index"]
-        marker_to_insert = ""
+        parts.append(text[last_idx:end_idx])
         for segment in citation_info["segments"]:
-            marker_to_insert += f" [{segment['label']}]({segment['short_url']})"
-        # Insert the citation marker at the original end_idx position
-        modified_text = (
-            modified_text[:end_idx] + marker_to_insert + modified_text[end_idx:]
-        )
+            parts.append(f" [{segment['label']}]({segment['short_url']})")
+        last_idx = max(last_idx, end_idx)
+    parts.append(text[last_idx:])
 
-    return modified_text
+    return "".join(parts)
 
 
 def get_citations(response, resolved_urls_map):
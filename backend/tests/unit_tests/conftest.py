@@ -0,0 +1,173 @@
+import asyncio
+import json
+import random
+import re
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from agent.base_agent import MCPAgent
+from agent.llm import llm as llm_module
+from agent.utils import SHORT_URL_PATTERN
+
+# 按提示中的固定片段判断是哪个节点发出的请求
+PROMPT_KINDS = (
+    ("batch_summary", "# 搜索主题及搜索结果"),
+    ("summary", "# 搜索结果"),
+    ("query", "# 搜索主题数量上限"),
+    ("reflection", "# 后续搜索主题数量上限"),
+    ("answer", "# User Context"),
+)
+
+
+WORDS = (
+    "solar wind battery grid carbon policy market price storage hydrogen nuclear coal demand supply "
+    "forecast turbine panel efficiency subsidy tariff export import factory research patent startup "
+    "investment capacity network transmission outage regulation emission target climate weather"
+).split()
+
+
+def article(seed, words=30):
+    """Text of a made-up article; different seeds give texts that are not near-duplicates."""
+    return " ".join(random.Random(seed).choices(WORDS, k=words))
+
+
+def prompt_kind(prompt):
+    return next(kind for kind, marker in PROMPT_KINDS if marker in prompt)
+
+
+def _summary(prompt, request):
+    urls = SHORT_URL_PATTERN.findall(prompt)
+    return "```text\n摘要 " + " ".join(f"[s]({url})" for url in urls[:2]) + "\n```"
+
+
+def _batch_summary(prompt, request):
+    ids = re.findall(r"## 搜索主题 (\d+):", prompt)
+    return json.dumps({"summaries": [{"id": int(i), "summary": f"批量摘要{i}"} for i in ids]})
+
+
+class FakeBackend:
+    """Scripted LLM endpoint and MCP search app.
+
+    ``replies`` maps a prompt kind to the response text or a function of the
+    prompt and the request's other parameters; a reply that is an exception
+    instance is raised instead.
+    ``search`` returns the pages of a query.
+    """
+
+    def __init__(self):
+        self.replies = {
+            "query": json.dumps({"rationale": "r", "query": ["topic a", "topic b"]}),
+            "summary": _summary,
+            "batch_summary": _batch_summary,
+            "reflection": json.dumps(
+                {"is_sufficient": True, "knowledge_gap": "", "follow_up_queries": [], "knowledge_digest": "digest"}
+            ),
+            "answer": "# 报告\n内容",
+        }
+        self.search = lambda query: [
+            {"snippet": article(f"{query}-{i}"), "title": f"{query} {i}", "url": f"https://example.com/{query}/{i}"}
+            for i in range(5)
+        ]
+        self.calls = []
+        self.searches = []
+        self.lock = threading.Lock()
+
+    def prompts(self, kind):
+        with self.lock:
+            return [prompt for prompt_kind_, prompt, _ in self.calls if prompt_kind_ == kind]
+
+    def reply(self, prompt, kwargs):
+        kind = prompt_kind(prompt)
+        with self.lock:
+            self.calls.append((kind, prompt, kwargs))
+        reply = self.replies[kind]
+        reply = reply(prompt, kwargs) if callable(reply) else reply
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+
+def _usage(prompt, text):
+    return SimpleNamespace(prompt_tokens=len(prompt) // 4, completion_tokens=len(text) // 4, total_tokens=(len(prompt) + len(text)) // 4)
+
+
+class _Stream:
+    def __init__(self, prompt, text):
+        self.chunks = [
+            SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text[i:i + 7], tool_calls=None))], usage=None)
+            for i in range(0, len(text), 7)
+        ]
+        self.chunks.append(SimpleNamespace(choices=[], usage=_usage(prompt, text)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            yield chunk
+
+
+class _Completions:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def create(self, model, messages, stream=False, **kwargs):
+        prompt = messages[-1]["content"]
+        text = self.backend.reply(prompt, {"model": model, **kwargs})
+        if stream:
+            return _Stream(prompt, text)
+        message = SimpleNamespace(content=text, tool_calls=None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=_usage(prompt, text))
+
+
+class _AsyncCompletions(_Completions):
+    async def create(self, model, messages, stream=False, **kwargs):
+        # 在线程中生成回复，回复函数中的等待不会阻塞事件循环
+        return await asyncio.to_thread(_Completions.create, self, model, messages, stream, **kwargs)
+
+
+def _search_response(pages):
+    text = json.dumps({"result": {"content": [{"text": json.dumps({"pages": pages})}]}})
+    return SimpleNamespace(status_code=200, output=SimpleNamespace(text=text))
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    """Serve every LLM and search call of the graph from a FakeBackend."""
+    fake = FakeBackend()
+    client = SimpleNamespace(chat=SimpleNamespace(completions=_Completions(fake)))
+    async_client = SimpleNamespace(chat=SimpleNamespace(completions=_AsyncCompletions(fake)))
+    monkeypatch.setattr(llm_module, "get_client", lambda **kwargs: client)
+    monkeypatch.setattr(llm_module, "get_async_client", lambda **kwargs: async_client)
+
+    def call_app(self, step_prompt, biz_params):
+        with fake.lock:
+            fake.searches.append(step_prompt)
+        return _search_response(fake.search(step_prompt))
+
+    monkeypatch.setattr(MCPAgent, "call_app", call_app)
+    return fake
+
+
+@pytest.fixture
+def run_config():
+    """Build a run config; process-wide caches and rate limiters are off so tests do not share them."""
+
+    def build(**configurable):
+        return {"configurable": {"search_cache": False, "rate_limit": False, "stream_answer": False, **configurable}}
+
+    return build
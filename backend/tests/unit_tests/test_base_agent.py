@@ -0,0 +1,80 @@
+import asyncio
+import json
+
+import httpx
+import openai
+import pytest
+
+from agent import base_agent
+from agent.base_agent import JsonAgent
+from agent.templates import compile_template
+from agent.tools_and_schemas import SearchQueryList
+
+PROMPT = compile_template("# 搜索主题数量上限\n{n}")
+QUERIES = json.dumps({"rationale": "r", "query": ["a", "b"]})
+
+
+@pytest.fixture(autouse=True)
+def prompt_only_models(monkeypatch):
+    monkeypatch.setattr(base_agent, "PROMPT_ONLY_MODELS", set())
+
+
+def _rejecting(parameter):
+    # 不支持结构化输出的服务以400拒绝请求
+    def reply(prompt, request):
+        if parameter in request:
+            response = httpx.Response(400, request=httpx.Request("POST", "http://llm/v1/chat/completions"))
+            raise openai.BadRequestError(f"Error code: 400 - '{parameter}' is not supported", response=response, body=None)
+        return QUERIES
+
+    return reply
+
+
+def _agent(output_mode, stream=False, model_id="m"):
+    agent = JsonAgent(model_id=model_id, keys=SearchQueryList, output_mode=output_mode, stream=stream)
+    agent.set_step_prompt(PROMPT)
+    return agent
+
+
+@pytest.mark.parametrize(
+    "output_mode, parameter",
+    [("prompt", None), ("json_object", "response_format"), ("function", "tools")],
+)
+def test_output_mode_request_parameters(backend, output_mode, parameter):
+    backend.replies["query"] = QUERIES
+    assert _agent(output_mode).step(n=2).query == ["a", "b"]
+    (_, _, request), = backend.calls
+    if parameter is None:
+        assert "response_format" not in request and "tools" not in request
+    else:
+        assert parameter in request
+
+
+@pytest.mark.parametrize("output_mode, parameter", [("json_object", "response_format"), ("function", "tools")])
+@pytest.mark.parametrize("stream", [False, True])
+def test_rejected_output_mode_falls_back_to_prompt(backend, output_mode, parameter, stream):
+    backend.replies["query"] = _rejecting(parameter)
+    agent = _agent(output_mode, stream)
+    assert agent.step(n=2).query == ["a", "b"]
+    assert agent.output_mode == "prompt"
+    assert [parameter in request for _, _, request in backend.calls] == [True, False]
+    # 之后同一模型的agent直接使用prompt模式，不再被拒绝一次
+    assert _agent(output_mode, stream).step(n=2).query == ["a", "b"]
+    assert len(backend.calls) == 3
+    assert _agent(output_mode, stream, model_id="other").output_mode == output_mode
+
+
+def test_async_rejected_output_mode_falls_back_to_prompt(backend):
+    backend.replies["query"] = _rejecting("response_format")
+    agent = _agent("json_object", stream=True)
+    assert asyncio.run(agent.astep(n=2)).query == ["a", "b"]
+    assert agent.output_mode == "prompt"
+
+
+def test_other_errors_do_not_fall_back(backend):
+    backend.replies["query"] = RuntimeError("model overloaded")
+    agent = JsonAgent(model_id="m", keys=SearchQueryList, output_mode="json_object", retry_policy=None)
+    agent.set_step_prompt(PROMPT)
+    with pytest.raises(RuntimeError):
+        agent(agent.prompt_format(PROMPT, n=2))
+    assert agent.output_mode == "json_object"
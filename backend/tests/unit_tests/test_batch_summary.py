@@ -0,0 +1,78 @@
+import asyncio
+import json
+import re
+
+import pytest
+from conftest import article
+from langchain_core.messages import HumanMessage
+
+from agent.graph import asummarize_research, graph, summarize_research
+
+PENDING = [
+    {"id": idx, "search_query": f"topic {idx}", "results": [{"url": f"[{idx}]", "content": article(idx)}]}
+    for idx in (2, 0, 1)
+]
+
+
+def _summarize(async_, state, config):
+    if async_:
+        return asyncio.run(asummarize_research(state, config))
+    return summarize_research(state, config)
+
+
+def _single_summary(prompt, request):
+    query = re.search(r"# 搜索主题\n(.*)\n", prompt).group(1)
+    return f"```text\n单独摘要 {query}\n```"
+
+
+@pytest.fixture
+def summarize(backend, run_config):
+    backend.replies["summary"] = _single_summary
+
+    def run(async_, **configurable):
+        config = run_config(batch_summarization=True, llm_retry_max_attempts=1, **configurable)
+        update = _summarize(async_, {"pending_searches": PENDING}, config)
+        return {**update, "web_research_result": [text.strip() for text in update["web_research_result"]]}
+
+    return run
+
+
+@pytest.mark.parametrize("async_", [False, True])
+def test_one_call_summarizes_every_branch_in_order(backend, summarize, async_):
+    update = summarize(async_)
+    assert update["web_research_result"] == ["批量摘要0", "批量摘要1", "批量摘要2"]
+    assert update["pending_searches"] is None
+    assert [kind for kind, _, _ in backend.calls] == ["batch_summary"]
+
+
+@pytest.mark.parametrize("async_", [False, True])
+def test_unparseable_batch_falls_back_to_each_branch(backend, summarize, async_):
+    backend.replies["batch_summary"] = "not json"
+    update = summarize(async_)
+    assert update["web_research_result"] == ["单独摘要 topic 0", "单独摘要 topic 1", "单独摘要 topic 2"]
+    assert len(backend.prompts("summary")) == 3
+
+
+@pytest.mark.parametrize("async_", [False, True])
+def test_missing_summaries_fall_back_per_branch(backend, summarize, async_):
+    # 批量结果少了一个搜索主题，并多出一个不存在的id
+    backend.replies["batch_summary"] = json.dumps(
+        {"summaries": [{"id": 2, "summary": "批量摘要2"}, {"id": 0, "summary": "批量摘要0"}, {"id": 7, "summary": "x"}]}
+    )
+    update = summarize(async_)
+    assert update["web_research_result"] == ["批量摘要0", "单独摘要 topic 1", "批量摘要2"]
+    assert len(backend.prompts("summary")) == 1
+
+
+def test_prompt_over_budget_summarizes_each_branch(backend, summarize):
+    update = summarize(False, batch_summary_token_budget=10)
+    assert update["web_research_result"] == ["单独摘要 topic 0", "单独摘要 topic 1", "单独摘要 topic 2"]
+    assert backend.prompts("batch_summary") == []
+
+
+def test_graph_summarizes_all_branches_in_one_call(backend, run_config):
+    state = {"messages": [HumanMessage(content="q")], "max_research_loops": 1, "initial_search_query_count": 2}
+    result = graph.invoke(state, run_config(batch_summarization=True))
+    assert len(backend.prompts("batch_summary")) == 1
+    assert backend.prompts("summary") == []
+    assert sorted(result["web_research_result"]) == ["批量摘要0", "批量摘要1"]
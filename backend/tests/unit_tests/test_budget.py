@@ -0,0 +1,81 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from agent.budget import RunBudget, UsageMeter, current_meter
+
+
+@pytest.mark.parametrize(
+    "used, reserve, exhausted",
+    [
+        (79, 0.2, []),
+        (80, 0.2, ["max_llm_calls"]),
+        (99, 0.0, []),
+        (100, 0.0, ["max_llm_calls"]),
+    ],
+)
+def test_exhausted_keeps_reserve(used, reserve, exhausted):
+    budget = RunBudget(max_llm_calls=100, reserve=reserve)
+    assert budget.exhausted({"llm_calls": used}) == exhausted
+
+
+def test_zero_limit_is_disabled():
+    state = {"llm_calls": 10**6, "llm_tokens": 10**9, "search_calls": 10**6, "run_started_at": time.time() - 10**6}
+    assert RunBudget().exhausted(state) == []
+
+
+def test_exhausted_reports_every_limit():
+    budget = RunBudget(max_seconds=10, max_tokens=1000, max_llm_calls=10, max_search_calls=10, reserve=0.5)
+    state = {"run_started_at": time.time() - 6, "llm_tokens": 500, "llm_calls": 4, "search_calls": 5}
+    assert budget.exhausted(state) == ["max_seconds", "max_tokens", "max_search_calls"]
+
+
+def test_deadline_and_search_calls_left():
+    budget = RunBudget(max_seconds=30, max_search_calls=5)
+    assert budget.deadline(100.0) == 130.0
+    assert RunBudget().deadline(100.0) is None
+    assert budget.search_calls_left({"search_calls": 3}) == 2
+    assert budget.search_calls_left({"search_calls": 7}) == 0
+    assert RunBudget().search_calls_left({"search_calls": 7}) is None
+
+
+def test_meter_timeout():
+    assert UsageMeter().timeout(default=5) == 5
+    assert UsageMeter(deadline=time.time() + 100).timeout() == pytest.approx(100, abs=1)
+    # 截止时间已过时仍保留最短超时
+    assert UsageMeter(deadline=time.time() - 100, min_timeout=2.0).timeout() == 2.0
+
+
+def test_meter_update_reports_deltas():
+    meter = UsageMeter(node="web_research")
+    meter.record_llm(SimpleNamespace(total_tokens=30), model="qwen-plus")
+    meter.record_search()
+    assert meter.update() == {
+        "llm_calls": 1,
+        "llm_tokens": 30,
+        "search_calls": 1,
+        "served_models": [{"node": "web_research", "model": "qwen-plus"}],
+    }
+    # 失败的调用计数但不记录模型，token按文本估算
+    meter.record_llm(prompt="abcd" * 10, text="abcd")
+    assert meter.unreported() == {"llm_calls": 1, "llm_tokens": 11, "search_calls": 0}
+    assert meter.update() == {"llm_calls": 1, "llm_tokens": 11, "search_calls": 0, "served_models": []}
+    assert meter.update() == {"llm_calls": 0, "llm_tokens": 0, "search_calls": 0, "served_models": []}
+
+
+def test_meter_is_inherited_by_tasks():
+    meter = UsageMeter()
+
+    async def task():
+        current_meter().record_search()
+
+    async def run():
+        with meter.active():
+            await asyncio.gather(task(), task())
+
+    assert current_meter() is None
+    asyncio.run(run())
+    assert current_meter() is None
+    assert meter.search_calls == 2
@@ -0,0 +1,181 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from agent.base_agent import Agent
+from agent.cache import LLMCache, SearchCache
+
+
+def test_search_cache_normalizes_queries():
+    cache = SearchCache()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return ["result"]
+
+    assert cache.get_or_fetch("Quantum  Computing", {"count": 10}, fetch) == ["result"]
+    assert cache.get_or_fetch(" quantum computing ", {"count": 10}, fetch) == ["result"]
+    assert cache.get_or_fetch("quantum computing", {"count": 5}, fetch) == ["result"]
+    assert len(calls) == 2
+    assert cache.stats()["hits"] == 1
+
+
+def test_failed_searches_are_not_cached():
+    cache = SearchCache()
+    assert cache.get_or_fetch("q", None, lambda: None) is None
+    assert cache.get_or_fetch("q", None, lambda: ["result"]) == ["result"]
+
+
+def test_expired_entries_are_fetched_again():
+    cache = SearchCache(ttl=0.0)
+    cache.get_or_fetch("q", None, lambda: ["old"])
+    time.sleep(0.01)
+    assert cache.get_or_fetch("q", None, lambda: ["new"]) == ["new"]
+
+
+def test_sync_callers_are_coalesced():
+    cache = SearchCache()
+    calls, release = [], threading.Event()
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return ["result"]
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_fetch("q", None, fetch))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    while cache.stats()["coalesced"] < 4:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert results == [["result"]] * 5
+    assert len(calls) == 1
+    assert cache.saved_calls == 4
+
+
+def test_leader_error_is_shared_and_not_cached():
+    cache = SearchCache()
+
+    async def main():
+        started = asyncio.Event()
+
+        async def failing():
+            started.set()
+            await asyncio.sleep(0.05)
+            raise RuntimeError("search down")
+
+        leader = asyncio.create_task(cache.aget_or_fetch("q", None, failing))
+        await started.wait()
+        follower = asyncio.create_task(cache.aget_or_fetch("q", None, failing))
+        results = await asyncio.gather(leader, follower, return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+
+        async def working():
+            return ["result"]
+
+        # 失败不会被缓存，下一次请求重新搜索
+        assert await cache.aget_or_fetch("q", None, working) == ["result"]
+
+    asyncio.run(main())
+
+
+def test_cancelled_leader_hands_over_to_a_follower():
+    cache = SearchCache()
+    calls = []
+
+    async def main():
+        started = asyncio.Event()
+
+        async def fetch():
+            calls.append(1)
+            started.set()
+            await asyncio.sleep(0.1)
+            return ["result"]
+
+        leader = asyncio.create_task(cache.aget_or_fetch("q", None, fetch))
+        await started.wait()
+        followers = [asyncio.create_task(cache.aget_or_fetch("q", None, fetch)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.gather(*followers)
+
+    assert asyncio.run(main()) == [["result"]] * 3
+    # 被取消的领头请求之后只有一个等待者重新搜索
+    assert len(calls) == 2
+    assert cache.stats()["misses"] == 2
+    assert cache.saved_calls == 2
+
+
+
+def test_llm_cache_key_covers_model_prompt_and_params():
+    key = LLMCache.make_key("m", "prompt", {"temperature": 0, "max_tokens": 10})
+    assert key == LLMCache.make_key("m", "prompt", {"max_tokens": 10, "temperature": 0})
+    assert key != LLMCache.make_key("other", "prompt", {"temperature": 0, "max_tokens": 10})
+    assert key != LLMCache.make_key("m", "prompt 2", {"temperature": 0, "max_tokens": 10})
+    assert key != LLMCache.make_key("m", "prompt", {"temperature": 1, "max_tokens": 10})
+
+
+def test_llm_cache_entries_expire(tmp_path):
+    cache = LLMCache(ttl=0.0, path=str(tmp_path / "cache.sqlite"))
+    cache.set("k", "v")
+    time.sleep(0.01)
+    # 两层都过期，过期的磁盘记录被删除
+    assert cache.get("k") is None
+    assert cache._db.execute("SELECT COUNT(*) FROM llm_cache").fetchone() == (0,)
+
+
+def test_llm_cache_disk_tier_survives_a_new_instance(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    first = LLMCache(path=path)
+    first.set("k", "v")
+    first.close()
+    second = LLMCache(path=path)
+    assert second.get("k") == "v"
+    assert second.stats()["disk_hits"] == 1
+    # 读回的记录进入内存层，再次读取不访问磁盘
+    assert second.get("k") == "v"
+    assert second.stats()["disk_hits"] == 1
+    second.close()
+
+
+def test_llm_cache_evicts_least_recently_used(tmp_path):
+    cache = LLMCache(max_entries=2, path=str(tmp_path / "cache.sqlite"), max_disk_entries=10)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.get("a")
+    cache.set("c", "3")
+    assert list(cache._memory) == ["a", "c"]
+    # 磁盘层每写入100次裁剪一次，只保留最近访问的max_disk_entries条
+    for i in range(97):
+        cache.set(f"k{i}", str(i))
+    keys = {key for key, in cache._db.execute("SELECT key FROM llm_cache")}
+    assert keys == {f"k{i}" for i in range(87, 97)}
+    cache.close()
+
+
+class _Queries(Agent):
+    def post_process(self, response):
+        return json.loads(response)["query"]
+
+
+def test_failed_post_process_is_not_cached(backend):
+    agent = _Queries(model_id="m", cache=LLMCache())
+    agent.set_step_prompt("# 搜索主题数量上限\n{n}")
+    backend.replies["query"] = "not json"
+    with pytest.raises(json.JSONDecodeError):
+        agent.generate(agent.prompt_format(agent.step_prompt, n=2))
+    assert agent.cache.stats()["memory_entries"] == 0
+    backend.replies["query"] = json.dumps({"query": ["a"]})
+    assert agent.step(n=2) == ["a"]
+    assert agent.step(n=2) == ["a"]
+    assert len(backend.calls) == 2
+    assert agent.cache.stats()["hits"] == 1
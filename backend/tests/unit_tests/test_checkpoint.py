@@ -0,0 +1,76 @@
+import pytest
+from langchain_core.messages import HumanMessage
+
+from agent.checkpoint import prune_checkpoints, sqlite_checkpointer
+from agent.graph import build_graph
+
+pytest.importorskip("langgraph.checkpoint.sqlite")
+
+STATE = {"messages": [HumanMessage(content="q")], "max_research_loops": 1, "initial_search_query_count": 2}
+
+
+@pytest.fixture
+def saver(tmp_path):
+    saver = sqlite_checkpointer(str(tmp_path / "checkpoints.sqlite"))
+    yield saver
+    saver.conn.close()
+
+
+def _thread(thread_id, **configurable):
+    return {"configurable": {"thread_id": thread_id, **configurable}}
+
+
+def _checkpoint_count(saver, thread_id):
+    return len(list(saver.list(_thread(thread_id))))
+
+
+def _run(saver, thread_id, run_config):
+    return build_graph(saver).invoke(STATE, run_config(thread_id=thread_id))
+
+
+def test_resume_after_failed_node(saver, backend, run_config):
+    graph = build_graph(saver)
+    config = run_config(thread_id="t", llm_retry_max_attempts=1)
+    backend.replies["reflection"] = RuntimeError("reflection model down")
+    with pytest.raises(AttributeError):
+        graph.invoke(STATE, config)
+    snapshot = graph.get_state(config)
+    assert snapshot.next == ("reflection",)
+    searches, queries = len(backend.searches), len(backend.prompts("query"))
+
+    backend.replies["reflection"] = '{"is_sufficient": true, "knowledge_gap": "", "follow_up_queries": []}'
+    result = graph.invoke(None, config)
+    # 续跑只执行失败的节点及其后续节点，已完成的搜索不会重复
+    assert result["messages"][-1].content == "# 报告\n内容"
+    assert len(backend.searches) == searches == 2
+    assert len(backend.prompts("query")) == queries == 1
+    assert not graph.get_state(config).next
+
+
+def test_prune_keeps_latest_checkpoint(saver, backend, run_config):
+    result = _run(saver, "a", run_config)
+    _run(saver, "b", run_config)
+    before = _checkpoint_count(saver, "a")
+    assert before > 1
+
+    pruned = prune_checkpoints(saver, exclude={"b"})
+    assert pruned == {"deleted_threads": 0, "deleted_checkpoints": before - 1}
+    assert _checkpoint_count(saver, "a") == 1
+    assert _checkpoint_count(saver, "b") == before
+    # 最新的checkpoint仍可读取完整的结果
+    state = build_graph(saver).get_state(_thread("a"))
+    assert state.values["messages"][-1].content == result["messages"][-1].content
+    with saver.cursor(transaction=False) as cur:
+        cur.execute("SELECT COUNT(*) FROM writes WHERE thread_id = 'a' AND checkpoint_id != ?", (state.config["configurable"]["checkpoint_id"],))
+        assert cur.fetchone()[0] == 0
+
+
+def test_prune_old_threads(saver, backend, run_config):
+    _run(saver, "a", run_config)
+    _run(saver, "b", run_config)
+    assert prune_checkpoints(saver, older_than_days=1, keep_latest=False) == {"deleted_threads": 0, "deleted_checkpoints": 0}
+    # 截止时间在未来时所有线程都算过期，exclude中的线程除外
+    pruned = prune_checkpoints(saver, older_than_days=-1, exclude={"b"})
+    assert pruned == {"deleted_threads": 1, "deleted_checkpoints": 0}
+    assert _checkpoint_count(saver, "a") == 0
+    assert _checkpoint_count(saver, "b") > 1
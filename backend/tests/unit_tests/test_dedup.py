@@ -0,0 +1,182 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+from conftest import article
+from langchain_core.messages import HumanMessage
+
+from agent.base_agent import Agent
+from agent.dedup import (
+    RUN_SIGNATURES,
+    SignatureIndex,
+    hamming,
+    result_signature,
+    simhash,
+)
+from agent.graph import graph, web_research
+from agent.join import LATE_RESULTS
+from agent.utils import SHORT_URL_PATTERN
+
+TEXT = (
+    "The James Webb Space Telescope captured new infrared images of the Pillars of Creation, "
+    "revealing newly formed stars hidden behind clouds of gas and dust in the Eagle Nebula."
+)
+NEAR_COPY = TEXT.replace("new infrared images", "new infrared pictures")
+THIRD = "Volcanic eruption in Iceland forces evacuation of a fishing town near Grindavik."
+OTHER = "Local bakery wins national award for its sourdough bread recipe after a decade of baking."
+
+
+def test_simhash_is_stable_and_64_bit():
+    assert simhash(TEXT) == simhash(TEXT)
+    assert 0 < simhash(TEXT) < 1 << 64
+    assert simhash("") == 0
+
+
+def test_simhash_near_copies_are_close():
+    assert hamming(simhash(TEXT), simhash(NEAR_COPY)) <= 10
+    assert hamming(simhash(TEXT), simhash(OTHER)) > 10
+
+
+def test_result_signature_prefers_snippet():
+    # 转载的结果往往只有标题不同
+    a = {"title": "Site A", "snippet": TEXT}
+    b = {"title": "Site B | mirror", "snippet": TEXT}
+    assert result_signature(a) == result_signature(b)
+    assert result_signature({"title": TEXT, "snippet": ""}) == simhash(TEXT)
+
+
+def test_check_reserves_new_signatures():
+    index = SignatureIndex()
+    signature = simhash(TEXT)
+    assert index.check("run", [signature], owner="a") == [False]
+    assert index.check("run", [simhash(NEAR_COPY), simhash(OTHER)], owner="b") == [True, False]
+
+
+def test_check_within_one_list():
+    index = SignatureIndex()
+    assert index.check("run", [simhash(TEXT), simhash(NEAR_COPY)]) == [False, True]
+
+
+def test_release_only_drops_the_owners_reservations():
+    index = SignatureIndex()
+    index.check("run", [simhash(TEXT)], owner="a")
+    index.check("run", [simhash(OTHER)], owner="b")
+    index.release("run", "a")
+    assert index.check("run", [simhash(TEXT), simhash(OTHER)], owner="c") == [False, True]
+    # 只归还指定的签名
+    index.release("run", "c", [simhash(OTHER)])
+    assert index.check("run", [simhash(TEXT)], owner="d") == [True]
+    # 没有owner时签名永久登记
+    index.check("run", [simhash(THIRD)])
+    index.release("run", None)
+    assert index.check("run", [simhash(THIRD)]) == [True]
+
+
+def test_concurrent_siblings_reserve_each_result_once():
+    # 同一批并行的分支同时检查同样的结果，每条结果只交给一个分支
+    index = SignatureIndex()
+    signatures = [simhash(article(i)) for i in range(10)]
+    barrier = threading.Barrier(8)
+    kept = []
+
+    def branch(owner):
+        barrier.wait()
+        duplicates = index.check("run", signatures, owner=owner)
+        kept.extend(s for s, duplicate in zip(signatures, duplicates) if not duplicate)
+
+    threads = [threading.Thread(target=branch, args=(owner,)) for owner in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(kept) == sorted(set(signatures))
+
+
+def test_runs_are_isolated_and_known_signatures_count():
+    index = SignatureIndex()
+    index.check("a", [simhash(TEXT)])
+    assert index.check("b", [simhash(TEXT)]) == [False]
+    # 从checkpoint恢复的签名
+    assert index.check("c", [simhash(NEAR_COPY)], known=[simhash(TEXT)]) == [True]
+    index.release("c", "owner")
+    assert index.check("c", [simhash(TEXT)]) == [True]
+
+
+def test_expired_runs_are_dropped():
+    index = SignatureIndex(ttl=0.01)
+    index.check("run", [simhash(TEXT)])
+    time.sleep(0.02)
+    assert index.check("run", [simhash(TEXT)]) == [False]
+
+
+def _identical_results(barrier):
+    # 所有分支拿到同样的文章，并在同一时刻开始去重
+    def search(query):
+        barrier.wait()
+        return [
+            {"snippet": article(i), "title": f"copy of {i}", "url": f"https://mirror.com/{query}/{i}"}
+            for i in range(10)
+        ]
+
+    return search
+
+
+def _slow_summary(prompt, request):
+    # 摘要耗时远长于去重，旧的实现中所有分支都会在任何分支返回之前完成检查
+    time.sleep(0.1)
+    return "```text\n摘要\n```"
+
+
+def _summarized_results(backend):
+    return [url for prompt in backend.prompts("summary") for url in SHORT_URL_PATTERN.findall(prompt)]
+
+
+QUERIES = json.dumps({"rationale": "r", "query": ["topic a", "topic b", "topic c"]})
+STATE = {"messages": [HumanMessage(content="q")], "max_research_loops": 1, "initial_search_query_count": 3}
+
+
+def test_sibling_branches_do_not_summarize_the_same_results(backend, run_config):
+    backend.replies["query"] = QUERIES
+    backend.replies["summary"] = _slow_summary
+    backend.search = _identical_results(threading.Barrier(3, timeout=5))
+    graph.invoke(STATE, run_config(search_top_k=10, search_result_token_budget=100000))
+    assert len(_summarized_results(backend)) == 10
+
+
+def test_async_sibling_branches_do_not_summarize_the_same_results(backend, run_config):
+    backend.replies["query"] = QUERIES
+    backend.replies["summary"] = _slow_summary
+    backend.search = _identical_results(threading.Barrier(3, timeout=5))
+    asyncio.run(graph.ainvoke(STATE, run_config(search_top_k=10, search_result_token_budget=100000)))
+    assert len(_summarized_results(backend)) == 10
+
+
+def test_failed_branch_releases_its_results(backend, run_config, monkeypatch):
+    def fail(self, **kwargs):
+        raise RuntimeError("summary failed")
+
+    monkeypatch.setattr(Agent, "step", fail)
+    state = {"search_query": "topic a", "id": 0, "run_id": "failed-branch-run", "result_signatures": []}
+    with pytest.raises(RuntimeError):
+        web_research(state, run_config())
+    pages = backend.search("topic a")
+    assert RUN_SIGNATURES.check("failed-branch-run", [result_signature(page) for page in pages]) == [False] * 5
+
+
+def test_discarded_straggler_releases_its_results(backend, run_config):
+    release = threading.Event()
+    backend.search = lambda query: release.wait(5) and [
+        {"snippet": article(f"straggler-{i}"), "title": str(i), "url": f"https://example.com/{i}"} for i in range(3)
+    ]
+    state = {"search_query": "slow", "id": 0, "run_id": "discard-run", "batch": 0, "batch_size": 2, "result_signatures": []}
+    config = run_config(branch_deadline_seconds=0.05, late_result_policy="discard")
+    assert "straggler_log" in web_research(state, config)
+    release.set()
+    for _ in range(100):
+        if LATE_RESULTS.drain("discard-run"):
+            break
+        time.sleep(0.01)
+    pages = backend.search("slow")
+    assert RUN_SIGNATURES.check("discard-run", [result_signature(page) for page in pages]) == [False] * 3
@@ -0,0 +1,116 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from agent.hedge import Hedger
+
+
+def _hedger(latency=0.05, budget_ratio=1.0):
+    hedger = Hedger("test", percentile=0.9, budget_ratio=budget_ratio, min_samples=5)
+    # 足够多的历史样本，测试中的请求不会改变对冲延迟
+    for _ in range(100):
+        hedger.tracker.record(latency)
+    return hedger
+
+
+def _scripted(*steps):
+    """A call whose n-th invocation sleeps and then returns or raises steps[n]; starts records when each began."""
+    starts, lock = [], threading.Lock()
+
+    def call():
+        with lock:
+            index = len(starts)
+            starts.append(time.perf_counter())
+        delay, outcome = steps[min(index, len(steps) - 1)]
+        time.sleep(delay)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    return call, starts
+
+
+def test_no_backup_before_the_percentile_delay():
+    hedger = _hedger(latency=0.2)
+    call, starts = _scripted((0.02, "primary"))
+    assert hedger.call(call) == "primary"
+    assert len(starts) == 1
+
+
+def test_backup_fires_after_the_percentile_delay():
+    hedger = _hedger(latency=0.05)
+    call, starts = _scripted((0.5, "primary"), (0.0, "backup"))
+    assert hedger.call(call) == "backup"
+    assert len(starts) == 2
+    assert starts[1] - starts[0] >= 0.05
+
+
+def test_no_hedging_without_enough_samples():
+    hedger = Hedger("test", min_samples=5)
+    call, starts = _scripted((0.05, "primary"))
+    assert hedger.call(call) == "primary"
+    assert len(starts) == 1
+
+
+def test_budget_ratio_limits_backups():
+    # 每次请求积累0.5个令牌，4次慢请求只能对冲2次
+    hedger = _hedger(latency=0.01, budget_ratio=0.5)
+    call, starts = _scripted((0.05, "result"))
+    for _ in range(4):
+        assert hedger.call(call) == "result"
+    assert len(starts) == 6
+
+
+def test_first_success_wins_over_a_failed_primary():
+    hedger = _hedger(latency=0.05)
+    call, _ = _scripted((0.1, RuntimeError("primary")), (0.2, "backup"))
+    assert hedger.call(call) == "backup"
+
+
+def test_primary_error_is_raised_when_both_fail():
+    hedger = _hedger(latency=0.05)
+    call, starts = _scripted((0.2, ValueError("primary")), (0.0, RuntimeError("backup")))
+    with pytest.raises(ValueError, match="primary"):
+        hedger.call(call)
+    assert len(starts) == 2
+
+
+def test_async_loser_is_cancelled():
+    hedger = _hedger(latency=0.05)
+    calls, cancelled = [], []
+
+    async def call():
+        calls.append(1)
+        if len(calls) == 1:
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+        return "backup"
+
+    async def main():
+        result = await hedger.acall(call)
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(main()) == "backup"
+    assert cancelled == [True]
+
+
+def test_async_primary_error_is_raised_when_both_fail():
+    hedger = _hedger(latency=0.05)
+    calls = []
+
+    async def call():
+        calls.append(1)
+        if len(calls) == 1:
+            await asyncio.sleep(0.2)
+            raise ValueError("primary")
+        raise RuntimeError("backup")
+
+    with pytest.raises(ValueError, match="primary"):
+        asyncio.run(hedger.acall(call))
+    assert len(calls) == 2
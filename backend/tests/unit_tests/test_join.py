@@ -0,0 +1,153 @@
+import asyncio
+import threading
+import uuid
+
+import pytest
+
+from agent.budget import UsageMeter, current_meter
+from agent.graph import _merge_late_results
+from agent.join import DISCARD, LATE_RESULTS, MERGE, Batch, join_branch
+
+
+def _run_id():
+    return f"test-{uuid.uuid4()}"
+
+
+def _result(query):
+    return {
+        "web_research_result": [f"summary of {query}"],
+        "sources_gathered": [{"value": f"https://example.com/{query}"}],
+        "url_registry": {f"https://example.com/{query}": f"short-{query}"},
+        "result_signatures": [],
+        "retry_count": 1,
+        "search_query": [query],
+    }
+
+
+@pytest.mark.parametrize(
+    "size, quorum, deadline, joined",
+    [(3, 1.0, 0, False), (3, 0.5, 0, True), (3, 1.0, 5, True), (1, 0.1, 0, False)],
+)
+def test_join_branch_only_when_configured(size, quorum, deadline, joined):
+    assert (join_branch(_run_id(), 0, size, quorum, deadline, MERGE) is not None) == joined
+    assert join_branch("", 0, size, quorum, deadline, MERGE) is None
+
+
+def test_branches_of_one_fanout_share_a_batch():
+    run_id = _run_id()
+    a = join_branch(run_id, 0, 3, 0.5, 0, MERGE)
+    b = join_branch(run_id, 0, 3, 0.5, 0, MERGE)
+    c = join_branch(run_id, 1, 3, 0.5, 0, MERGE)
+    assert a.batch is b.batch is not c.batch
+    assert a.batch.needed == 2
+
+
+def test_batch_wakes_waiters_at_quorum():
+    batch = Batch(size=3, needed=2)
+    woken = []
+    batch.add_waiter(lambda: woken.append(1))
+    assert not batch.settle(True) and woken == []
+    assert not batch.settle(True) and woken == [1]
+    # 达到法定数之后加入的等待者立即被唤醒
+    batch.add_waiter(lambda: woken.append(2))
+    assert woken == [1, 2]
+    assert batch.settle(False)
+
+
+def test_sync_straggler_is_cut_and_merged_late():
+    run_id = _run_id()
+    release = threading.Event()
+    fast = join_branch(run_id, 0, 2, 0.5, 0, MERGE)
+    slow = join_branch(run_id, 0, 2, 0.5, 0, MERGE)
+    outcome = {}
+    thread = threading.Thread(target=lambda: outcome.update(slow=slow.run(lambda: release.wait(5) and _result("slow"))))
+    thread.start()
+    assert fast.run(lambda: _result("fast")) == (True, _result("fast"))
+    thread.join(5)
+    assert outcome["slow"] == (False, None)
+    assert LATE_RESULTS.drain(run_id) == []
+    release.set()
+    for _ in range(100):
+        late = LATE_RESULTS.drain(run_id)
+        if late:
+            break
+        threading.Event().wait(0.01)
+    assert late == [(_result("slow"), {})]
+
+
+def test_sync_branch_error_is_raised():
+    branch = join_branch(_run_id(), 0, 2, 0.5, 5, MERGE)
+
+    def fail():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        branch.run(fail)
+
+
+async def _straggler(run_id, policy, release):
+    fast = join_branch(run_id, 0, 2, 0.5, 0, policy)
+    slow = join_branch(run_id, 0, 2, 0.5, 0, policy)
+    meter = UsageMeter()
+
+    async def slow_search():
+        current_meter().record_search()
+        await release.wait()
+        # 截断之后的调用随迟到结果上报
+        current_meter().record_search()
+        return _result("slow")
+
+    async def fast_search():
+        await asyncio.sleep(0)
+        return _result("fast")
+
+    with meter.active():
+        slow_outcome, fast_outcome = await asyncio.gather(slow.arun(slow_search), fast.arun(fast_search))
+    # 截断前的调用由节点自身上报
+    assert meter.update()["search_calls"] == 1
+    release.set()
+    for _ in range(10):
+        await asyncio.sleep(0)
+    return slow_outcome, fast_outcome
+
+
+def test_async_straggler_merged_late_with_usage():
+    run_id = _run_id()
+
+    async def main():
+        return await _straggler(run_id, MERGE, asyncio.Event())
+
+    slow, fast = asyncio.run(main())
+    assert slow == (False, None)
+    assert fast == (True, _result("fast"))
+    (result, usage), = LATE_RESULTS.drain(run_id)
+    assert result == _result("slow")
+    assert usage["search_calls"] == 1
+
+
+def test_async_straggler_discarded():
+    run_id = _run_id()
+
+    async def main():
+        return await _straggler(run_id, DISCARD, asyncio.Event())
+
+    slow, _ = asyncio.run(main())
+    assert slow == (False, None)
+    assert LATE_RESULTS.drain(run_id) == []
+
+
+def test_merge_late_results_into_state():
+    run_id = _run_id()
+    LATE_RESULTS.put(run_id, _result("late"), {"llm_calls": 1, "llm_tokens": 10, "search_calls": 1})
+    # 被丢弃或失败的分支只带回用量
+    LATE_RESULTS.put(run_id, None, {"llm_calls": 2, "served_models": [{"node": "web_research", "model": "m"}]})
+    state = {"run_id": run_id, "web_research_result": ["summary of fast"], "llm_calls": 3}
+    merged, update = _merge_late_results(state)
+    assert merged["web_research_result"] == ["summary of fast", "summary of late"]
+    assert merged["llm_calls"] == 6 and merged["search_calls"] == 1
+    assert update["sources_gathered"] == [{"value": "https://example.com/late"}]
+    assert update["url_registry"] == {"https://example.com/late": "short-late"}
+    assert update["retry_count"] == 1
+    assert update["straggler_log"] == [{"search_query": "late", "event": "merged"}]
+    assert update["served_models"] == [{"node": "web_research", "model": "m"}]
+    assert _merge_late_results(state) == (state, {})
@@ -0,0 +1,74 @@
+import re
+
+import pytest
+from fastapi.testclient import TestClient
+from langchain_core.messages import HumanMessage
+
+from agent import metrics
+from agent.app import app
+from agent.graph import graph
+from agent.metrics import REGISTRY, Registry
+
+STATE = {"messages": [HumanMessage(content="q")], "max_research_loops": 1, "initial_search_query_count": 2}
+
+
+def _sample(name, **labels):
+    """Current value of one sample in the exposition, 0 when it was never recorded."""
+    label_text = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    pattern = re.escape(f"{name}{{{label_text}}}" if labels else name) + r" (\S+)$"
+    match = re.search(pattern, REGISTRY.render(), re.MULTILINE)
+    return float(match.group(1)) if match else 0.0
+
+
+def test_exposition_format():
+    registry = Registry()
+    counter = registry.counter("jobs", "Jobs run.", ["status"])
+    histogram = registry.histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0))
+    counter.inc(status="ok")
+    counter.inc(2, status="ok")
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    assert registry.render() == (
+        "# HELP jobs Jobs run.\n"
+        "# TYPE jobs counter\n"
+        'jobs_total{status="ok"} 3\n'
+        "# HELP latency_seconds Latency.\n"
+        "# TYPE latency_seconds histogram\n"
+        'latency_seconds_bucket{le="0.1"} 1\n'
+        'latency_seconds_bucket{le="1.0"} 2\n'
+        'latency_seconds_bucket{le="+Inf"} 2\n'
+        "latency_seconds_sum 0.55\n"
+        "latency_seconds_count 2\n"
+    )
+
+
+def test_label_values_are_escaped():
+    registry = Registry()
+    counter = registry.counter("requests", "Requests.", ["model"])
+    counter.inc(model='a"b\\c\nd')
+    assert 'requests_total{model="a\\"b\\\\c\\nd"} 1' in registry.render()
+
+
+def test_node_metrics_are_recorded(backend, run_config):
+    before = {node: _sample("agent_node_duration_seconds_count", node=node) for node in ("generate_query", "web_research")}
+    graph.invoke(STATE, run_config())
+    assert _sample("agent_node_duration_seconds_count", node="generate_query") == before["generate_query"] + 1
+    # 两个搜索主题各执行一次web_research
+    assert _sample("agent_node_duration_seconds_count", node="web_research") == before["web_research"] + 2
+
+
+def test_node_errors_are_counted(backend, run_config):
+    backend.replies["reflection"] = RuntimeError("llm down")
+    errors = _sample("agent_node_errors_total", node="reflection")
+    with pytest.raises(AttributeError):
+        graph.invoke(STATE, run_config(llm_retry_max_attempts=1))
+    assert _sample("agent_node_errors_total", node="reflection") == errors + 1
+
+
+def test_metrics_route():
+    metrics.NODE_ERRORS.inc(node="route_test")
+    response = TestClient(app).get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert "# TYPE agent_node_duration_seconds histogram" in response.text
+    assert 'agent_node_errors_total{node="route_test"} 1' in response.text
@@ -0,0 +1,95 @@
+import pytest
+
+from agent.packing import bm25_scores, compact_json, estimate_tokens, pack_evidence, rank_results, terms
+
+
+def test_estimate_tokens_counts_cjk_per_character():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcd") == 1
+    assert estimate_tokens("abcde") == 2
+    assert estimate_tokens("中文") == 2
+    assert estimate_tokens("中文abcd") == 3
+
+
+def test_terms_splits_cjk_and_ignores_link_targets():
+    assert terms("Hello 世界 [src](https://a.com/x)") == ["hello", "世", "界", "src"]
+
+
+def test_compact_json_has_no_whitespace():
+    assert compact_json({"a": [1, "中"]}) == '{"a":[1,"中"]}'
+
+
+def test_bm25_scores_rank_matching_documents_higher():
+    scores = bm25_scores(["python asyncio tutorial", "gardening tips", "python packaging"], {"python": 1, "asyncio": 1})
+    assert scores[0] > scores[2] > scores[1] == 0
+    assert bm25_scores([], {"python": 1}) == []
+
+
+def _result(title, snippet):
+    return {"title": title, "snippet": snippet, "url": f"https://example.com/{title}"}
+
+
+RESULTS = [
+    _result("gardening", "how to grow tomatoes in pots"),
+    _result("asyncio", "python asyncio event loop tutorial"),
+    _result("packaging", "python packaging with pyproject"),
+]
+
+
+def test_rank_results_orders_by_relevance():
+    ranked = rank_results(RESULTS, "python asyncio")
+    assert [item["title"] for item in ranked] == ["asyncio", "packaging", "gardening"]
+
+
+def test_rank_results_topic_breaks_ties():
+    ranked = rank_results(RESULTS, "python", topic="pyproject")
+    assert ranked[0]["title"] == "packaging"
+
+
+def test_rank_results_top_k():
+    assert [item["title"] for item in rank_results(RESULTS, "python asyncio", top_k=1)] == ["asyncio"]
+
+
+def test_rank_results_token_budget_always_keeps_best():
+    # 预算不足一条结果时仍保留最相关的一条
+    assert [item["title"] for item in rank_results(RESULTS, "python asyncio", token_budget=1)] == ["asyncio"]
+    first_two = sum(estimate_tokens(compact_json(RESULTS[i])) for i in (1, 2))
+    ranked = rank_results(RESULTS, "python asyncio", token_budget=first_two)
+    assert [item["title"] for item in ranked] == ["asyncio", "packaging"]
+
+
+def test_pack_evidence_drops_contained_summaries():
+    # 较短的摘要几乎被较长的包含，应当作为重复丢弃
+    long = "solar panels convert sunlight into electricity using photovoltaic cells on rooftops"
+    short = "solar panels convert sunlight into electricity using photovoltaic cells"
+    other = "wind turbines generate power from moving air"
+    packed, report = pack_evidence([short, long, other], "solar power", token_budget=1000)
+    assert packed == [long, other]
+    assert report["dropped_duplicates"] == [0]
+    assert report["dropped_over_budget"] == []
+    assert report["kept"] == 2 and report["total"] == 3
+
+
+def test_pack_evidence_drops_empty_summaries():
+    packed, report = pack_evidence(["", "  ", "real content here"], "content", token_budget=1000)
+    assert packed == ["real content here"]
+    assert report["dropped_duplicates"] == [0, 1]
+
+
+def test_pack_evidence_prefers_relevant_summaries_and_keeps_order():
+    relevant = "battery storage capacity for solar farms " * 5
+    unrelated = "the history of medieval castles in europe " * 5
+    also_relevant = "solar farms need battery storage at night " * 5
+    budget = estimate_tokens(relevant) + estimate_tokens(also_relevant)
+    packed, report = pack_evidence([relevant, unrelated, also_relevant], "solar battery storage", token_budget=budget)
+    # 超出预算时先丢弃与主题无关的摘要，保留的摘要维持原有顺序
+    assert packed == [relevant, also_relevant]
+    assert report["dropped_over_budget"] == [1]
+    assert report["tokens"] == budget <= report["token_budget"]
+
+
+@pytest.mark.parametrize("budget", [0, 1])
+def test_pack_evidence_tiny_budget(budget):
+    packed, report = pack_evidence(["some evidence text"], "evidence", token_budget=budget)
+    assert packed == []
+    assert report["dropped_over_budget"] == [0]
@@ -0,0 +1,70 @@
+import json
+
+import pytest
+
+from agent.post import JSONStreamParser, Post
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ('{"a": 1}', {"a": 1}),
+        ('```json\n{"a": [1, 2]}\n```', {"a": [1, 2]}),
+        ('Here you go: {"a": 1} hope it helps {', {"a": 1}),
+        ('{"a": [1, 2,], "b": 3,}', {"a": [1, 2], "b": 3}),
+        ('{"a": True, "b": None, "c": False}', {"a": True, "b": None, "c": False}),
+        ('{\n  // comment\n  "a": 1, /* block */ "b": 2\n}', {"a": 1, "b": 2}),
+        ('{"a": "line one\nline two"}', {"a": "line one\nline two"}),
+        ('{"a": "https://example.com/x // not a comment"}', {"a": "https://example.com/x // not a comment"}),
+    ],
+)
+def test_load_json_repairs_near_valid_output(text, expected):
+    assert Post.load_json(text) == expected
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ('{"queries": ["a", "b"', {"queries": ["a", "b"]}),
+        ('{"summary": "truncated', {"summary": "truncated"}),
+        ('{"summary": "ends with escape\\', {"summary": "ends with escape"}),
+        ('{"a": {"b": 1}, "c":', {"a": {"b": 1}, "c": None}),
+        ('[{"a": 1}, ', [{"a": 1}]),
+    ],
+)
+def test_repair_json_closes_truncated_output(text, expected):
+    assert json.loads(Post.repair_json(text), strict=False) == expected
+
+
+def test_repair_json_without_json_value():
+    with pytest.raises(ValueError):
+        Post.repair_json("no json here")
+
+
+def test_non_ascii_bare_words_fail_as_json_errors():
+    # 字符串外的中文不能让修复本身崩溃，解析失败时抛出JSONDecodeError
+    with pytest.raises(json.JSONDecodeError):
+        Post.load_json('{"a": 1, 中文}')
+    assert Post.repair_json('{"a": 中文}') == '{"a": 中文}'
+
+
+def test_stream_parser_completes_on_closing_bracket():
+    parser = JSONStreamParser()
+    chunks = ["```json\n", '{"a": "}', ' {not the end"', ', "b": [1, {"c": 2}', "]}", "\n```\ntrailing"]
+    completed = [parser.feed(chunk) for chunk in chunks]
+    assert completed == [False, False, False, False, True, True]
+    assert json.loads(parser.text) == {"a": "} {not the end", "b": [1, {"c": 2}]}
+
+
+def test_stream_parser_handles_escaped_quotes():
+    parser = JSONStreamParser()
+    assert not parser.feed('{"a": "say \\"}\\" ')
+    assert parser.feed('please"}extra')
+    assert json.loads(parser.text) == {"a": 'say "}" please'}
+
+
+def test_stream_parser_incomplete_stream():
+    parser = JSONStreamParser()
+    parser.feed('prefix {"a": [1, 2')
+    assert not parser.complete
+    assert Post.load_json(parser.text) == {"a": [1, 2]}
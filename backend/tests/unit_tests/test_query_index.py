@@ -0,0 +1,67 @@
+import pytest
+
+from agent.query_index import QueryIndex, load_embedder, normalize_query
+
+
+def test_normalize_query():
+    assert normalize_query("  What's  NEW in Python 3.12? ") == "what s new in python 3 12"
+
+
+def test_exact_match_after_normalization():
+    index = QueryIndex(["Python 3.12 release notes"])
+    assert index.match("python 3.12 release notes?") == ("Python 3.12 release notes", 1.0)
+
+
+@pytest.mark.parametrize(
+    "threshold, covered",
+    [(0.5, True), (0.95, False)],
+)
+def test_threshold(threshold, covered):
+    index = QueryIndex(["python 3.12 release notes"], threshold=threshold)
+    covered_by, score = index.match("python 3.12 release highlights")
+    assert 0.5 <= score < 0.95
+    assert (covered_by is not None) == covered
+
+
+def test_unrelated_query_is_not_covered():
+    covered_by, score = QueryIndex(["python 3.12 release notes"]).match("best hiking trails in norway")
+    assert covered_by is None
+    assert score < 0.2
+
+
+def test_filter_adds_kept_queries():
+    # 同一批次中的近似查询也应被去重
+    index = QueryIndex(["solar panel efficiency"])
+    kept, dropped = index.filter(["Solar panel efficiency!", "wind turbine cost", "wind turbine costs"])
+    assert kept == ["wind turbine cost"]
+    assert [(query, covered_by) for query, covered_by, _ in dropped] == [
+        ("Solar panel efficiency!", "solar panel efficiency"),
+        ("wind turbine costs", "wind turbine cost"),
+    ]
+
+
+def _embedder(calls):
+    vectors = {"cheap flights to tokyo": [1.0, 0.0], "low cost airfare japan": [0.99, 0.1], "tokyo weather": [0.0, 1.0]}
+
+    def embed(queries):
+        calls.append(list(queries))
+        return [vectors[query] for query in queries]
+
+    return embed
+
+
+def test_embedding_threshold():
+    calls = []
+    index = QueryIndex(["cheap flights to tokyo"], embedder=_embedder(calls), embedding_threshold=0.9)
+    covered_by, score = index.match("low cost airfare japan")
+    assert covered_by == "cheap flights to tokyo"
+    assert score > 0.9
+    assert index.match("tokyo weather")[0] is None
+    # 已计算的向量不再重复请求
+    assert calls == [["cheap flights to tokyo", "low cost airfare japan"], ["tokyo weather"]]
+
+
+def test_load_embedder():
+    assert load_embedder("agent.query_index:normalize_query") is normalize_query
+    with pytest.raises(ValueError):
+        load_embedder("agent.query_index")
@@ -0,0 +1,108 @@
+import threading
+import time
+
+import pytest
+
+from agent.ratelimit import AdaptiveLimiter, get_limiter
+from agent.retry import AppCallError
+
+
+class Throttled(Exception):
+    pass
+
+
+def throttle(limiter, retry_after=0.0):
+    """Run one call through the limiter that comes back with a 429."""
+    with pytest.raises(AppCallError):
+        with limiter.slot():
+            raise AppCallError(429, "Throttling", retry_after=retry_after)
+
+
+def test_throttling_halves_rate_and_concurrency():
+    limiter = AdaptiveLimiter("test-halve", qps=100.0, burst=100, max_in_flight=8)
+    throttle(limiter)
+    assert limiter.rate == 50.0
+    assert limiter.concurrency == 4.0
+    assert limiter.throttled == 1
+    assert limiter.in_flight == 0
+
+
+def test_concurrent_throttles_decrease_once_per_cooldown():
+    limiter = AdaptiveLimiter("test-once", qps=100.0, burst=100, max_in_flight=8)
+    limiter.acquire()
+    limiter.acquire()
+    # 两个并发请求同时收到429，暂停期间只降一次速
+    limiter.release(AppCallError(429, "Throttling", retry_after=5.0))
+    limiter.release(AppCallError(429, "Throttling", retry_after=5.0))
+    assert limiter.rate == 50.0
+    assert limiter.concurrency == 4.0
+    assert limiter.throttled == 2
+
+
+def test_rate_has_a_floor():
+    limiter = AdaptiveLimiter("test-floor", qps=100.0, burst=100, max_in_flight=8)
+    for _ in range(10):
+        throttle(limiter)
+    assert limiter.rate == pytest.approx(5.0)
+    assert limiter.concurrency == 1.0
+
+
+def test_successes_grow_back_to_the_ceiling():
+    limiter = AdaptiveLimiter("test-grow", qps=1000.0, burst=1000, max_in_flight=8)
+    throttle(limiter)
+    with limiter.slot():
+        pass
+    # 加性增长：每次成功增加max_rate/20
+    assert limiter.rate == pytest.approx(550.0)
+    for _ in range(100):
+        with limiter.slot():
+            pass
+    assert limiter.rate == 1000.0
+    assert limiter.concurrency == 8.0
+
+
+def test_other_errors_do_not_adapt():
+    limiter = AdaptiveLimiter("test-other", qps=100.0, burst=100, max_in_flight=8)
+    with pytest.raises(Throttled):
+        with limiter.slot():
+            raise Throttled()
+    assert limiter.rate == 100.0
+    assert limiter.throttled == 0
+    assert limiter.in_flight == 0
+
+
+def test_retry_after_pauses_the_limiter():
+    limiter = AdaptiveLimiter("test-pause", qps=100.0, burst=100, max_in_flight=8)
+    throttle(limiter, retry_after=0.2)
+    started = time.monotonic()
+    with limiter.slot():
+        pass
+    assert time.monotonic() - started >= 0.2
+
+
+def test_in_flight_cap():
+    limiter = AdaptiveLimiter("test-cap", qps=1000.0, burst=1000, max_in_flight=2)
+    peak, active, lock = [0], [0], threading.Lock()
+
+    def call():
+        with limiter.slot():
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+
+    threads = [threading.Thread(target=call) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak[0] == 2
+
+
+def test_get_limiter_is_shared_and_reconfigured():
+    limiter = get_limiter("test-shared", qps=10.0, burst=5, max_in_flight=4)
+    assert get_limiter("test-shared", qps=5.0, burst=5, max_in_flight=2) is limiter
+    assert limiter.rate == 5.0
+    assert limiter.concurrency == 2.0
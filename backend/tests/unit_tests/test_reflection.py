@@ -0,0 +1,83 @@
+import json
+import re
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from agent.graph import graph
+
+STATE = {"messages": [HumanMessage(content="alpha")], "max_research_loops": 2, "initial_search_query_count": 2}
+SUMMARIES = {
+    "alpha one": "alpha evidence " * 25,
+    "beta two": "beta evidence " * 27,
+    "gamma three": "gamma evidence",
+}
+
+
+def _summary(prompt, request):
+    query = re.search(r"# 搜索主题\n(.*)\n", prompt).group(1)
+    return f"```text\n{SUMMARIES[query]}\n```"
+
+
+def _reflections(digests):
+    replies = iter(
+        [
+            {"is_sufficient": False, "knowledge_gap": "gap", "follow_up_queries": ["gamma three"], "knowledge_digest": digests[0]},
+            {"is_sufficient": True, "knowledge_gap": "", "follow_up_queries": [], "knowledge_digest": digests[1]},
+        ]
+    )
+    return lambda prompt, request: json.dumps(next(replies))
+
+
+@pytest.fixture
+def research(backend, run_config):
+    backend.replies["query"] = json.dumps({"rationale": "r", "query": ["alpha one", "beta two"]})
+    backend.replies["summary"] = _summary
+
+    def run(digests=("digest-1", "digest-2"), **configurable):
+        backend.replies["reflection"] = _reflections(digests)
+        config = run_config(model_evidence_token_budgets={}, **configurable)
+        result = graph.invoke(STATE, config)
+        return result, backend.prompts("reflection")
+
+    return run
+
+
+def _sections(prompt):
+    digest, summaries = prompt.split("# Knowledge Digest:")[1].split("# New Summaries:")
+    return digest, summaries
+
+
+def test_incremental_reflection_only_sends_new_results(research):
+    result, (first, second) = research(incremental_reflection=True, evidence_token_budget=100000)
+    assert "alpha evidence" in _sections(first)[1] and "beta evidence" in _sections(first)[1]
+    digest, summaries = _sections(second)
+    # 第二轮只发送新增的摘要以及上一轮的知识摘要
+    assert "digest-1" in digest
+    assert "gamma evidence" in summaries
+    assert "alpha evidence" not in summaries and "beta evidence" not in summaries
+    assert result["reflected_count"] == 3
+    assert result["knowledge_digest"] == "digest-2"
+
+
+def test_empty_digest_keeps_the_previous_one(research):
+    result, _ = research(digests=("digest-1", ""), incremental_reflection=True, evidence_token_budget=100000)
+    assert result["knowledge_digest"] == "digest-1"
+
+
+def test_summaries_over_budget_are_carried_to_the_next_loop(research):
+    result, (first, second) = research(incremental_reflection=True, evidence_token_budget=120)
+    # 预算只够一条长摘要，与主题更相关的alpha先进入知识摘要
+    assert "alpha evidence" in first and "beta evidence" not in first
+    summaries = _sections(second)[1]
+    assert "beta evidence" in summaries and "gamma evidence" in summaries
+    assert "alpha evidence" not in summaries
+    assert result["reflection_backlog"] == []
+
+
+def test_full_reflection_sends_every_result(research):
+    result, (first, second) = research(incremental_reflection=False, evidence_token_budget=100000)
+    assert "Knowledge Digest" not in second
+    for text in ("alpha evidence", "beta evidence", "gamma evidence"):
+        assert text in second
+    assert "reflected_count" not in result
@@ -0,0 +1,197 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import openai
+import pytest
+from langchain_core.messages import HumanMessage
+
+from agent.graph import graph
+from agent.retry import (
+    FATAL,
+    RATE_LIMITED,
+    RETRYABLE,
+    AppCallError,
+    Retrier,
+    RetryBudget,
+    RetryExhausted,
+    RetryPolicy,
+    RunRetryBudgets,
+    classify_error,
+)
+
+REQUEST = httpx.Request("POST", "http://llm.test/v1/chat/completions")
+
+
+def status_error(status_code, message="error", headers=None):
+    response = httpx.Response(status_code, headers=headers, request=REQUEST)
+    return openai.APIStatusError(message, response=response, body=None)
+
+
+# 不等待的重试策略，测试只关心重试的次数
+NO_WAIT = RetryPolicy(max_attempts=5, base_delay=0.0, max_delay=0.0)
+
+
+@pytest.mark.parametrize(
+    "exc, kind",
+    [
+        (status_error(429), RATE_LIMITED),
+        (status_error(500), RETRYABLE),
+        (status_error(503), RETRYABLE),
+        (status_error(400), FATAL),
+        (status_error(401), FATAL),
+        (openai.APIConnectionError(request=REQUEST), RETRYABLE),
+        (openai.APITimeoutError(request=REQUEST), RETRYABLE),
+        (AppCallError(429, "Throttling.RateQuota"), RATE_LIMITED),
+        (AppCallError(200, "Throttling"), RATE_LIMITED),
+        (AppCallError(None, message="Range of input length should be [1, 30720]"), FATAL),
+        (AppCallError(502), RETRYABLE),
+        (ValueError("invalid json"), RETRYABLE),
+    ],
+)
+def test_classify_error(exc, kind):
+    assert classify_error(exc)[0] == kind
+
+
+def test_classify_error_reads_retry_after():
+    assert classify_error(status_error(429, headers={"retry-after": "3"})) == (RATE_LIMITED, 3.0)
+    assert classify_error(status_error(429, headers={"retry-after": "soon"})) == (RATE_LIMITED, None)
+    assert classify_error(AppCallError(429, "Throttling", retry_after=2.5)) == (RATE_LIMITED, 2.5)
+
+
+def test_retry_after_raises_backoff_floor():
+    policy = RetryPolicy(base_delay=0.001, max_delay=0.001)
+    assert policy.backoff(1, retry_after=2.0) == 2.0
+    assert 0 <= policy.backoff(3) <= 0.001
+
+
+def flaky(failures, exc=None):
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise exc or status_error(503)
+        return "ok"
+
+    return fn, calls
+
+
+def test_retrier_recovers_after_transient_errors():
+    fn, calls = flaky(2)
+    retrier = Retrier(NO_WAIT)
+    assert retrier.call(fn) == "ok"
+    assert len(calls) == 3
+    assert retrier.stats.retries == 2
+    assert retrier.stats.by_kind == {RETRYABLE: 2}
+
+
+def test_retrier_does_not_retry_fatal_errors():
+    fn, calls = flaky(1, status_error(400))
+    with pytest.raises(RetryExhausted, match="fatal"):
+        Retrier(NO_WAIT).call(fn)
+    assert len(calls) == 1
+
+
+def test_retrier_gives_up_after_max_attempts():
+    fn, calls = flaky(10)
+    with pytest.raises(RetryExhausted, match="gave up after 5 attempts"):
+        Retrier(NO_WAIT).call(fn)
+    assert len(calls) == 5
+
+
+def test_retry_budget_is_shared_and_exhausted():
+    budget = RetryBudget(3)
+    first, second = Retrier(NO_WAIT, budget), Retrier(NO_WAIT, budget)
+    fn, _ = flaky(2)
+    assert first.call(fn) == "ok"
+    assert budget.used == 2 and budget.remaining == 1
+    fn, calls = flaky(10)
+    with pytest.raises(RetryExhausted, match="retry budget exhausted") as info:
+        second.call(fn)
+    # 预算只剩一次重试：第一次失败后重试一次，第二次失败后放弃
+    assert len(calls) == 2
+    assert isinstance(info.value.last_error, openai.APIStatusError)
+    assert budget.remaining == 0
+
+
+def test_retry_budget_spend_is_bounded():
+    budget = RetryBudget(2)
+    assert [budget.spend() for _ in range(4)] == [True, True, False, False]
+    assert budget.used == 2
+
+
+def test_retrier_deadline():
+    policy = RetryPolicy(max_attempts=10, base_delay=10.0, max_delay=10.0, deadline=0.0)
+    fn, calls = flaky(10, AppCallError(429, "Throttling", retry_after=5.0))
+    with pytest.raises(RetryExhausted, match="deadline"):
+        Retrier(policy).call(fn)
+    assert len(calls) == 1
+
+
+def test_async_retrier_budget():
+    budget = RetryBudget(1)
+    calls = []
+
+    async def afn():
+        calls.append(1)
+        raise openai.APIConnectionError(request=REQUEST)
+
+    with pytest.raises(RetryExhausted, match="retry budget exhausted"):
+        asyncio.run(Retrier(NO_WAIT, budget).acall(afn))
+    assert len(calls) == 2
+
+
+def test_child_budgets_draw_from_the_run_budget():
+    run = RetryBudget(5)
+    a, b = RetryBudget(5, parent=run), RetryBudget(5, parent=run)
+    assert all(a.spend() for _ in range(3))
+    assert b.remaining == 2
+    assert b.spend() and b.spend() and not b.spend()
+    assert not a.spend()
+    # 各自只统计自己的重试
+    assert (a.used, b.used, run.used) == (3, 2, 5)
+
+
+def test_parallel_branches_share_the_run_budget():
+    budgets = RunRetryBudgets()
+    barrier = threading.Barrier(8)
+    spent = []
+
+    def branch():
+        budget = RetryBudget(10, parent=budgets.get("run", 10))
+        barrier.wait()
+        while budget.spend():
+            spent.append(1)
+
+    threads = [threading.Thread(target=branch) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(spent) == 10
+    assert budgets.get("run", 10).remaining == 0
+    assert budgets.get("other", 10).remaining == 10
+
+
+def test_run_budget_starts_from_state_and_expires():
+    budgets = RunRetryBudgets(ttl=0.01)
+    assert budgets.get("run", 10, used=7).remaining == 3
+    # 已存在的预算不会被state中的旧计数覆盖
+    budgets.get("run", 10).spend()
+    assert budgets.get("run", 10, used=7).remaining == 2
+    time.sleep(0.02)
+    assert budgets.get("run", 10).remaining == 10
+
+
+@pytest.mark.parametrize("invoke", ["sync", "async"])
+def test_graph_branches_share_the_retry_budget(backend, run_config, invoke):
+    # 三个并行分支的摘要请求持续失败，整个运行最多重试retry_budget次
+    backend.replies["query"] = '{"rationale": "r", "query": ["topic a", "topic b", "topic c"]}'
+    backend.replies["summary"] = RuntimeError("summary model overloaded")
+    state = {"messages": [HumanMessage(content="q")], "max_research_loops": 1, "initial_search_query_count": 3}
+    config = run_config(retry_budget=4, llm_retry_max_attempts=10, llm_retry_base_delay=0.0)
+    result = graph.invoke(state, config) if invoke == "sync" else asyncio.run(graph.ainvoke(state, config))
+    assert len(backend.prompts("summary")) == 3 + 4
+    assert result["retry_count"] == 4
@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+
+from agent.llm import router
+from agent.llm.router import ModelRouter, RoutedLLM, model_health
+
+
+@pytest.fixture(autouse=True)
+def fresh_health(monkeypatch):
+    # 健康状态是进程级共享的，每个测试从空白状态开始
+    monkeypatch.setattr(router, "_health", {})
+
+
+class FakeLLM:
+    def __init__(self, model_id, error=None, chunks=("a", "b")):
+        self.model_id = model_id
+        self.error = error
+        self.chunks = chunks
+        self.timeouts = []
+
+    def generate_response(self, query, timeout=None):
+        self.timeouts.append(timeout)
+        if self.error:
+            raise self.error
+        return f"{self.model_id}: {query}"
+
+    async def agenerate_response(self, query, timeout=None):
+        return self.generate_response(query, timeout)
+
+    def stream_response(self, query, timeout=None):
+        self.timeouts.append(timeout)
+        if self.error:
+            raise self.error
+        yield from self.chunks
+
+    async def astream_response(self, query, timeout=None):
+        self.timeouts.append(timeout)
+        if self.error:
+            raise self.error
+        for chunk in self.chunks:
+            yield chunk
+
+
+def _routed(ladder, slo=None, errors=None):
+    llm = RoutedLLM(ModelRouter("test", ladder, slo=slo))
+    llm.llms = {m: FakeLLM(m, error=(errors or {}).get(m)) for m in ladder}
+    return llm
+
+
+def test_order_keeps_ladder_when_healthy():
+    assert ModelRouter("test", ["a", "b", "c"]).order("hi", "blocking") == ["a", "b", "c"]
+
+
+def test_order_skips_models_whose_context_window_is_too_small():
+    model = ModelRouter("test", ["small", "large"], context_windows={"small": 10, "large": 1000})
+    assert model.order("x" * 100, "blocking") == ["large"]
+    # 没有模型放得下时仍按原顺序尝试
+    assert model.order("x" * 10000, "blocking") == ["small", "large"]
+
+
+def test_order_demotes_models_with_errors():
+    for _ in range(10):
+        model_health("a", "blocking").record(error=True)
+    model = ModelRouter("test", ["a", "b"])
+    assert model.order("hi", "blocking") == ["b", "a"]
+    assert model.order("hi", "stream") == ["a", "b"]
+
+
+def test_slo_only_applies_to_streams():
+    for _ in range(10):
+        model_health("a", "stream").record(latency=5.0)
+        model_health("a", "blocking").record(latency=5.0)
+    model = ModelRouter("test", ["a", "b"], slo=1.0)
+    assert model.order("hi", "stream") == ["b", "a"]
+    assert model.order("hi", "blocking") == ["a", "b"]
+
+
+def test_generate_response_fails_over():
+    llm = _routed(["a", "b"], errors={"a": RuntimeError("down")})
+    assert llm.generate_response("q") == "b: q"
+    assert llm.served_model == "b"
+    assert model_health("a", "blocking")._errors[-1] is True
+    # 阻塞调用不受SLO限制
+    assert llm.llms["a"].timeouts == [None]
+
+
+def test_last_model_error_is_raised():
+    llm = _routed(["a", "b"], errors={"a": RuntimeError("a"), "b": ValueError("b")})
+    with pytest.raises(ValueError):
+        llm.generate_response("q")
+    with pytest.raises(ValueError):
+        asyncio.run(llm.agenerate_response("q"))
+
+
+def test_stream_gets_slo_timeout_except_last_model():
+    llm = _routed(["a", "b"], slo=2.0, errors={"a": TimeoutError()})
+    assert list(llm.stream_response("q")) == ["a", "b"]
+    assert llm.served_model == "b"
+    assert llm.llms["a"].timeouts == [2.0]
+    assert llm.llms["b"].timeouts == [None]
+
+
+def test_astream_fails_over():
+    llm = _routed(["a", "b"], slo=2.0, errors={"a": TimeoutError()})
+
+    async def collect():
+        return [chunk async for chunk in llm.astream_response("q")]
+
+    assert asyncio.run(collect()) == ["a", "b"]
+    assert llm.served_model == "b"
+
+
+def test_model_id_is_the_preferred_model():
+    # 缓存key始终使用首选模型
+    llm = _routed(["a", "b"], errors={"a": RuntimeError()})
+    llm.generate_response("q")
+    assert llm.model_id == "a"
+    assert llm.served_model == "b"
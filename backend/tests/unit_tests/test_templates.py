@@ -0,0 +1,59 @@
+import pytest
+
+from agent import prompts  # noqa: F401  导入时注册所有提示模板
+from agent.templates import TEMPLATES, PromptTemplate, TemplateError, TemplateRegistry, compile_template
+
+
+def test_compile_template_is_cached():
+    assert compile_template("Hello {name}") is compile_template("Hello {name}")
+    assert compile_template("Hello {name}").variables == {"name"}
+
+
+def test_strict_render_requires_every_variable():
+    template = compile_template("{greeting}, {name}!")
+    assert template.render({"greeting": "Hi", "name": "Ada", "extra": 1}) == "Hi, Ada!"
+    with pytest.raises(TemplateError, match="name"):
+        template.render({"greeting": "Hi"})
+
+
+def test_non_strict_render_keeps_missing_placeholders():
+    template = compile_template("{greeting}, {name}!")
+    assert template.render({"greeting": "Hi"}, strict=False) == "Hi, {name}!"
+
+
+def test_values_are_not_substituted_twice():
+    template = compile_template("Q: {query} D: {date}")
+    assert template.render({"query": "what is {date}?", "date": "today"}) == "Q: what is {date}? D: today"
+
+
+def test_non_identifier_braces_are_literal():
+    text = 'Return ```json\n{"rationale": "...", "query": ["..."]}\n``` for {topic} {0} {}'
+    template = compile_template(text)
+    assert template.variables == {"topic"}
+    assert template.render({"topic": "AI"}) == text.replace("{topic}", "AI")
+
+
+def test_static_prefix():
+    template = PromptTemplate.from_parts("You are a researcher.\n", "Topic: {topic}", "t")
+    assert template.static_prefix == "You are a researcher.\nTopic: "
+    with pytest.raises(TemplateError):
+        PromptTemplate.from_parts("Date {date}\n", "Topic: {topic}", "t")
+
+
+def test_registry_validates_declared_variables():
+    registry = TemplateRegistry()
+    registry.register("ok", "static\n", "{a} {b}", ["a", "b"])
+    assert "ok" in registry
+    with pytest.raises(TemplateError, match="重复"):
+        registry.register("ok", "static\n", "{a} {b}", ["a", "b"])
+    with pytest.raises(TemplateError):
+        registry.register("mismatch", "static\n", "{a}", ["a", "b"])
+
+
+def test_registered_prompts_keep_variables_out_of_the_prefix():
+    assert TEMPLATES.names()
+    for name in TEMPLATES.names():
+        template = TEMPLATES.get(name)
+        assert template.static_prefix, name
+        rendered = template.render({variable: f"<{variable}>" for variable in template.variables})
+        assert rendered.startswith(template.static_prefix), name
@@ -0,0 +1,57 @@
+import pytest
+
+from agent.utils import CitationRewriter, insert_citation_markers, short_url
+
+LONG_URL = "https://example.com/a/very/long/source"
+SHORT_URL = short_url(LONG_URL)
+
+
+def test_short_url_is_stable():
+    assert short_url(LONG_URL) == SHORT_URL
+    assert short_url(LONG_URL + "?x=1") != SHORT_URL
+
+
+def test_rewrite_in_one_piece():
+    rewriter = CitationRewriter({SHORT_URL: LONG_URL})
+    assert rewriter.rewrite(f"see [a]({SHORT_URL}).") == f"see [a]({LONG_URL})."
+    assert rewriter.used == {SHORT_URL}
+
+
+@pytest.mark.parametrize("split", range(1, len(f"[a]({SHORT_URL})")))
+def test_feed_marker_split_across_chunks(split):
+    # 引用标记在任意位置被切成两块，拼接后仍应完整替换
+    text = f"see [a]({SHORT_URL}) and more"
+    rewriter = CitationRewriter({SHORT_URL: LONG_URL})
+    head, tail = text[: 4 + split], text[4 + split :]
+    out = rewriter.feed(head) + rewriter.feed(tail) + rewriter.flush()
+    assert out == f"see [a]({LONG_URL}) and more"
+    assert rewriter.used == {SHORT_URL}
+
+
+def test_feed_one_character_at_a_time():
+    text = f"[a]({SHORT_URL})[b]({SHORT_URL})"
+    rewriter = CitationRewriter({SHORT_URL: LONG_URL})
+    out = "".join(rewriter.feed(char) for char in text) + rewriter.flush()
+    assert out == f"[a]({LONG_URL})[b]({LONG_URL})"
+
+
+def test_feed_holds_back_only_a_possible_short_url():
+    rewriter = CitationRewriter({SHORT_URL: LONG_URL})
+    assert rewriter.feed("plain text https://sea") == "plain text "
+    assert rewriter.feed("shells are nice") == "https://seashells are nice"
+    assert rewriter.flush() == ""
+
+
+def test_unknown_short_url_is_kept():
+    unknown = "https://search.com/id/1-2"
+    rewriter = CitationRewriter({SHORT_URL: LONG_URL})
+    assert rewriter.feed(f"[x]({unknown})") + rewriter.flush() == f"[x]({unknown})"
+    assert rewriter.used == set()
+
+
+def test_insert_citation_markers_uses_original_indices():
+    citations = [
+        {"start_index": 0, "end_index": 5, "segments": [{"label": "a", "short_url": "u1"}]},
+        {"start_index": 6, "end_index": 11, "segments": [{"label": "b", "short_url": "u2"}]},
+    ]
+    assert insert_citation_markers("Hello world", citations) == "Hello [a](u1) world [b](u2)"